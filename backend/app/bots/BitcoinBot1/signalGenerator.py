@@ -1,4 +1,5 @@
-import redis
+from app.utility.SignalBus import SignalBus
+from app.utility.signal_codec import Signal, BUY, SELL
 import logging
 import time
 import os
@@ -6,7 +7,7 @@ import sys, getopt
 from app.utility.environment import environment
 
 
-"""Example bot that sends trading signals to a redis queue to be processed by the signalProcessor
+"""Example bot that sends trading signals to a redis stream to be processed by the signalProcessor
     This seperation of signal generating and processing decouples the automated trading
     so that neither process can bogg down the other. Also the python GIL kinda prevents us
     from placing the logic of both in one file."""
@@ -16,41 +17,31 @@ from app.utility.environment import environment
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(os.path.basename(os.getcwd()))
 
-count = 0
+def bot_worker(bot_id: int, logger: logging.Logger):
+    """Main worker function that waits for a signal then pushes it to the bot's redis signal stream"""
 
-def bot_worker(bot_id: int):
-    """Main worker function that waits for a signal then pushes it to the bot's redis signal queue"""
+    signal_bus = SignalBus(bot_id)
 
-    redis_client = redis.StrictRedis(host=environment.REDIS_HOST, port=environment.REDIS_PORT, decode_responses=True)
-    
-    queue_name = f"bot{bot_id}_queue"
-
-    #remove any stale trades still on the queue - optional
-    redis_client.delete(queue_name)
-
-    logger.info(f"Bot {bot_id} started, pushing signals to {queue_name}")
+    logger.info(f"Bot {bot_id} started, pushing signals to {signal_bus.stream}")
 
     while True:
 
         try:
 
             signal = generate_signal()
-            redis_client.rpush(queue_name, signal)
+            signal_bus.publish(signal)
             logger.info(f"Bot {bot_id} pushed signal: {signal}")
             time.sleep(2)
 
         except Exception as e:
             logger.error(f"Error in bot {bot_id}: {e}")
 
-def generate_signal():
+def generate_signal() -> Signal:
     """Dummy function to generate signals, place signal generating logic here"""
 
     import random
-    action = random.choice(["BUY", "SELL"])
-    global count
-    count += 1
-    crypto = "BTC"
-    return f"{count}:{action}:{crypto}"
+    action = random.choice([BUY, SELL])
+    return Signal(product_id="BTC-USD", side=action)
 
 def get_bot_id(argv):
     # get bot id from command line
@@ -66,9 +57,8 @@ def get_bot_id(argv):
        sys.exit(2)
 
 def main(bot_id: int):
-    logger.name = f"bot {bot_id} generator"
-
-    bot_worker(bot_id)
+    #hosted bots share this module, each one logs under its own name
+    bot_worker(bot_id, logging.getLogger(f"bot {bot_id} generator"))
     
 
 
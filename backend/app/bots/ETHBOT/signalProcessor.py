@@ -1,10 +1,12 @@
 from app.utility.environment import environment
 from app.utility.TokenService import TokenService
+from app.utility.FanoutExecutor import get_fanout_executor
 from app.database.db_connection import context_get_session
 from app.database.models import Subscription
-import redis
+from app.utility.SubscriptionCache import get_subscription_cache
+from app.utility.SignalBus import SignalBus
+from app.utility.signal_codec import Signal
 import logging
-from sqlalchemy.future import select
 import os
 import sys, getopt
 from app.utility.environment import environment
@@ -15,59 +17,66 @@ logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(os.path.basename(os.getcwd()))
 
 
-def execute_trades(bot_id: int):
+def execute_trades(bot_id: int, logger: logging.Logger):
 
-    redis_client = redis.StrictRedis(host=environment.REDIS_HOST, port=environment.REDIS_PORT, decode_responses=True)
+    signal_bus = SignalBus(bot_id)
+    signal_bus.ensure_group()
 
-    queue_name = f"bot{bot_id}_queue"
+    consumer = SignalBus.consumer_name()
 
-    logger.info(f"Trade executor for bot {bot_id} started, reading signals from {queue_name}")
+    #warm the subscriber cache before the first signal arrives
+    get_subscription_cache(bot_id)
+
+    logger.info(f"Trade executor for bot {bot_id} started, reading signals from {signal_bus.stream} as {consumer}")
 
     while True:
 
         try:
 
-            signal = redis_client.blpop(queue_name, timeout=10)
+            entries = signal_bus.read(consumer, block_ms=10000)
+
+            if not entries:
+                logger.info(f"No signals in {signal_bus.stream}, waiting...")
+                continue
 
-            if signal:
-                _, trade_signal = signal  # Extract trade signal
+            for entry_id, trade_signal in entries:
 
                 logger.info(f"Signal {trade_signal} currently being processed")
 
-                process_trade_for_all(trade_signal, bot_id)
+                with signal_bus.holding(entry_id, consumer):
+                    process_trade_for_all(trade_signal, bot_id, signal_bus, entry_id, logger)
 
-            else:
-                logger.info(f"No signals in {queue_name}, waiting...")
+                #only ack once every subscriber was handled, otherwise the signal gets redelivered
+                signal_bus.ack(entry_id)
 
         except Exception as e:
 
             logger.error(f"Error in execute_trades for bot {bot_id}: {e}")
 
+def process_trade_for_all(signal: Signal, bot_id: int, signal_bus: SignalBus, entry_id: str, logger: logging.Logger):
 
-    
+    #get all users subscribed for this bot, served from memory
+    subscriptions = get_subscription_cache(bot_id).get()
 
-    pass
+    #skip subscribers already handled by an earlier delivery of this signal
+    subscriptions = signal_bus.remaining(entry_id, subscriptions)
 
-def process_trade_for_all(signal: str, bot_id: int):
-
-    #get all users subscribed for this bot
+    #get every subscriber's access key in one query
     with context_get_session() as db:
 
-        subscriptions = db.scalars(select(Subscription).where(Subscription.bot_id == bot_id)).all()
+        access_tokens = TokenService.get_access_tokens((subscription.user_id for subscription in subscriptions), exchange_name="coinbase", db=db)
 
-        for subscription in subscriptions:
+    #execute for every subscriber concurrently
+    result = get_fanout_executor().execute(signal.signal_id, subscriptions, lambda subscription: execute_trade_for_user(signal, subscription, access_tokens[subscription.user_id], signal_bus, entry_id, logger))
 
-            try:
-                #get this users access key
-                token_service = TokenService(user_id=subscription.user_id, db=db)
+    logger.info(f"Finished {result}")
 
-                access_token = token_service.get_access_token(exchange_name="coinbase")
+def execute_trade_for_user(signal: Signal, subscription: Subscription, access_token: str | None, signal_bus: SignalBus, entry_id: str, logger: logging.Logger):
 
-                #add logic to make coinbase trade via coinbase library client
-                logger.info(f"Executing trade {signal} for user {subscription.user_id}")
+    #add logic to make coinbase trade via coinbase library client
+    logger.info(f"Executing trade {signal} for user {subscription.user_id}")
 
-            except Exception as e:
-                logger.error(f"Unable to process {signal} for user {subscription.user_id}")
+    signal_bus.mark_done(entry_id, subscription)
 
 
 
@@ -85,9 +94,8 @@ def get_bot_id(argv):
        sys.exit(2)
 
 def main(bot_id: int):
-    logger.name = f"bot {bot_id} executor"
-
-    execute_trades(bot_id)
+    #hosted bots share this module, each one logs under its own name
+    execute_trades(bot_id, logging.getLogger(f"bot {bot_id} executor"))
 
     
 
@@ -0,0 +1,121 @@
+from app.utility.MarketData import MarketSnapshot
+from dataclasses import dataclass
+from typing import Iterable, Union
+import numpy as np
+import time
+
+
+"""Columnar candidate screening for the Profit_Model generator
+
+    Each snapshot column becomes one float64 array per snapshot. Every rule is then a vectorized
+    comparison over all products, so adding a rule costs one pass over an array, not another
+    Python loop. The quote currency mask only depends on the product list, so it is rebuilt only
+    when products are listed or delisted."""
+
+
+@dataclass(frozen=True, slots=True)
+class ScreenRules:
+    quote_currency: str = "USD"
+    min_change_24h: float = 0.10        # percent, as the api reports it
+    max_change_24h: float = np.inf      # skip assets that already ran too far
+    min_price: float = 0.0
+    min_volume_usd: float = 0.0         # 24h volume times price
+    top_k: int = 10                     # best ranked candidates kept, 0 for all
+    rank_by: str = "change_24h"         # a snapshot column, or "volume_usd"
+
+
+@dataclass(slots=True)
+class Candidate:
+    product_id: str
+    price: float
+    change_24h: float
+    volume_usd: float
+
+
+class ScreenTimings:
+    """Seconds spent screening, per cycle"""
+
+    def __init__(self):
+        self.cycles = 0
+        self.last = 0.0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds: float):
+        self.cycles += 1
+        self.last = seconds
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def __str__(self) -> str:
+        average = self.total / self.cycles if self.cycles else 0.0
+        return f"last {self.last * 1e6:.0f}us, avg {average * 1e6:.0f}us, max {self.max * 1e6:.0f}us over {self.cycles} cycles"
+
+
+class Screener:
+
+    def __init__(self, rules: ScreenRules):
+        self.rules = rules
+        self.timings = ScreenTimings()
+        self._ids: Union[list[str], None] = None
+        self._ids_len = 0
+        self._quote_mask = np.zeros(0, dtype=bool)
+        self._arrays_of: Union[tuple[int, str], None] = None
+        self._arrays: dict[str, np.ndarray] = {}
+
+    def screen(self, snapshot: MarketSnapshot, exclude: Iterable[str] = ()) -> list[Candidate]:
+        """Candidates that pass every rule and are not in exclude, best ranked first"""
+
+        start = time.perf_counter()
+        rules = self.rules
+
+        arrays = self.__arrays(snapshot)
+        price, change, volume_usd = arrays["price"], arrays["change_24h"], arrays["volume_usd"]
+
+        #comparisons with nan are False, so products missing a value never pass
+        mask = self.__quote_mask(snapshot) & (change > rules.min_change_24h) & (change <= rules.max_change_24h) & (price > rules.min_price)
+        if rules.min_volume_usd > 0:
+            mask &= volume_usd >= rules.min_volume_usd
+
+        for product_id in exclude:
+            row = snapshot.index.get(product_id)
+            if row is not None:
+                mask[row] = False
+
+        rows = np.flatnonzero(mask)
+
+        scores = arrays[rules.rank_by][rows]
+
+        #only the top k are sorted, the rest just get partitioned away
+        if 0 < rules.top_k < len(rows):
+            best = np.argpartition(-scores, rules.top_k - 1)[:rules.top_k]
+            rows, scores = rows[best], scores[best]
+
+        rows = rows[np.argsort(-scores, kind="stable")]
+
+        candidates = [Candidate(snapshot.product_ids[row], float(price[row]), float(change[row]), float(volume_usd[row])) for row in rows.tolist()]
+
+        self.timings.record(time.perf_counter() - start)
+        return candidates
+
+    def __arrays(self, snapshot: MarketSnapshot) -> dict[str, np.ndarray]:
+        #converted once per snapshot, screening again with an exclude list reuses them
+        key = (id(snapshot), snapshot.id)
+
+        if key != self._arrays_of:
+            count = len(snapshot)
+            self._arrays = {column: np.fromiter(values, dtype=np.float64, count=count) for column, values in snapshot.columns.items()}
+            self._arrays["volume_usd"] = self._arrays["volume_24h"] * self._arrays["price"]
+            self._arrays_of = key
+
+        return self._arrays
+
+    def __quote_mask(self, snapshot: MarketSnapshot) -> np.ndarray:
+        #apply() appends new products to the same list and replaces it when products are removed
+        if snapshot.product_ids is not self._ids or len(snapshot.product_ids) != self._ids_len:
+            suffix = f"-{self.rules.quote_currency}"
+            self._quote_mask = np.fromiter((product_id.endswith(suffix) for product_id in snapshot.product_ids), dtype=bool, count=len(snapshot.product_ids))
+            self._ids = snapshot.product_ids
+            self._ids_len = len(snapshot.product_ids)
+
+        return self._quote_mask
@@ -1,11 +1,14 @@
 import os
 import time
-import json
 import logging
-import redis
 import requests
 from dotenv import load_dotenv, find_dotenv
 from app.utility.environment import environment
+from app.utility.SignalBus import SignalBus
+from app.utility.signal_codec import Signal, BUY
+from app.utility.CoinbaseClient import CoinbaseClient
+from app.utility.MarketData import MarketData
+from app.bots.Profit_Model.screener import Screener, ScreenRules
 
 # Locate and load the project’s .env
 dotenv_path = find_dotenv()
@@ -16,90 +19,74 @@ load_dotenv(dotenv_path)
 # Configuration
 DEFAULT_PROFIT_TARGET   = 0.25    # 25% profit if not overridden
 MIN_PRICE_CHANGE_24_HRS = 0.10    # 10% 24h gain threshold
-BASE_URL                = "api.coinbase.com"
-
-class CoinbaseClient:
-    def __init__(self, access_token: str):
-        self.token = access_token
-
-    def _request(self, method: str, path: str, payload: dict | None = None) -> dict:
-        import http.client
-        conn = http.client.HTTPSConnection(BASE_URL)
-        headers = {
-            "Authorization": f"Bearer {self.token}",
-            "Content-Type": "application/json"
-        }
-        body = json.dumps(payload) if payload else None
-        conn.request(method, path, body, headers)
-        resp = conn.getresponse()
-        data = resp.read()
-        if resp.status >= 400:
-            raise RuntimeError(f"{resp.status} on {path}: {data.decode()}")
-        return json.loads(data)
-
-    def get_products(self) -> list[dict]:
-        return self._request("GET", "/api/v3/brokerage/products").get("products", [])
-
-    def list_open_sell_orders(self) -> set[str]:
-        orders = self._request("GET", "/api/v3/brokerage/orders?side=SELL&status=OPEN")
-        return {o["product_id"] for o in orders.get("orders", [])}
+MIN_VOLUME_USD          = 0.0     # 24h volume in USD, 0 to allow any
+MAX_CANDIDATES          = 10      # strongest gainers signalled per snapshot
+SCREEN_BUDGET           = 0.001   # seconds screening may take before we warn
 
 def main(bot_id: int):
     logging.basicConfig(level=logging.INFO)
     logger = logging.getLogger(f"ProfitModel-generator-{bot_id}")
 
-    # Redis client from centralized environment
-    r = redis.StrictRedis(
-        host=environment.REDIS_HOST,
-        port=environment.REDIS_PORT,
-        decode_responses=True
-    )
-    queue = f"bot{bot_id}_queue"
-    r.delete(queue)
+    # Signals go onto the bot's redis stream
+    bus = SignalBus(bot_id)
 
-    logger.info(f"[Gen:{bot_id}] Starting up, pushing to {queue}")
+    logger.info(f"[Gen:{bot_id}] Starting up, pushing to {bus.stream}")
 
     # Load profit target override if present
     profit_target = float(os.getenv("TARGET_PROFIT", DEFAULT_PROFIT_TARGET))
 
     client = CoinbaseClient(os.getenv("ACCESS_TOKEN"))
 
+    # Tickers come from the market data service, shared with every other generator
+    market = MarketData()
+
+    screener = Screener(ScreenRules(
+        min_change_24h = MIN_PRICE_CHANGE_24_HRS,
+        min_volume_usd = float(os.getenv("MIN_VOLUME_USD", MIN_VOLUME_USD)),
+        top_k          = int(os.getenv("MAX_CANDIDATES", MAX_CANDIDATES))
+    ))
+
     while True:
         try:
-            # 1) Exclude any assets already on open SELL orders
-            selling = client.list_open_sell_orders()
-
-            # 2) Fetch all spot products and filter candidates
-            candidates = [
-                p for p in client.get_products()
-                if p["product_id"].endswith("USD")
-                   and float(p["price_percentage_change_24h"]) > MIN_PRICE_CHANGE_24_HRS
-                   and p["product_id"] not in selling
-            ]
+            # 1) Wait for the next market snapshot
+            snapshot = market.wait_for_update(block_ms=10000)
+            if snapshot is None:
+                continue
+
+            if snapshot.age() > 3 * environment.MARKET_DATA_INTERVAL:
+                logger.warning(f"[Gen] Market snapshot is {snapshot.age():.0f}s old, is the market data publisher running?")
+
+            # 2) Screen the snapshot's columns for candidates
+            candidates = screener.screen(snapshot)
             if not candidates:
-                logger.info("[Gen] No buy candidates—sleeping")
-                time.sleep(10)
+                logger.info("[Gen] No buy candidates—waiting for the next snapshot")
                 continue
 
-            # 3) Determine per-asset allocation
+            # 3) Exclude any assets already on open SELL orders, only asked when there is something to buy
+            selling = {o["product_id"] for o in client.list_open_orders(side="SELL")}
+            candidates = screener.screen(snapshot, exclude=selling)
+            logger.debug(f"[Gen] Screened {len(snapshot)} products to {len(candidates)} candidates, {screener.timings}")
+
+            if screener.timings.last > SCREEN_BUDGET:
+                logger.warning(f"[Gen] Screening took {screener.timings.last * 1000:.2f}ms for {len(snapshot)} products")
+
+            # 4) Determine per-asset allocation
             #    (for brevity, assume a fixed $100 per trade)
             allocation = 100.0
 
-            # 4) Push a BUY signal + limit SELL signal for each candidate
+            # 5) Push a BUY signal + limit SELL signal for each candidate
             for p in candidates:
-                pid   = p["product_id"]
-                price = float(p["price"])
-                signal = {
-                    "action":      "BUY",
-                    "product_id":  pid,
-                    "quote_size":  round(allocation, 2),
-                    "limit_price": round(price * (1 + profit_target), 4)
-                }
-                r.rpush(queue, json.dumps(signal))
+                pid   = p.product_id
+                price = p.price
+                signal = Signal(
+                    product_id  = pid,
+                    side        = BUY,
+                    quote_size  = round(allocation, 2),
+                    limit_price = round(price * (1 + profit_target), 4)
+                )
+                bus.publish(signal)
                 logger.info(f"[Gen] Pushed signal {signal}")
 
-            time.sleep(5)
-
         except Exception as e:
             logger.error(f"[Gen] Error: {e}")
             time.sleep(10)
@@ -1,15 +1,18 @@
 import os
-import json
 import time
+import uuid
 import logging
-import redis
 from dotenv import load_dotenv, find_dotenv
-from sqlalchemy.future import select
 
 from app.utility.environment import environment
 from app.utility.TokenService     import TokenService
+from app.utility.SignalBus        import SignalBus
+from app.utility.signal_codec     import Signal, BUY
+from app.utility.FanoutExecutor   import get_fanout_executor
 from app.database.db_connection   import context_get_session
 from app.database.models          import Subscription
+from app.utility.SubscriptionCache import get_subscription_cache
+from app.utility.CoinbaseClient   import CoinbaseClient, client_stats, order_id as placed_order_id, order_error
 
 # Locate and load .env
 dotenv_path = find_dotenv()
@@ -21,98 +24,71 @@ load_dotenv(dotenv_path)
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("ProfitModel-processor")
 
-# Redis config
-REDIS_HOST = environment.REDIS_HOST
-REDIS_PORT = environment.REDIS_PORT
-
-class CoinbaseClient:
-    def __init__(self, access_token: str):
-        self.token = access_token
-
-    def market_buy(self, product_id: str, quote_size: float) -> dict:
-        import http.client, uuid
-        conn = http.client.HTTPSConnection("api.coinbase.com")
-        payload = {
-            "client_order_id": str(uuid.uuid4()),
-            "product_id":      product_id,
-            "side":            "BUY",
-            "order_configuration": {"market_market_ioc": {"quote_size": f"{quote_size:.2f}"}}
-        }
-        headers = {
-            "Authorization": f"Bearer {self.token}",
-            "Content-Type": "application/json"
-        }
-        conn.request("POST", "/api/v3/brokerage/orders", json.dumps(payload), headers)
-        resp = conn.getresponse()
-        return json.loads(resp.read())
-
-    def limit_sell(self, product_id: str, base_size: float, limit_price: float) -> dict:
-        import http.client, uuid
-        conn = http.client.HTTPSConnection("api.coinbase.com")
-        payload = {
-            "client_order_id": str(uuid.uuid4()),
-            "product_id":      product_id,
-            "side":            "SELL",
-            "order_configuration": {
-                "limit_limit_gtc": {
-                    "base_size":   f"{base_size:.4f}",
-                    "limit_price": f"{limit_price:.4f}"
-                }
-            }
-        }
-        headers = {
-            "Authorization": f"Bearer {self.token}",
-            "Content-Type": "application/json"
-        }
-        conn.request("POST", "/api/v3/brokerage/orders", json.dumps(payload), headers)
-        resp = conn.getresponse()
-        return json.loads(resp.read())
-
 def main(bot_id: int):
-    r = redis.StrictRedis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True)
-    queue = f"bot{bot_id}_queue"
-    logger.info(f"[Proc:{bot_id}] Listening on {queue}")
+    bus = SignalBus(bot_id)
+    bus.ensure_group()
+    consumer = SignalBus.consumer_name()
+    get_subscription_cache(bot_id)  # warm up before the first signal
+    logger.info(f"[Proc:{bot_id}] Listening on {bus.stream} as {consumer}")
 
     while True:
         try:
-            item = r.blpop(queue, timeout=10)
-            if not item:
-                continue
+            entries = bus.read(consumer, block_ms=10000)
+
+            for entry_id, sig in entries:
+                logger.info(f"[Proc:{bot_id}] Got signal {entry_id} {sig}")
 
-            _, raw = item
-            sig = json.loads(raw)
-            logger.info(f"[Proc:{bot_id}] Got signal {sig}")
+                with bus.holding(entry_id, consumer):
+                    _execute_for_all(bot_id, sig, bus, entry_id)
 
-            _execute_for_all(bot_id, sig)
+                # Ack only after every subscriber was handled
+                bus.ack(entry_id)
 
         except Exception as e:
             logger.error(f"[Proc] Loop error: {e}")
             time.sleep(5)
 
 
-def _execute_for_all(bot_id: int, sig: dict):
+def _execute_for_all(bot_id: int, sig: Signal, bus: SignalBus, entry_id: str):
+    # Subscribers come from the in memory cache, the db is only read on a miss
+    subs = get_subscription_cache(bot_id).get()
+
+    # Subscribers finished by an earlier delivery of this signal are skipped
+    subs = bus.remaining(entry_id, subs)
+
+    # One query for every subscriber's token
     with context_get_session() as db:
-        subs = db.scalars(
-            select(Subscription).where(Subscription.bot_id == bot_id)
-        ).all()
-
-        for sub in subs:
-            try:
-                # Fetch user token
-                token_svc = TokenService(user_id=sub.user_id, db=db)
-                user_tok  = token_svc.get_access_token(exchange_name="coinbase")
-                client    = CoinbaseClient(user_tok)
-
-                # Execute the appropriate order
-                if sig["action"] == "BUY":
-                    resp = client.market_buy(sig["product_id"], sig["quote_size"])
-                else:
-                    resp = client.limit_sell(
-                        sig["product_id"],
-                        sig.get("quote_size", 0.0),
-                        sig["limit_price"]
-                    )
-                logger.info(f"[Proc] Executed {sig['action']} for user {sub.user_id}: {resp}")
-
-            except Exception as e:
-                logger.error(f"[Proc] Failed {sig['action']} for user {sub.user_id}: {e}")
+        tokens = TokenService.get_access_tokens((sub.user_id for sub in subs), exchange_name="coinbase", db=db)
+
+    result = get_fanout_executor().execute(
+        entry_id, subs, lambda sub: _execute_for_user(sub, tokens[sub.user_id], sig, bus, entry_id)
+    )
+    logger.info(f"[Proc] Finished {result}")
+    logger.debug(f"[Proc] Coinbase latency {client_stats.snapshot()}")
+
+
+def _execute_for_user(sub: Subscription, user_tok: str | None, sig: Signal, bus: SignalBus, entry_id: str):
+    client = CoinbaseClient(user_tok)
+
+    # Same order id on every delivery, so Coinbase rejects a duplicate if we crashed after placing it
+    order_id = str(uuid.uuid5(uuid.NAMESPACE_URL, f"{bus.stream}/{entry_id}/{sub.id}"))
+
+    # Execute the appropriate order
+    if sig.side == BUY:
+        resp = client.market_buy(sig.product_id, sig.quote_size, order_id)
+    else:
+        resp = client.limit_sell(
+            sig.product_id,
+            sig.base_size or 0.0,
+            sig.limit_price,
+            order_id
+        )
+    bus.mark_done(entry_id, sub)
+
+    placed = placed_order_id(resp)
+    if placed is None:
+        logger.warning(f"[Proc] Coinbase refused {sig.side} for user {sub.user_id}: {order_error(resp)}")
+        return False, order_error(resp)
+
+    logger.info(f"[Proc] Executed {sig.side} for user {sub.user_id}: order {placed}")
+    return True, f"order {placed}"
@@ -0,0 +1,179 @@
+from app.utility.environment import environment
+from app.utility.SignalBus import SignalBus
+from app.utility.signal_codec import Signal, BUY
+from app.utility.CoinbaseClient import CoinbaseClient
+from app.utility.indicators import FeatureEngine, FEATURES
+from app.utility.redis_helper import get_redis_client
+from concurrent.futures import ThreadPoolExecutor
+from typing import Union
+import pandas as pd
+import logging
+import joblib
+import time
+import os
+
+
+"""
+SolModel scores symbols with the RandomForest trained by dan_model/train_model.py.
+The model and scaler are loaded once. Every hour, when a candle closes, the new candle of every
+symbol is folded into its streaming indicators and all symbols are scored with one predict call.
+Symbols whose predicted 7 day return is above SOL_MODEL_THRESHOLD get a BUY signal. Load time and
+inference latency are logged and kept in Redis under bot{bot_id}:metrics.
+"""
+
+# Logging per bot
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("SolModel-generator")
+
+DAN_MODEL_DIRECTORY = os.path.normpath(os.path.join(os.path.dirname(__file__), "..", "..", "..", "dan_model"))
+
+CANDLE_SECONDS = 3600
+WARM_UP_CANDLES = 300   # enough for every indicator to settle, and below the 350 candles one call returns
+
+
+class InferenceStats:
+    """Latency of the model for every candle close"""
+
+    def __init__(self, load_seconds: float):
+        self.load_seconds = load_seconds
+        self.batches = 0
+        self.last = 0.0
+        self.total = 0.0
+        self.max = 0.0
+        self.batch_size = 0
+        self.candle_lag = 0.0
+
+    def record(self, seconds: float, batch_size: int, candle_lag: float):
+        self.batches += 1
+        self.last = seconds
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.batch_size = batch_size
+        self.candle_lag = candle_lag
+
+    def as_dict(self) -> dict:
+        return {
+            "model_load_ms": round(self.load_seconds * 1000, 1),
+            "batches": self.batches,
+            "batch_size": self.batch_size,
+            "inference_last_ms": round(self.last * 1000, 2),
+            "inference_avg_ms": round(self.total / self.batches * 1000, 2) if self.batches else 0.0,
+            "inference_max_ms": round(self.max * 1000, 2),
+            #seconds from the candle closing to its signals being published
+            "candle_lag_s": round(self.candle_lag, 2)
+        }
+
+
+def load_model():
+    """The model and scaler, from SOL_MODEL_PATH / SOL_SCALER_PATH or dan_model"""
+
+    model_path = environment.SOL_MODEL_PATH or os.path.join(DAN_MODEL_DIRECTORY, "sol_model.pkl")
+    scaler_path = environment.SOL_SCALER_PATH or os.path.join(DAN_MODEL_DIRECTORY, "scaler.pkl")
+
+    start = time.perf_counter()
+    model = joblib.load(model_path)
+    scaler = joblib.load(scaler_path)
+    load_seconds = time.perf_counter() - start
+
+    logger.info(f"Loaded {type(model).__name__} from {model_path} in {load_seconds:.2f}s")
+    return model, scaler, load_seconds
+
+
+def closed_candles(client: CoinbaseClient, symbol: str, after: int, now: float) -> list[dict]:
+    """Closed hourly candles of symbol that started after the given unix time"""
+
+    end = int(now) // CANDLE_SECONDS * CANDLE_SECONDS
+    start = max(after + CANDLE_SECONDS, end - WARM_UP_CANDLES * CANDLE_SECONDS)
+
+    if start >= end:
+        return []
+
+    #the candle starting at end is still open
+    return [candle for candle in client.get_market_candles(symbol, start, end - 1) if int(candle["start"]) + CANDLE_SECONDS <= end]
+
+
+def update_features(engine: FeatureEngine, candles: list[dict]) -> Union[tuple[float, ...], None]:
+    features = None
+    for candle in candles:
+        features = engine.update(float(candle["close"]))
+    return features
+
+
+def score(model, scaler, batch: dict[str, tuple[float, ...]]) -> dict[str, float]:
+    """Predicted 7 day return of every symbol in the batch, one predict call for all of them"""
+
+    symbols = list(batch)
+    features = pd.DataFrame([batch[symbol] for symbol in symbols], columns=list(FEATURES))
+    predictions = model.predict(scaler.transform(features))
+    return dict(zip(symbols, predictions.tolist()))
+
+
+def main(bot_id: int):
+    logger.name = f"SolModel {bot_id} generator"
+
+    bus = SignalBus(bot_id)
+    redis_client = get_redis_client()
+    metrics_key = f"bot{bot_id}:metrics"
+    signalled_key = f"bot{bot_id}:signalled_candles"
+
+    model, scaler, load_seconds = load_model()
+    stats = InferenceStats(load_seconds)
+    redis_client.hset(metrics_key, mapping=stats.as_dict())
+
+    symbols = environment.SOL_MODEL_SYMBOLS.replace(",", " ").split()
+
+    # Candles are public, the market endpoints need no user token
+    client = CoinbaseClient(None)
+    executor = ThreadPoolExecutor(max_workers=min(8, len(symbols)), thread_name_prefix=f"solmodel{bot_id}-candles")
+
+    engines = {symbol: FeatureEngine() for symbol in symbols}
+    last_candle = {symbol: 0 for symbol in symbols}
+    features: dict[str, Union[tuple[float, ...], None]] = {symbol: None for symbol in symbols}
+
+    logger.info(f"SolModel {bot_id} started, scoring {', '.join(symbols)} every candle, threshold {environment.SOL_MODEL_THRESHOLD:.2%}")
+
+    while True:
+        try:
+            now = time.time()
+
+            # Fetch what closed since the last pass for every symbol at once, the first pass warms the indicators up
+            fetched = dict(zip(symbols, executor.map(lambda symbol: closed_candles(client, symbol, last_candle[symbol], now), symbols)))
+
+            for symbol, candles in fetched.items():
+                if candles:
+                    features[symbol] = update_features(engines[symbol], candles)
+                    last_candle[symbol] = int(candles[-1]["start"])
+
+            batch = {symbol: features[symbol] for symbol in symbols if features[symbol] is not None and fetched[symbol]}
+
+            if batch:
+                start = time.perf_counter()
+                predictions = score(model, scaler, batch)
+                inference = time.perf_counter() - start
+
+                # Candles already acted on, so a restart within the hour doesn't signal the same candle twice
+                signalled = redis_client.hgetall(signalled_key)
+
+                for symbol, predicted in predictions.items():
+                    if signalled.get(symbol) == str(last_candle[symbol]):
+                        logger.info(f"SolModel {bot_id} already signalled the {symbol} candle at {last_candle[symbol]}")
+                    elif predicted > environment.SOL_MODEL_THRESHOLD:
+                        signal = Signal(product_id=symbol, side=BUY, quote_size=round(environment.SOL_MODEL_ALLOCATION, 2))
+                        bus.publish(signal)
+                        redis_client.hset(signalled_key, symbol, last_candle[symbol])
+                        logger.info(f"SolModel {bot_id} predicts {predicted:+.2%} for {symbol}, pushed {signal}")
+                    else:
+                        logger.info(f"SolModel {bot_id} predicts {predicted:+.2%} for {symbol}")
+
+                candle_close = max(last_candle[symbol] for symbol in batch) + CANDLE_SECONDS
+                stats.record(inference, len(batch), time.time() - candle_close)
+                redis_client.hset(metrics_key, mapping=stats.as_dict())
+                logger.info(f"SolModel {bot_id} scored {len(batch)} symbols in {inference * 1000:.1f}ms, {stats.as_dict()}")
+
+            # Sleep until just after the next candle closes
+            next_close = (int(time.time()) // CANDLE_SECONDS + 1) * CANDLE_SECONDS
+            time.sleep(max(0.0, next_close + environment.SOL_MODEL_CANDLE_DELAY - time.time()))
+
+        except Exception as e:
+            logger.error(f"Error in SolModel {bot_id}: {e}")
+            time.sleep(30)
@@ -0,0 +1,87 @@
+import time
+import uuid
+import logging
+
+from app.utility.TokenService     import TokenService
+from app.utility.SignalBus        import SignalBus
+from app.utility.signal_codec     import Signal, BUY
+from app.utility.FanoutExecutor   import get_fanout_executor
+from app.database.db_connection   import context_get_session
+from app.database.models          import Subscription
+from app.utility.SubscriptionCache import get_subscription_cache
+from app.utility.CoinbaseClient   import CoinbaseClient, client_stats, order_id as placed_order_id, order_error
+
+# Logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("SolModel-processor")
+
+
+def main(bot_id: int):
+    bus = SignalBus(bot_id)
+    bus.ensure_group()
+    consumer = SignalBus.consumer_name()
+    get_subscription_cache(bot_id)  # warm up before the first signal
+    logger.info(f"[Proc:{bot_id}] Listening on {bus.stream} as {consumer}")
+
+    while True:
+        try:
+            entries = bus.read(consumer, block_ms=10000)
+
+            for entry_id, sig in entries:
+                logger.info(f"[Proc:{bot_id}] Got signal {entry_id} {sig}")
+
+                with bus.holding(entry_id, consumer):
+                    _execute_for_all(bot_id, sig, bus, entry_id)
+
+                # Ack only after every subscriber was handled
+                bus.ack(entry_id)
+
+        except Exception as e:
+            logger.error(f"[Proc] Loop error: {e}")
+            time.sleep(5)
+
+
+def _execute_for_all(bot_id: int, sig: Signal, bus: SignalBus, entry_id: str):
+    # Subscribers come from the in memory cache, the db is only read on a miss
+    subs = get_subscription_cache(bot_id).get()
+
+    # Subscribers finished by an earlier delivery of this signal are skipped
+    subs = bus.remaining(entry_id, subs)
+
+    # One query for every subscriber's token
+    with context_get_session() as db:
+        tokens = TokenService.get_access_tokens((sub.user_id for sub in subs), exchange_name="coinbase", db=db)
+
+    result = get_fanout_executor().execute(
+        entry_id, subs, lambda sub: _execute_for_user(sub, tokens[sub.user_id], sig, bus, entry_id)
+    )
+    logger.info(f"[Proc] Finished {result}")
+    logger.debug(f"[Proc] Coinbase latency {client_stats.snapshot()}")
+
+
+def _execute_for_user(sub: Subscription, user_tok: str | None, sig: Signal, bus: SignalBus, entry_id: str):
+    if not user_tok:
+        bus.mark_done(entry_id, sub)
+        return False, "No access token"
+
+    client = CoinbaseClient(user_tok)
+
+    # Same order id on every delivery, so Coinbase rejects a duplicate if we crashed after placing it
+    order_id = str(uuid.uuid5(uuid.NAMESPACE_URL, f"{bus.stream}/{entry_id}/{sub.id}"))
+
+    # The model only ever buys, at market for the signal's quote size
+    if sig.side != BUY:
+        bus.mark_done(entry_id, sub)
+        return False, f"Unsupported side {sig.side}"
+
+    resp = client.market_buy(sig.product_id, sig.quote_size, order_id)
+
+    bus.mark_done(entry_id, sub)
+
+    placed = placed_order_id(resp)
+    if placed is None:
+        logger.warning(f"[Proc] Coinbase refused {sig.side} for user {sub.user_id}: {order_error(resp)}")
+        return False, order_error(resp)
+
+    logger.info(f"[Proc] Executed {sig.side} for user {sub.user_id}: order {placed}")
+    return True, f"order {placed}"
@@ -1,13 +1,14 @@
-from multiprocessing import Process
 import logging
 import json
 import os
 from importlib import import_module
-from app.database.db_connection import context_get_session
+from app.database.db_connection import context_get_session, get_pool_status, pool_settings, BOT_ROLE
 from app.database.models import Bot
 from sqlalchemy.future import select
-import time
 from app.utility.environment import environment
+from app.bots.supervisor import BotSupervisor
+from app.bots import runtime
+from app.utility import market_data_publisher
 
 
 #not using multithreading because of the global interpreter lock of python -> only one thread can execute python byte code at a time
@@ -18,10 +19,14 @@ logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
 
-bot_processes: list[Process] = []
+supervisor = BotSupervisor()
 
 BOTS_DIRECTORY = os.path.join(os.path.dirname(__file__))
 
+#runtime modes a bot can pick in its info.json
+PROCESS_RUNTIME = "process"
+ASYNCIO_RUNTIME = "asyncio"
+
 
 
 def load_bot_info(bot_path):
@@ -43,10 +48,16 @@ def load_bot_info(bot_path):
     return None
 
 def startup_all_bots():
-    global bot_processes
 
     logger.info(f"Starting all bots in: {BOTS_DIRECTORY}")
 
+    shared_bots: list[tuple[str, int]] = []
+
+    #the generators read their market data from this process instead of polling coinbase themselves
+    if environment.MARKET_DATA_PUBLISHER:
+        supervisor.add(name="market-data:0:Publisher", target=market_data_publisher.main)
+        logger.info("Market data publisher started")
+
     for bot_name in os.listdir(BOTS_DIRECTORY):
 
         #skip __pycache__
@@ -76,10 +87,6 @@ def startup_all_bots():
             logger.error(f"{bot_name} does not have accompaning generator and/or processor")
             continue
 
-        #get modules for bot
-        signal_generator = import_module(f"app.bots.{bot_name}.signalGenerator").main
-        signal_processor = import_module(f"app.bots.{bot_name}.signalProcessor").main
-
         #load bot info into db if need be, otherwise get id from db
         bot_id = load_bot_into_db(bot_info)
 
@@ -87,17 +94,34 @@ def startup_all_bots():
             logger.error("Can't start a bot without an id")
             continue
 
-        process1 = Process(target=signal_generator, args=(bot_id,), name=f"{bot_name}:{bot_id}:Generator")
-        process2 = Process(target=signal_processor, args=(bot_id,), name=f"{bot_name}:{bot_id}:Processor")
-        
-        process1.start()
-        process2.start()
+        runtime_mode = bot_info.get("runtime", PROCESS_RUNTIME)
+
+        if runtime_mode == ASYNCIO_RUNTIME:
+            #hosted together with the other lightweight bots in the shared runtime process
+            shared_bots.append((bot_name, bot_id))
+            logger.info(f"{bot_name} will run in the shared runtime")
+            continue
+
+        if runtime_mode != PROCESS_RUNTIME:
+            logger.error(f"{bot_name} has unknown runtime {runtime_mode}")
+            continue
+
+        #get modules for bot
+        signal_generator = import_module(f"app.bots.{bot_name}.signalGenerator").main
+        signal_processor = import_module(f"app.bots.{bot_name}.signalProcessor").main
+
+        supervisor.add(name=f"{bot_name}:{bot_id}:Generator", target=signal_generator, args=(bot_id,))
 
-        bot_processes.append(process1)
-        bot_processes.append(process2)
+        #processors share the bot's signal stream through a consumer group, so replicas split the load
+        for replica in range(max(1, int(bot_info.get("processor_replicas", 1)))):
+            supervisor.add(name=f"{bot_name}:{bot_id}:Processor" + (f"-{replica}" if replica else ""), target=signal_processor, args=(bot_id,))
 
         logger.info(f"{bot_name} started")
 
+    if shared_bots:
+        supervisor.add(name=f"runtime:{','.join(str(bot_id) for _, bot_id in shared_bots)}:Shared", target=runtime.main, args=(shared_bots,))
+        logger.info(f"Shared runtime started for {', '.join(bot_name for bot_name, _ in shared_bots)}")
+
 def load_bot_into_db(bot_info: dict):
     
      with context_get_session() as db:
@@ -131,63 +155,35 @@ def load_bot_into_db(bot_info: dict):
 
 def shutdown_all_bots():
 
-    global bot_processes
-
-    for process in bot_processes:
-        if process and process.is_alive():
-            process.terminate()
-            process.join()
-            logger.info(f"{process.name} has been shutdown")
+    supervisor.stop()
 
 def check_bots():
-    """Ensures all bot processes are running"""
-    global bot_processes
-
-    while environment.BOT_MONITOR:
-
-        for i, bot_process in enumerate(bot_processes):
-
-            if not bot_process.is_alive():
-                #bot is not alive, attempt restart once
-                logger.info(f"{bot_process.name} is dead, attempting restart")
-
-                bot_identity = bot_process.name.split(":")
-
-                bot_name = bot_identity[0]
-                bot_id = bot_identity[1]
-                bot_type = bot_identity[2]
-
-                bot_path = os.path.join(BOTS_DIRECTORY, bot_name)
-                
-                if bot_type == "Generator":
+    """Ensures all bot processes are running, blocks until shutdown_all_bots is called"""
 
-                    signal_generator = import_module(f"app.bots.{bot_name}.signalGenerator").main
+    if not environment.BOT_MONITOR:
+        logger.info("Bot monitoring disabled")
+        return
 
-                    new_process = Process(target=signal_generator, args=(bot_id,), name=f"{bot_name}:{bot_id}:Generator")
+    supervisor.run()
 
-                    new_process.start()
+def get_bot_status() -> list[dict]:
+    """Restart counts, uptime and state of every bot process"""
 
-                    bot_processes[i] = new_process
+    return supervisor.status()
 
 
-                else:
+def get_db_pool_status() -> dict:
+    """Pool stats of the api process and the most connections the api and every bot process can open
 
-                    signal_processor = import_module(f"app.bots.{bot_name}.signalProcessor").main
+        The api's max_connections already includes its async pool"""
 
-                    new_process = Process(target=signal_processor, args=(bot_id,), name=f"{bot_name}:{bot_id}:Processor")
+    api_pool = get_pool_status()
+    bot_settings = pool_settings(BOT_ROLE)
+    bot_processes = len(supervisor.status())
 
-                    new_process.start()
-
-                    bot_processes[i] = new_process
-
-
-                    
-
-                logger.info(f"{bot_process.name} restarted")
-
-            else:
-                logger.info(f"{bot_process.name} is alive")
-        
-        time.sleep(60)
-        
-    logger.info("Bot monitoring stopped")      
\ No newline at end of file
+    return {
+        "api": api_pool,
+        "bot_processes": bot_processes,
+        "bot_max_connections": bot_settings["pool_size"] + bot_settings["max_overflow"],
+        "max_connections_needed": api_pool["max_connections"] + bot_processes * (bot_settings["pool_size"] + bot_settings["max_overflow"])
+    }
@@ -0,0 +1,89 @@
+from app.utility.environment import environment
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from typing import Union
+import threading
+import time
+
+
+"""Market data shared by the subscriber executions of the CopyCatBot
+
+    MarketContext lives for one signal: the spot price is the same for every subscriber, so the
+    first execution that needs it fetches it and the others wait for that result. AccountsCache
+    lives for the process and keeps each user's account ids and balances for a few seconds, so a
+    burst of signals doesn't list the same user's accounts once per signal."""
+
+
+class MarketContext:
+    """Prices for one signal, fetched at most once however many subscribers ask"""
+
+    def __init__(self, product_id: str):
+        self.product_id = product_id
+        self.fetches = 0
+        self._spot_price: Union[float, None] = None
+        self._lock = threading.Lock()
+
+    def spot_price(self, fetch: Callable[[], float]) -> float:
+        """The product's spot price, fetch is only called by the first caller or after a failed fetch"""
+
+        if self._spot_price is not None:
+            return self._spot_price
+
+        with self._lock:
+            if self._spot_price is None:
+                self.fetches += 1
+                self._spot_price = fetch()
+
+        return self._spot_price
+
+
+@dataclass(slots=True)
+class UserAccounts:
+    """The accounts of one user a BTC-USD trade needs"""
+
+    btc_account_id: Union[str, None]
+    usd_account_id: Union[str, None]
+    btc_balance: float
+    usd_balance: float
+    fetched_at: float = field(default_factory=time.monotonic)
+
+
+class AccountsCache:
+    """Per user accounts, reused for COPYCAT_ACCOUNTS_CACHE_TTL seconds"""
+
+    def __init__(self, ttl: Union[float, None] = None):
+        self.ttl = ttl if ttl is not None else environment.COPYCAT_ACCOUNTS_CACHE_TTL
+        self.hits = 0
+        self.misses = 0
+        self._accounts: dict[int, UserAccounts] = {}
+        self._lock = threading.Lock()
+
+    def get(self, user_id: int, load: Callable[[], UserAccounts]) -> UserAccounts:
+
+        with self._lock:
+            accounts = self._accounts.get(user_id)
+            if accounts is not None and time.monotonic() - accounts.fetched_at < self.ttl:
+                self.hits += 1
+                return accounts
+            self.misses += 1
+
+        #executions of one user are serialized by the fanout, loading outside the lock is safe
+        accounts = load()
+
+        with self._lock:
+            self._accounts[user_id] = accounts
+
+        return accounts
+
+    def apply_trade(self, user_id: int, usd_delta: float, btc_delta: float):
+        """Moves the cached balances by an executed trade, so the next check in the burst sees it"""
+
+        with self._lock:
+            accounts = self._accounts.get(user_id)
+            if accounts is not None:
+                accounts.usd_balance += usd_delta
+                accounts.btc_balance += btc_delta
+
+    def invalidate(self, user_id: int):
+        with self._lock:
+            self._accounts.pop(user_id, None)
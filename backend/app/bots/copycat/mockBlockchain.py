@@ -0,0 +1,146 @@
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from datetime import datetime, timezone
+from urllib.parse import urlparse, parse_qs
+import argparse
+import threading
+import hashlib
+import random
+import json
+import time
+
+
+"""Local stand-in for the BlockCypher address endpoint the CopyCatBot polls
+
+    python -m app.bots.copycat.mockBlockchain --port 8099 --rate 50
+    COPYCAT_BLOCKCHAIN_API_URL=http://localhost:8099
+
+Serves GET /addrs/{address}/full?after=&before=&limit= for any address. Every address behaves
+like a whale that makes a new transaction now and then: each request has a --tx-chance probability
+of adding one, a buy (the address is only in the outputs) or a sell (only in the inputs). Responses
+use the BlockCypher format, newest transaction first, filtered by block height and capped like the
+real endpoint. Requests beyond --rate per second get a 429 so the shared rate limiter can be tested
+as well."""
+
+
+MAX_TXS = 50
+HISTORY = 10000
+
+
+class MockBlockchain:
+
+    def __init__(self, tx_chance: float, rate: float, seed=None):
+        self.tx_chance = tx_chance
+        self.rate = rate
+        self.random = random.Random(seed)
+        self.height = 850000
+        self.txs: dict[str, list[dict]] = {}
+        self.requests = 0
+        self.rejected = 0
+        self._window: list[float] = []
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Sliding one second window, like the limits of the real api"""
+
+        now = time.monotonic()
+
+        with self._lock:
+            self.requests += 1
+            self._window = [t for t in self._window if now - t < 1.0]
+
+            if self.rate > 0 and len(self._window) >= self.rate:
+                self.rejected += 1
+                return False
+
+            self._window.append(now)
+            return True
+
+    def address(self, address: str, after=None, before=None, limit: int = MAX_TXS) -> dict:
+
+        with self._lock:
+            txs = self.txs.setdefault(address, [])
+
+            if self.random.random() < self.tx_chance:
+                self.height += 1
+                txs.insert(0, self.__transaction(address, self.height))
+                del txs[HISTORY:]
+
+            selected = [tx for tx in txs if (after is None or tx["block_height"] > after) and (before is None or tx["block_height"] < before)]
+
+            return {"address": address, "n_tx": len(txs), "txs": selected[:min(limit, MAX_TXS)]}
+
+    def __transaction(self, address: str, height: int) -> dict:
+        counterparty = f"bc1q{hashlib.sha256(f'{address}{height}'.encode()).hexdigest()[:38]}"
+        buy = self.random.random() < 0.7
+
+        return {
+            "hash": hashlib.sha256(f"{address}:{height}:{self.random.random()}".encode()).hexdigest(),
+            "block_height": height,
+            "received": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ"),
+            "inputs": [{"addresses": [counterparty if buy else address]}],
+            "outputs": [{"addresses": [address if buy else counterparty]}]
+        }
+
+
+def handler_for(blockchain: MockBlockchain):
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            parts = url.path.strip("/").split("/")
+            query = {key: int(values[0]) for key, values in parse_qs(url.query).items() if key in ("after", "before", "limit")}
+
+            if len(parts) != 3 or parts[0] != "addrs" or parts[2] != "full":
+                return self.__send(404, {"error": f"Unknown path {self.path}"})
+
+            if not blockchain.allow():
+                return self.__send(429, {"error": "Limits reached."})
+
+            self.__send(200, blockchain.address(parts[1], **query))
+
+        def __send(self, status: int, body: dict):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def serve(port: int = 8099, tx_chance: float = 0.05, rate: float = 0.0, seed=None) -> ThreadingHTTPServer:
+    """Starts the mock api on a background thread, returns the server so it can be shut down"""
+
+    blockchain = MockBlockchain(tx_chance=tx_chance, rate=rate, seed=seed)
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler_for(blockchain))
+    server.blockchain = blockchain
+    threading.Thread(target=server.serve_forever, name="mock-blockchain", daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the blockchain api used by the CopyCatBot")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--tx-chance", type=float, default=0.05, help="chance that a request finds a new transaction")
+    parser.add_argument("--rate", type=float, default=0.0, help="requests per second before answering 429, 0 for no limit")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    server = serve(port=args.port, tx_chance=args.tx_chance, rate=args.rate, seed=args.seed)
+    print(f"Mock blockchain api on http://127.0.0.1:{args.port}")
+
+    try:
+        while True:
+            time.sleep(10)
+            print(f"{server.blockchain.requests} requests, {server.blockchain.rejected} rate limited")
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+from app.utility.signal_codec import Signal, BUY, SELL
+from typing import Union
+
+
+"""Rolling risk state of the CopyCatBot, kept up to date as trades are accepted
+
+    copycat:{bot_id}:risk:times     zset    signal ids of accepted trades scored by time, last hour only
+    copycat:{bot_id}:risk:last      string  time of the last accepted trade
+    copycat:{bot_id}:risk:sides     list    sides of the last BALANCE_WINDOW accepted trades
+    copycat:{bot_id}:risk:counts    hash    BUY / SELL counts of that list
+
+Checking a trade and recording it happen in one script against the Redis clock, so every rule is
+a constant amount of work and two processor replicas can never both pass the same cooldown. A
+signal accepted within the last hour is accepted again without being counted twice, so a processor
+that crashed before handling any subscriber can finish it after redelivery."""
+
+
+MAX_TRADES_PER_WINDOW = 6       # No more than 6 trades...
+TRADE_WINDOW = 3600             # ...in the last hour
+COOLDOWN = 600                  # At least 10 minutes between trades
+BALANCE_WINDOW = 20             # Compare buys and sells over the last 20 trades
+MAX_IMBALANCE = 5               # Reject a side once it is more than 5 trades ahead of the other
+
+
+# KEYS[1] times, KEYS[2] last, KEYS[3] sides, KEYS[4] counts
+# ARGV[1] side, ARGV[2] signal id, ARGV[3] max trades, ARGV[4] window, ARGV[5] cooldown, ARGV[6] balance window, ARGV[7] max imbalance
+# Returns {1, "accepted"} or {0, reason}
+CHECK_AND_RECORD = """
+local side = ARGV[1]
+local max_trades = tonumber(ARGV[3])
+local window = tonumber(ARGV[4])
+local cooldown = tonumber(ARGV[5])
+local balance_window = tonumber(ARGV[6])
+local max_imbalance = tonumber(ARGV[7])
+
+-- a redelivered signal that was already accepted stays accepted
+if redis.call('ZSCORE', KEYS[1], ARGV[2]) then
+    return {1, 'accepted'}
+end
+
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now - window)
+if redis.call('ZCARD', KEYS[1]) >= max_trades then
+    return {0, 'Too many trades in the last hour'}
+end
+
+local last = tonumber(redis.call('GET', KEYS[2]))
+if last and now - last < cooldown then
+    return {0, string.format('Minimum time between trades not met (%.0f seconds)', now - last)}
+end
+
+local buys = tonumber(redis.call('HGET', KEYS[4], 'BUY')) or 0
+local sells = tonumber(redis.call('HGET', KEYS[4], 'SELL')) or 0
+if side == 'BUY' and buys > sells + max_imbalance then
+    return {0, 'Too many BUY orders without corresponding SELL orders'}
+end
+if side == 'SELL' and sells > buys + max_imbalance then
+    return {0, 'Too many SELL orders without corresponding BUY orders'}
+end
+
+redis.call('ZADD', KEYS[1], now, ARGV[2])
+redis.call('EXPIRE', KEYS[1], window)
+redis.call('SET', KEYS[2], tostring(now))
+
+redis.call('RPUSH', KEYS[3], side)
+redis.call('HINCRBY', KEYS[4], side, 1)
+if redis.call('LLEN', KEYS[3]) > balance_window then
+    redis.call('HINCRBY', KEYS[4], redis.call('LPOP', KEYS[3]), -1)
+end
+
+return {1, 'accepted'}
+"""
+
+
+class RiskState:
+
+    def __init__(self, redis_client, bot_id: int):
+        self.redis = redis_client
+        prefix = f"copycat:{bot_id}:risk"
+        self.keys = [f"{prefix}:times", f"{prefix}:last", f"{prefix}:sides", f"{prefix}:counts"]
+        self.__check_and_record = redis_client.register_script(CHECK_AND_RECORD)
+
+    def check_and_record(self, signal: Signal) -> tuple[bool, str]:
+        """Applies the frequency, cooldown and balance rules, an accepted trade is counted right away"""
+
+        if signal.side not in (BUY, SELL):
+            return False, f"Invalid action {signal.side}"
+
+        accepted, reason = self.__check_and_record(
+            keys=self.keys,
+            args=[signal.side, signal.signal_id, MAX_TRADES_PER_WINDOW, TRADE_WINDOW, COOLDOWN, BALANCE_WINDOW, MAX_IMBALANCE]
+        )
+
+        return accepted == 1, reason.decode() if isinstance(reason, bytes) else reason
+
+    def snapshot(self) -> dict[str, Union[int, float, None]]:
+        """Current state, for logging and debugging"""
+
+        pipeline = self.redis.pipeline(transaction=False)
+        pipeline.zcard(self.keys[0])
+        pipeline.get(self.keys[1])
+        pipeline.hmget(self.keys[3], BUY, SELL)
+        trades, last, (buys, sells) = pipeline.execute()
+
+        return {
+            "trades_in_window": trades,
+            "last_trade": float(last) if last is not None else None,
+            "buys": int(buys or 0),
+            "sells": int(sells or 0)
+        }
@@ -0,0 +1,58 @@
+from app.utility.environment import environment
+from collections import OrderedDict
+import threading
+import time
+
+
+class SeenTransactions:
+    """Bounded set of the transaction hashes the generator already turned into signals
+
+        Backed by a Redis sorted set scored by the time a hash was first seen, so restarts and
+        every generator replica share it, and claiming a hash is a single ZADD NX: exactly one
+        caller gets to emit the signal. Hashes older than COPYCAT_SEEN_TX_WINDOW seconds are
+        dropped and the set never holds more than COPYCAT_SEEN_TX_MAX hashes. A small local LRU
+        in front of it answers for the hashes the blockchain API keeps returning every poll."""
+
+    def __init__(self, redis_client, bot_id: int, max_size: int = None, window: float = None, local_size: int = None):
+        self.redis = redis_client
+        self.key = f"copycat:{bot_id}:seen_transactions"
+        self.max_size = max_size if max_size is not None else environment.COPYCAT_SEEN_TX_MAX
+        self.window = window if window is not None else environment.COPYCAT_SEEN_TX_WINDOW
+        self.local_size = local_size if local_size is not None else environment.COPYCAT_SEEN_TX_LOCAL
+        self._local: OrderedDict[str, None] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def claim(self, tx_hash: str) -> bool:
+        """True the first time any generator sees this hash, False after that"""
+
+        if self.__seen_locally(tx_hash):
+            return False
+
+        now = time.time()
+
+        pipeline = self.redis.pipeline()
+        pipeline.zadd(self.key, {tx_hash: now}, nx=True)
+        pipeline.zremrangebyscore(self.key, "-inf", now - self.window)
+        #keep the newest max_size hashes
+        pipeline.zremrangebyrank(self.key, 0, -(self.max_size + 1))
+        added, _, _ = pipeline.execute()
+
+        self.__remember_locally(tx_hash)
+        return added == 1
+
+    def __len__(self) -> int:
+        return self.redis.zcard(self.key)
+
+    def __seen_locally(self, tx_hash: str) -> bool:
+        with self._lock:
+            if tx_hash in self._local:
+                self._local.move_to_end(tx_hash)
+                return True
+            return False
+
+    def __remember_locally(self, tx_hash: str):
+        with self._lock:
+            self._local[tx_hash] = None
+            self._local.move_to_end(tx_hash)
+            while len(self._local) > self.local_size:
+                self._local.popitem(last=False)
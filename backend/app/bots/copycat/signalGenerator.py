@@ -1,236 +1,298 @@
-import redis
+from app.utility.redis_helper import get_redis_client
+from app.utility.SignalBus import SignalBus
+from app.utility.signal_codec import Signal
+from app.bots.copycat.seenTransactions import SeenTransactions
 import logging
 import time
 import os
 import sys, getopt
 import json
+import calendar
 import requests
+from typing import Union
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from app.utility.environment import environment
-from app.database.db_connection import context_get_session
-from app.database.models import Subscription, Bot
-from sqlalchemy.future import select
+from app.utility.RateLimiter import RateLimiter
 
 
 """
-CopyCatBot monitors a single top-performing Bitcoin trader on the blockchain and copies their transactions.
-It tracks a specific whale wallet address and generates trading signals based on their activity.
+CopyCatBot monitors a watch list of top-performing Bitcoin traders on the blockchain and copies their transactions.
+Every address is polled concurrently, all fetches share one rate limit on the blockchain API, and the
+tracking state of each address lives in Redis so restarts and replicas pick up where the last check ended.
+Point COPYCAT_BLOCKCHAIN_API_URL at app.bots.copycat.mockBlockchain to run against local fake whales.
 """
 
 # Logging per bot
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(os.path.basename(os.getcwd()))
 
-# The target Bitcoin trader wallet address to track
+# Followed when no watch list is configured
 # In production, replace this with a real high-performing trader's address
 TARGET_BITCOIN_ADDRESS = "bc1q5mecc0lj3mehs6jrv0j830fyxdtqhpx9d9durh"  # Example address
 
-# Transaction cache to avoid duplicates
-TRANSACTION_CACHE = set()
-
-# API rate limiting
-LAST_API_CALL = 0
-MIN_API_INTERVAL = 60  # Seconds between API calls
+# Transactions per blockchain API request, and how many pages one check may read after a burst of activity
+TXS_PER_PAGE = 50
+MAX_PAGES = 5
 
 def bot_worker(bot_id: int):
-    """Main worker function that monitors a specific Bitcoin whale trader"""
+    """Main worker function that monitors every whale on the watch list"""
 
-    redis_client = redis.StrictRedis(host=environment.REDIS_HOST, port=environment.REDIS_PORT, decode_responses=True)
+    redis_client = get_redis_client()
     
-    queue_name = f"bot{bot_id}_queue"
+    signal_bus = SignalBus(bot_id)
+
+    # Transactions already turned into signals, shared with restarts and other replicas
+    seen_transactions = SeenTransactions(redis_client, bot_id)
+
+    # One budget for the blockchain API across every thread and process
+    rate_limiter = RateLimiter(redis_client, "copycat:blockchain_api", rate=environment.COPYCAT_API_RATE, burst=environment.COPYCAT_API_BURST)
 
-    # Remove any stale trades from the queue
-    redis_client.delete(queue_name)
+    addresses = load_watch_list()
 
-    logger.info(f"CopyCatBot {bot_id} started, monitoring Bitcoin whale: {TARGET_BITCOIN_ADDRESS}")
+    logger.info(f"CopyCatBot {bot_id} started, monitoring {len(addresses)} Bitcoin whales")
     
     # Initialize tracking
-    initialize_trader_tracking(redis_client, bot_id)
+    initialize_trader_tracking(redis_client, bot_id, addresses)
+
+    # Connections to the blockchain API are reused across checks
+    session = requests.Session()
+    session.mount("https://", HTTPAdapter(pool_maxsize=environment.COPYCAT_FETCH_WORKERS))
+    session.mount("http://", HTTPAdapter(pool_maxsize=environment.COPYCAT_FETCH_WORKERS))
+
+    executor = ThreadPoolExecutor(max_workers=environment.COPYCAT_FETCH_WORKERS, thread_name_prefix=f"copycat{bot_id}-fetch")
     
     while True:
         try:
-            # Find recent transactions from our target trader
-            signals = check_bitcoin_transactions(redis_client, bot_id)
-            
-            for signal in signals:
-                redis_client.rpush(queue_name, signal)
-                logger.info(f"CopyCatBot {bot_id} detected signal: {signal}")
-            
-            # Wait before checking again (respecting API rate limits)
-            sleep_time = max(30, MIN_API_INTERVAL - (time.time() - LAST_API_CALL))
-            time.sleep(sleep_time)
+            cycle_start = time.monotonic()
+
+            # Find recent transactions from every target trader
+            futures = [executor.submit(check_bitcoin_transactions, redis_client, bot_id, address, session, rate_limiter, seen_transactions) for address in addresses]
+
+            # Publish as soon as each address is checked rather than after the slowest one
+            for future in as_completed(futures):
+                for signal in future.result():
+                    signal_bus.publish(signal)
+                    logger.info(f"CopyCatBot {bot_id} detected signal: {signal}")
+
+            cycle_time = time.monotonic() - cycle_start
+            logger.info(f"CopyCatBot {bot_id} checked {len(addresses)} whales in {cycle_time:.2f}s")
+
+            # Wait before checking again
+            time.sleep(max(0, environment.COPYCAT_POLL_INTERVAL - cycle_time))
             
         except Exception as e:
             logger.error(f"Error in CopyCatBot {bot_id}: {e}")
             time.sleep(30)  # Wait before retrying after an error
 
-def initialize_trader_tracking(redis_client, bot_id):
-    """Initialize tracking for our target Bitcoin trader"""
-    
-    # Get any existing trader info
-    trader_info_json = redis_client.get(f"copycat:{bot_id}:target_trader")
-    
-    if trader_info_json:
-        trader_info = json.loads(trader_info_json)
-        logger.info(f"Resuming tracking for Bitcoin whale: {trader_info.get('btc_address', TARGET_BITCOIN_ADDRESS)}")
-    else:
-        # Create new trader info
-        trader_info = {
-            "btc_address": TARGET_BITCOIN_ADDRESS,
-            "track_since": time.time(),
-            "last_check_time": time.time(),
-            "cumulative_profit": 0,
-            "successful_trades": 0,
-            "total_trades": 0,
-            "last_transactions": []
-        }
-        
-        # Save trader info to Redis
-        redis_client.set(f"copycat:{bot_id}:target_trader", json.dumps(trader_info))
-        
-        logger.info(f"Initialized tracking for Bitcoin whale: {TARGET_BITCOIN_ADDRESS}")
+def load_watch_list() -> list[str]:
+    """Addresses from COPYCAT_WATCH_ADDRESSES and COPYCAT_WATCH_FILE, in order and without duplicates"""
+
+    addresses = environment.COPYCAT_WATCH_ADDRESSES.replace(",", " ").split()
+
+    if environment.COPYCAT_WATCH_FILE:
+        with open(environment.COPYCAT_WATCH_FILE, "r") as file:
+            for line in file:
+                line = line.split("#")[0].strip()
+                if line:
+                    addresses.append(line)
+
+    addresses = list(dict.fromkeys(addresses))
+
+    if not addresses:
+        logger.warning(f"No watch list configured, following {TARGET_BITCOIN_ADDRESS}")
+        addresses = [TARGET_BITCOIN_ADDRESS]
+
+    return addresses
+
+def address_key(bot_id, btc_address) -> str:
+    return f"copycat:{bot_id}:address:{btc_address}"
+
+def initialize_trader_tracking(redis_client, bot_id, addresses: list[str]):
+    """Initialize tracking for every target Bitcoin trader"""
     
-    # Initialize transaction history if it doesn't exist
-    if not redis_client.exists(f"copycat:{bot_id}:transaction_history"):
-        redis_client.delete(f"copycat:{bot_id}:transaction_history")
+    now = time.time()
+
+    # Only new addresses get fresh state, the others resume where they were
+    pipeline = redis_client.pipeline()
+    for btc_address in addresses:
+        pipeline.hsetnx(address_key(bot_id, btc_address), "track_since", now)
+        pipeline.hsetnx(address_key(bot_id, btc_address), "last_check_time", now)
+    created = pipeline.execute()[::2]
+
+    logger.info(f"Tracking {sum(created)} new and {len(addresses) - sum(created)} resumed Bitcoin whales")
+
+def fetch_transactions(session: requests.Session, rate_limiter: RateLimiter, btc_address, after=None, before=None) -> Union[list, None]:
+    """One page of the address's transactions, newest first, None if the api call failed
+
+        after and before are block heights, BlockCypher only returns transactions above after and
+        below before, unconfirmed transactions are always included"""
+
+    params = {"limit": TXS_PER_PAGE}
+    if after is not None:
+        params["after"] = after
+    if before is not None:
+        params["before"] = before
+
+    # Wait for our turn on the blockchain API
+    rate_limiter.acquire()
 
-def check_bitcoin_transactions(redis_client, bot_id):
-    """Check for new Bitcoin transactions from our target trader"""
+    api_url = f"{environment.COPYCAT_BLOCKCHAIN_API_URL}/addrs/{btc_address}/full"
+    response = session.get(api_url, params=params, timeout=environment.COPYCAT_FETCH_TIMEOUT)
+
+    if response.status_code == 429:
+        logger.warning(f"Blockchain API rate limited the check of {btc_address}, lower COPYCAT_API_RATE")
+        return None
+
+    if response.status_code != 200:
+        logger.error(f"Blockchain API returned {response.status_code} for {btc_address}")
+        return None
+
+    logger.debug(f"Fetched {len(response.content)} bytes of transactions for {btc_address} after block {after}")
+    return response.json().get('txs', [])
+
+def received_time(tx) -> float:
+    """Unix time the blockchain first saw the transaction"""
+
+    tx_time = tx.get('received', '').replace('T', ' ').replace('Z', '').split('.')[0]
+    return calendar.timegm(time.strptime(tx_time, '%Y-%m-%d %H:%M:%S'))
+
+def check_bitcoin_transactions(redis_client, bot_id, btc_address, session: requests.Session, rate_limiter: RateLimiter, seen_transactions: SeenTransactions):
+    """Check for new Bitcoin transactions from one target trader
+
+        Only transactions above the last processed block height are requested, so the work per
+        check grows with the trader's new activity rather than with their history"""
     
-    global LAST_API_CALL
     signals = []
-    
-    # Rate limiting
     current_time = time.time()
-    if current_time - LAST_API_CALL < MIN_API_INTERVAL:
-        return []
     
     try:
-        # Get trader info from Redis
-        trader_info_json = redis_client.get(f"copycat:{bot_id}:target_trader")
-        if not trader_info_json:
-            logger.error("Trader info not found in Redis")
-            return []
-            
-        trader_info = json.loads(trader_info_json)
-        btc_address = trader_info.get("btc_address", TARGET_BITCOIN_ADDRESS)
-        last_check_time = trader_info.get("last_check_time", time.time() - 3600)
+        # Get this trader's state from Redis
+        block_height, last_check_time = redis_client.hmget(address_key(bot_id, btc_address), "block_height", "last_check_time")
+        cursor = int(block_height) if block_height is not None else None
+        last_check_time = float(last_check_time or current_time - 3600)
         
-        logger.info(f"Checking for new Bitcoin transactions from {btc_address}")
-        
-        # In production, here you would use a blockchain API to check for real transactions
-        # Example APIs for Bitcoin:
-        # - BlockCypher API: https://www.blockcypher.com/dev/bitcoin/
-        # - Blockchain.info API: https://www.blockchain.com/api
-        # - Blockstream API: https://github.com/Blockstream/esplora/blob/master/API.md
-        
-        # Update the last API call timestamp
-        LAST_API_CALL = current_time
-        
-       
-        # Get recent transactions
-        api_url = f"https://api.blockcypher.com/v1/btc/main/addrs/{btc_address}/full"
-        response = requests.get(api_url)
-        
-        if response.status_code == 200:
-            data = response.json()
-            txs = data.get('txs', [])
-            
-            # Process each transaction
+        logger.debug(f"Checking for new Bitcoin transactions from {btc_address} after block {cursor}")
+
+        # Collect the transactions above the cursor, newest first
+        new_txs = []
+        collected = set()
+        before = None
+
+        for _ in range(MAX_PAGES):
+            txs = fetch_transactions(session, rate_limiter, btc_address, after=cursor, before=before)
+
+            # Try again next cycle, the cursor stays where it is
+            if txs is None:
+                return []
+
+            reached_known = False
+            added = 0
+
             for tx in txs:
-                tx_hash = tx.get('hash')
-                
-                # Skip if we've already processed this transaction
-                if tx_hash in TRANSACTION_CACHE:
-                    continue
-                    
-                # Add to cache to avoid duplicates
-                TRANSACTION_CACHE.add(tx_hash)
-                
-                # Get transaction timestamp
-                tx_time = tx.get('received', '').replace('T', ' ').replace('Z', '')
-                tx_timestamp = time.mktime(time.strptime(tx_time, '%Y-%m-%d %H:%M:%S'))
-                
-                # Skip old transactions
-                if tx_timestamp < last_check_time:
+                height = tx.get('block_height', -1)
+
+                # Everything from here on was processed by an earlier check
+                if cursor is not None and 0 <= height <= cursor:
+                    reached_known = True
+                    break
+
+                # Without a cursor transactions older than the last check predate tracking, the next page is older still
+                if cursor is None and received_time(tx) < last_check_time:
+                    reached_known = True
                     continue
-                
-                # Determine if this is an incoming or outgoing transaction
-                is_incoming = False
-                is_outgoing = False
-                
-                for input_tx in tx.get('inputs', []):
-                    if btc_address in input_tx.get('addresses', []):
-                        is_outgoing = True
-                        
-                for output_tx in tx.get('outputs', []):
-                    if btc_address in output_tx.get('addresses', []):
-                        is_incoming = True
-                
-                # Generate trading signal based on transaction type
-                if is_outgoing and not is_incoming:
-                    # If the whale is sending BTC out, it might be selling
-                    action = "SELL"
-                elif is_incoming and not is_outgoing:
-                    # If the whale is receiving BTC, it might be buying
-                    action = "BUY"
-                else:
-                    # If it's a transfer between own wallets, ignore
+
+                # Unconfirmed transactions and the block a page starts at come back on every page
+                if tx.get('hash') in collected:
                     continue
-                
-                # Create signal
-                signal_id = int(time.time())
-                signal = f"{signal_id}:{action}:BTC"
-                signals.append(signal)
-                
-                # Record this transaction
-                record_transaction(redis_client, bot_id, "BTC", action, tx_hash)
 
+                collected.add(tx.get('hash'))
+                new_txs.append(tx)
+                added += 1
+
+            if reached_known or len(txs) < TXS_PER_PAGE:
+                break
+
+            # A full page of new activity, the older part of it is on the next page
+            confirmed_heights = [tx['block_height'] for tx in txs if tx.get('block_height', -1) >= 0]
+            if not confirmed_heights:
+                break
+
+            oldest = min(confirmed_heights)
+
+            if added:
+                # The oldest block may continue on the next page
+                before = oldest + 1
+            else:
+                # The page was all repeats, block heights can't page inside one block
+                logger.warning(f"Block {oldest} holds more than a page of {btc_address} transactions, the rest of that block is skipped")
+                before = oldest
+
+        else:
+            logger.warning(f"{btc_address} has more than {MAX_PAGES} pages of new transactions, older ones are skipped")
+
+        new_cursor = cursor
         
-        # For this example, we'll simulate finding transactions (replace with real API in production)
-        # Simulating 3 scenarios with different probabilities:
-        # 1. No new transaction (70% probability)
-        # 2. Buy transaction (21% probability - whales buy more often than sell)
-        # 3. Sell transaction (9% probability)
-        import random
-        
-        random_value = random.random()
-        
-        if random_value < 0.30:  # 30% chance to find a transaction
-            # Generate a unique transaction ID
-            tx_id = f"tx_{int(time.time())}_{random.randint(1000, 9999)}"
+        # Process each transaction
+        for tx in new_txs:
+            tx_hash = tx.get('hash')
+            height = tx.get('block_height', -1)
+
+            if height >= 0:
+                new_cursor = height if new_cursor is None else max(new_cursor, height)
+            
+            # Skip if we (or another generator) already processed this transaction
+            if not tx_hash or not seen_transactions.claim(tx_hash):
+                continue
+
+            # Determine if this is an incoming or outgoing transaction
+            is_incoming = False
+            is_outgoing = False
+            
+            for input_tx in tx.get('inputs', []):
+                if btc_address in (input_tx.get('addresses') or []):
+                    is_outgoing = True
+                    break
+                    
+            for output_tx in tx.get('outputs', []):
+                if btc_address in (output_tx.get('addresses') or []):
+                    is_incoming = True
+                    break
+            
+            # Generate trading signal based on transaction type
+            if is_outgoing and not is_incoming:
+                # If the whale is sending BTC out, it might be selling
+                action = "SELL"
+            elif is_incoming and not is_outgoing:
+                # If the whale is receiving BTC, it might be buying
+                action = "BUY"
+            else:
+                # If it's a transfer between own wallets, ignore
+                continue
+            
+            # Create signal
+            signal = Signal(product_id="BTC-USD", side=action)
+            signals.append(signal)
             
-            # Check if not already in cache
-            if tx_id not in TRANSACTION_CACHE:
-                # Add to cache
-                TRANSACTION_CACHE.add(tx_id)
-                
-                # Determine transaction type (70% buy, 30% sell)
-                if random_value < 0.21:  # 21% chance for buy
-                    action = "BUY"
-                else:  # 9% chance for sell
-                    action = "SELL"
-                
-                # Create signal
-                signal_id = int(time.time())
-                signal = f"{signal_id}:{action}:BTC"
-                signals.append(signal)
-                
-                # Record this transaction
-                record_transaction(redis_client, bot_id, "BTC", action, tx_id)
+            # Record this transaction
+            record_transaction(redis_client, bot_id, btc_address, "BTC", action, tx_hash)
         
-        # Update the last check time
-        trader_info["last_check_time"] = current_time
-        redis_client.set(f"copycat:{bot_id}:target_trader", json.dumps(trader_info))
+        # Update the last check time and move the cursor past everything processed
+        state = {"last_check_time": current_time}
+        if new_cursor is not None:
+            state["block_height"] = new_cursor
+        redis_client.hset(address_key(bot_id, btc_address), mapping=state)
         
     except Exception as e:
-        logger.error(f"Error checking Bitcoin transactions: {e}")
+        logger.error(f"Error checking Bitcoin transactions of {btc_address}: {e}")
     
     return signals
 
-def record_transaction(redis_client, bot_id, crypto, action, tx_hash):
-    """Record a transaction from our target trader"""
+def record_transaction(redis_client, bot_id, btc_address, crypto, action, tx_hash):
+    """Record a transaction from one of our target traders"""
     
     transaction = {
+        "address": btc_address,
         "crypto": crypto,
         "action": action,
         "tx_hash": tx_hash,
@@ -238,30 +300,22 @@ def record_transaction(redis_client, bot_id, crypto, action, tx_hash):
         "detected_at": time.time()
     }
     
-    # Add to transaction history
-    redis_client.lpush(f"copycat:{bot_id}:transaction_history", json.dumps(transaction))
-    
-    # Keep only the most recent 100 transactions
-    redis_client.ltrim(f"copycat:{bot_id}:transaction_history", 0, 99)
+    pipeline = redis_client.pipeline()
+
+    # Add to transaction history, keeping only the most recent 100 transactions
+    pipeline.lpush(f"copycat:{bot_id}:transaction_history", json.dumps(transaction))
+    pipeline.ltrim(f"copycat:{bot_id}:transaction_history", 0, 99)
     
     # Update trader stats
-    trader_info_json = redis_client.get(f"copycat:{bot_id}:target_trader")
-    if trader_info_json:
-        trader_info = json.loads(trader_info_json)
-        trader_info["total_trades"] = trader_info.get("total_trades", 0) + 1
-        
-        # Keep track of last 10 transactions in trader info for quick reference
-        last_transactions = trader_info.get("last_transactions", [])
-        last_transactions.insert(0, {
-            "crypto": crypto,
-            "action": action,
-            "timestamp": time.time()
-        })
-        trader_info["last_transactions"] = last_transactions[:10]  # Keep only last 10
-        
-        redis_client.set(f"copycat:{bot_id}:target_trader", json.dumps(trader_info))
+    pipeline.hincrby(address_key(bot_id, btc_address), "total_trades", 1)
+
+    # Keep track of the trader's last 10 transactions for quick reference
+    pipeline.lpush(f"{address_key(bot_id, btc_address)}:recent", json.dumps({"crypto": crypto, "action": action, "timestamp": time.time()}))
+    pipeline.ltrim(f"{address_key(bot_id, btc_address)}:recent", 0, 9)
+
+    pipeline.execute()
     
-    logger.info(f"Recorded {action} transaction for {crypto} from target trader (TX: {tx_hash})")
+    logger.info(f"Recorded {action} transaction for {crypto} from target trader {btc_address} (TX: {tx_hash})")
 
 def get_bot_id(argv):
     # Get bot id from command line
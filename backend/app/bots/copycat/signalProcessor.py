@@ -1,327 +1,270 @@
 from app.utility.environment import environment
 from app.utility.TokenService import TokenService
+from app.utility.FanoutExecutor import get_fanout_executor
 from app.database.db_connection import context_get_session
-from app.database.models import Subscription, Bot
-import redis
+from app.utility.SubscriptionCache import get_subscription_cache
+from app.utility.redis_helper import get_redis_client
+from app.utility.SignalBus import SignalBus
+from app.utility.signal_codec import Signal
+from app.bots.copycat.tradeHistory import TradeHistory
+from app.bots.copycat.riskState import RiskState
+from app.bots.copycat.marketContext import MarketContext, UserAccounts, AccountsCache
+from app.utility.CoinbaseClient import CoinbaseClient, client_stats, order_id, order_error
 import logging
-from sqlalchemy.future import select
 import os
 import sys, getopt
-import json
 import time
+import uuid
 
 
 # Logging per bot
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(os.path.basename(os.getcwd()))
 
+# Account ids and balances of subscribers, shared by every signal this process executes
+ACCOUNTS_CACHE = AccountsCache()
+
 
 def execute_trades(bot_id: int):
     """Execute copied trades from a Bitcoin whale for all CopyCatBot subscribers"""
 
-    redis_client = redis.StrictRedis(host=environment.REDIS_HOST, port=environment.REDIS_PORT, decode_responses=True)
+    redis_client = get_redis_client()
+
+    signal_bus = SignalBus(bot_id)
+    signal_bus.ensure_group()
 
-    queue_name = f"bot{bot_id}_queue"
+    consumer = SignalBus.consumer_name()
 
-    logger.info(f"CopyCatBot executor for bot {bot_id} started, reading signals from {queue_name}")
+    # Load subscribers into memory before the first signal
+    get_subscription_cache(bot_id)
 
-    # Create a record in Redis for tracking trade history
-    if not redis_client.exists(f"copycat:{bot_id}:trade_history"):
-        redis_client.delete(f"copycat:{bot_id}:trade_history")
+    logger.info(f"CopyCatBot executor for bot {bot_id} started, reading signals from {signal_bus.stream} as {consumer}")
 
     while True:
         try:
-            signal = redis_client.blpop(queue_name, timeout=10)
+            entries = signal_bus.read(consumer, block_ms=10000)
+
+            if not entries:
+                logger.info(f"No signals in {signal_bus.stream}, waiting...")
+                continue
 
-            if signal:
-                _, trade_signal = signal  # Extract trade signal
+            for entry_id, trade_signal in entries:
 
                 logger.info(f"Signal {trade_signal} being processed by CopyCatBot executor")
 
-                # Record this trade in history
-                record_trade(redis_client, bot_id, trade_signal)
-                
-                # Risk management check before executing trades
-                if is_trade_safe(redis_client, bot_id, trade_signal):
-                    process_trade_for_all(trade_signal, bot_id)
-                else:
-                    logger.warning(f"Trade {trade_signal} rejected by risk management")
-                    # Update trade status to rejected
-                    update_trade_status(redis_client, bot_id, trade_signal, "rejected")
-            else:
-                logger.info(f"No signals in {queue_name}, waiting...")
+                with signal_bus.holding(entry_id, consumer):
+                    if signal_bus.started(entry_id):
+                        # A crashed executor already recorded and approved this trade, finish the remaining subscribers
+                        process_trade_for_all(trade_signal, bot_id, signal_bus, entry_id)
+
+                    else:
+                        # Record this trade in history
+                        record_trade(redis_client, bot_id, trade_signal)
+                    
+                        # Risk management check before executing trades
+                        if is_trade_safe(redis_client, bot_id, trade_signal):
+                            process_trade_for_all(trade_signal, bot_id, signal_bus, entry_id)
+                        else:
+                            logger.warning(f"Trade {trade_signal} rejected by risk management")
+                            # Update trade status to rejected
+                            update_trade_status(redis_client, bot_id, trade_signal, "rejected")
+
+                # Done with this signal, otherwise it gets redelivered
+                signal_bus.ack(entry_id)
 
         except Exception as e:
             logger.error(f"Error in execute_trades for CopyCatBot {bot_id}: {e}")
 
-def record_trade(redis_client, bot_id, trade_signal):
+def record_trade(redis_client, bot_id, trade_signal: Signal):
     """Record trade in history for performance tracking"""
     
-    # Parse the signal
-    try:
-        signal_id, action, crypto = trade_signal.split(":")
-    except ValueError:
-        logger.error(f"Invalid signal format: {trade_signal}")
-        return
-    
-    trade_data = {
-        "signal": trade_signal,
-        "signal_id": signal_id,
-        "action": action,
-        "crypto": crypto,
-        "timestamp": time.time(),
-        "status": "pending",
-        "executions": []  # List to track executions for different users
-    }
-    
-    # Add to a list of recent trades
-    redis_client.lpush(f"copycat:{bot_id}:trade_history", json.dumps(trade_data))
-    
-    # Trim the list to keep only recent trades
-    redis_client.ltrim(f"copycat:{bot_id}:trade_history", 0, 99)  # Keep last 100 trades
+    # Keeps the last 100 trades
+    TradeHistory(redis_client, bot_id).record_trade(trade_signal)
 
-def is_trade_safe(redis_client, bot_id, trade_signal):
-    """Perform risk management checks before executing a trade"""
+def is_trade_safe(redis_client, bot_id, trade_signal: Signal):
+    """Perform risk management checks before executing a trade, a safe trade counts towards the next checks"""
     
-    # Parse the signal
-    try:
-        signal_id, action, crypto = trade_signal.split(":")
-    except ValueError:
-        logger.error(f"Invalid signal format: {trade_signal}")
-        return False
+    crypto = trade_signal.base_currency
     
     # Ensure we're only dealing with Bitcoin
     if crypto != "BTC":
         logger.warning(f"Trade rejected: CopyCatBot only trades Bitcoin, not {crypto}")
         return False
     
-    # Get recent trades
-    recent_trades = redis_client.lrange(f"copycat:{bot_id}:trade_history", 0, 19)  # Last 20 trades
-    
-    # Count recent trades and their types
-    trade_count = 0
-    buy_count = 0
-    sell_count = 0
-    
-    for trade_json in recent_trades:
-        try:
-            trade = json.loads(trade_json)
-            if trade.get("crypto") == "BTC":
-                trade_count += 1
-                if trade.get("action") == "BUY":
-                    buy_count += 1
-                elif trade.get("action") == "SELL":
-                    sell_count += 1
-        except:
-            pass
-    
-    # Risk management rules
-    
-    # 1. Limit frequency of trades
-    if trade_count >= 6:  # No more than 6 trades in last 20 recorded signals
-        recent_timestamps = [json.loads(t).get("timestamp", 0) for t in recent_trades[:6]]
-        if min(recent_timestamps) > time.time() - 3600:  # All 6 happened within the last hour
-            logger.warning("Trade rejected: Too many trades in the last hour")
-            return False
-    
-    # 2. Implement a timeout between trades
-    if recent_trades:
-        try:
-            last_trade = json.loads(recent_trades[0])
-            last_trade_time = last_trade.get("timestamp", 0)
-            
-            # Require at least 10 minutes between trades
-            if time.time() - last_trade_time < 600:
-                logger.warning(f"Trade rejected: Minimum time between trades not met ({time.time() - last_trade_time} seconds)")
-                return False
-        except:
-            pass
-    
-    # 3. Balance of buy/sell trades
-    if action == "BUY" and buy_count > sell_count + 5:
-        logger.warning("Trade rejected: Too many BUY orders without corresponding SELL orders")
-        return False
-    
-    if action == "SELL" and sell_count > buy_count + 5:
-        logger.warning("Trade rejected: Too many SELL orders without corresponding BUY orders")
-        return False
-    
-    # 4. Market hours check (optional)
+    # 4. Market hours check (optional), before anything is counted
     current_hour = time.localtime().tm_hour
     if current_hour >= 22 or current_hour < 4:
         logger.warning("Trade rejected: Outside of active trading hours")
         return False
     
+    # 1-3. Frequency, minimum time between trades and buy/sell balance, an accepted trade is counted right away
+    accepted, reason = RiskState(redis_client, bot_id).check_and_record(trade_signal)
+
+    if not accepted:
+        logger.warning(f"Trade rejected: {reason}")
+        return False
+    
     return True
 
-def process_trade_for_all(signal: str, bot_id: int):
+def process_trade_for_all(signal: Signal, bot_id: int, signal_bus: SignalBus, entry_id: str):
     """Execute the trade for all subscribers of the CopyCatBot"""
 
-    # Parse the signal
-    try:
-        signal_id, action, crypto = signal.split(":")
-    except ValueError:
-        logger.error(f"Invalid signal format: {signal}")
-        return
+    action = signal.side
+    crypto = signal.base_currency
     
-    # Get all users subscribed to this bot
-    with context_get_session() as db:
-        subscriptions = db.scalars(select(Subscription).where(Subscription.bot_id == bot_id)).all()
+    redis_client = get_redis_client()
+
+    # Get all users subscribed to this bot from the subscriber cache
+    subscriptions = get_subscription_cache(bot_id).get()
+
+    if subscriptions and signal_bus.started(entry_id):
+        # Skip subscribers an earlier delivery of this signal already handled
+        subscriptions = signal_bus.remaining(entry_id, subscriptions)
 
         if not subscriptions:
-            logger.warning(f"No subscribers found for bot {bot_id}")
-            update_trade_status(redis_client, bot_id, signal, "skipped_no_subscribers")
+            logger.info(f"Every subscriber already handled {signal}")
             return
 
-        logger.info(f"Processing {action} {crypto} trade for {len(subscriptions)} subscribers")
-        
-        # Get Redis client inside this function
-        redis_client = redis.StrictRedis(host=environment.REDIS_HOST, port=environment.REDIS_PORT, decode_responses=True)
+    if not subscriptions:
+        logger.warning(f"No subscribers found for bot {bot_id}")
+        update_trade_status(redis_client, bot_id, signal, "skipped_no_subscribers")
+        return
 
-        successful_executions = 0
-        failed_executions = 0
+    logger.info(f"Processing {action} {crypto} trade for {len(subscriptions)} subscribers")
 
-        for subscription in subscriptions:
-            try:
-                # Get this user's access token using TokenService
-                token_service = TokenService(user_id=subscription.user_id, db=db)
-                access_token = token_service.get_access_token(exchange_name="coinbase")
-                
-                if not access_token:
-                    logger.error(f"No access token found for user {subscription.user_id}")
-                    record_user_execution(redis_client, bot_id, signal, subscription.user_id, "failed", "No access token")
-                    failed_executions += 1
-                    continue
-
-                # Execute the trade using Coinbase API
-                result, message = execute_coinbase_trade(access_token, action, crypto, subscription.user_id)
-                
-                if result:
-                    logger.info(f"Successfully executed {action} {crypto} trade for user {subscription.user_id}")
-                    record_user_execution(redis_client, bot_id, signal, subscription.user_id, "completed", message)
-                    successful_executions += 1
-                else:
-                    logger.warning(f"Failed to execute {action} {crypto} trade for user {subscription.user_id}: {message}")
-                    record_user_execution(redis_client, bot_id, signal, subscription.user_id, "failed", message)
-                    failed_executions += 1
-                
-            except Exception as e:
-                logger.error(f"Failed to process {signal} for user {subscription.user_id}: {e}")
-                record_user_execution(redis_client, bot_id, signal, subscription.user_id, "failed", str(e))
-                failed_executions += 1
+    # Get every subscriber's access token with a single query
+    with context_get_session() as db:
+        access_tokens = TokenService.get_access_tokens((subscription.user_id for subscription in subscriptions), exchange_name="coinbase", db=db)
+
+    # Market data every subscriber's execution shares
+    market = MarketContext(signal.product_id)
+
+    # Execute for every subscriber concurrently, each one is isolated from the others
+    result = get_fanout_executor().execute(
+        signal.signal_id,
+        subscriptions,
+        lambda subscription: execute_trade_for_user(redis_client, bot_id, signal, action, crypto, subscription, access_tokens[subscription.user_id], market, signal_bus, entry_id)
+    )
+
+    logger.info(f"CopyCatBot finished {result}, {market.fetches} spot price fetches, accounts cache {ACCOUNTS_CACHE.hits} hits {ACCOUNTS_CACHE.misses} misses")
+    logger.debug(f"Coinbase latency {client_stats.snapshot()}")
+
+    # Update overall trade status
+    update_trade_status(redis_client, bot_id, signal, result.status)
+
+def execute_trade_for_user(redis_client, bot_id, signal, action, crypto, subscription, access_token, market, signal_bus, entry_id):
+    """Execute the trade for a single subscriber, returns (success, message)"""
+
+    try:
+        result, message = _execute_trade_for_user(redis_client, bot_id, signal, action, crypto, subscription, access_token, market)
+    finally:
+        signal_bus.mark_done(entry_id, subscription)
+
+    return result, message
+
+def _execute_trade_for_user(redis_client, bot_id, signal, action, crypto, subscription, access_token, market):
+
+    try:
+        if not access_token:
+            logger.error(f"No access token found for user {subscription.user_id}")
+            record_user_execution(redis_client, bot_id, signal, subscription.user_id, "failed", "No access token")
+            return False, "No access token"
+
+        # Same order id on every delivery of the signal, so a retried or redelivered order is only placed once
+        client_order_id = str(uuid.uuid5(uuid.NAMESPACE_URL, f"copycat/{bot_id}/{signal.signal_id}/{subscription.id}"))
+
+        # Execute the trade using Coinbase API
+        result, message = execute_coinbase_trade(access_token, action, crypto, subscription.user_id, market, client_order_id)
         
-        # Update overall trade status
-        if successful_executions > 0:
-            if failed_executions == 0:
-                update_trade_status(redis_client, bot_id, signal, "completed")
-            else:
-                update_trade_status(redis_client, bot_id, signal, "partially_completed")
+        if result:
+            logger.info(f"Successfully executed {action} {crypto} trade for user {subscription.user_id}")
+            record_user_execution(redis_client, bot_id, signal, subscription.user_id, "completed", message)
         else:
-            update_trade_status(redis_client, bot_id, signal, "failed")
+            logger.warning(f"Failed to execute {action} {crypto} trade for user {subscription.user_id}: {message}")
+            record_user_execution(redis_client, bot_id, signal, subscription.user_id, "failed", message)
+
+        return result, message
+        
+    except Exception as e:
+        logger.error(f"Failed to process {signal} for user {subscription.user_id}: {e}")
+        record_user_execution(redis_client, bot_id, signal, subscription.user_id, "failed", str(e))
+        return False, str(e)
 
 def record_user_execution(redis_client, bot_id, signal, user_id, status, message=""):
     """Record the result of trade execution for a specific user"""
     
-    # Find the trade in history
-    recent_trades = redis_client.lrange(f"copycat:{bot_id}:trade_history", 0, 99)
-    
-    for i, trade_json in enumerate(recent_trades):
-        trade = json.loads(trade_json)
-        
-        if trade.get("signal") == signal:
-            # Add execution record
-            execution = {
-                "user_id": user_id,
-                "status": status,
-                "message": message,
-                "timestamp": time.time()
-            }
-            
-            # Update executions list
-            executions = trade.get("executions", [])
-            executions.append(execution)
-            trade["executions"] = executions
-            
-            # Save updated trade
-            redis_client.lset(f"copycat:{bot_id}:trade_history", i, json.dumps(trade))
-            break
+    # Appended atomically, concurrent executions don't need to coordinate
+    if not TradeHistory(redis_client, bot_id).record_execution(signal, user_id, status, message):
+        logger.warning(f"Trade {signal} is no longer in the history, execution for user {user_id} not recorded")
 
 def update_trade_status(redis_client, bot_id, signal, status):
     """Update the status of a trade in the history"""
     
-    # Get recent trades
-    recent_trades = redis_client.lrange(f"copycat:{bot_id}:trade_history", 0, 99)
+    if not TradeHistory(redis_client, bot_id).update_status(signal, status):
+        logger.warning(f"Trade {signal} is no longer in the history, status {status} not recorded")
+
+def load_user_accounts(client: CoinbaseClient) -> UserAccounts:
+    """Find the user's Bitcoin and USD accounts"""
+
+    btc_account = None
+    usd_account = None
     
-    for i, trade_json in enumerate(recent_trades):
-        trade = json.loads(trade_json)
-        
-        if trade.get("signal") == signal:
-            # Update status
-            trade["status"] = status
-            trade["updated_at"] = time.time()
-            
-            # Save updated trade
-            redis_client.lset(f"copycat:{bot_id}:trade_history", i, json.dumps(trade))
-            break
+    for account in client.list_accounts():
+        if account["currency"] == "BTC":
+            btc_account = account
+        elif account["currency"] == "USD":
+            usd_account = account
 
-def execute_coinbase_trade(access_token, action, crypto, user_id):
+    return UserAccounts(
+        btc_account_id=btc_account["uuid"] if btc_account else None,
+        usd_account_id=usd_account["uuid"] if usd_account else None,
+        btc_balance=float(btc_account["available_balance"]["value"]) if btc_account else 0.0,
+        usd_balance=float(usd_account["available_balance"]["value"]) if usd_account else 0.0
+    )
+
+def execute_coinbase_trade(access_token, action, crypto, user_id, market: MarketContext, client_order_id: str):
     """Execute a trade on Coinbase using the user's access token"""
     
     try:
-        # Import the coinbase client
-        from coinbase.rest import Client
-        
-        # Create a client with the user's access token
-        client = Client(access_token=access_token)
+        # Calls go over the process wide connection pool
+        client = CoinbaseClient(access_token)
         
         # Set standard trade amount (in production, this could be configurable per user)
         # For safety, we'll use a small fixed amount
         trade_amount = 50.00  # $50 USD per trade
         
-        # Get the user's accounts
-        accounts = client.get_accounts()
-        
-        # Find the right account for Bitcoin
-        btc_account = None
-        usd_account = None
-        
-        for account in accounts.data:
-            if account.currency.code == "BTC":
-                btc_account = account
-            elif account.currency.code == "USD":
-                usd_account = account
-        
-        if not btc_account:
-            # Create a new Bitcoin account if it doesn't exist
-            btc_account = client.create_account(name="Bitcoin Wallet")
+        # Get the user's accounts, reused while signals come in bursts
+        accounts = ACCOUNTS_CACHE.get(user_id, lambda: load_user_accounts(client))
         
-        if not usd_account:
-            return False, "No USD account found"
+        if not accounts.btc_account_id or not accounts.usd_account_id:
+            # The user may add one before the next signal
+            ACCOUNTS_CACHE.invalidate(user_id)
+            return False, "No BTC or USD account found"
         
         # Execute the trade
         if action == "BUY":
             # Check if user has enough USD
-            usd_balance = float(usd_account.balance.amount)
+            usd_balance = accounts.usd_balance
             if usd_balance < trade_amount:
                 return False, f"Insufficient USD balance: {usd_balance} < {trade_amount}"
                 
-            # Execute buy
-            buy = client.buy(
-                account_id=btc_account.id,
-                amount=trade_amount,
-                currency="USD",
-                payment_method="USD Wallet"  # Use USD wallet as payment method
-            )
+            # Execute buy, paid from the USD account
+            buy = client.market_buy(market.product_id, trade_amount, client_order_id)
+
+            placed = order_id(buy)
+            if placed is None:
+                return False, f"Buy order rejected: {order_error(buy)}"
+
+            ACCOUNTS_CACHE.apply_trade(user_id, usd_delta=-trade_amount, btc_delta=0.0)
             
-            return bool(buy.id), f"Buy order executed: {buy.id}"
+            return True, f"Buy order executed: {placed}"
             
         elif action == "SELL":
             # Check if user has enough BTC to sell
-            btc_balance = float(btc_account.balance.amount)
+            btc_balance = accounts.btc_balance
             
-            # Get current price to calculate amount to sell
-            price_data = client.get_spot_price(currency_pair="BTC-USD")
-            btc_price = float(price_data.amount)
+            # Get current price to calculate amount to sell, fetched once per signal
+            btc_price = market.spot_price(lambda: client.spot_price(market.product_id))
             
             btc_amount_to_sell = trade_amount / btc_price
             
@@ -329,17 +272,21 @@ def execute_coinbase_trade(access_token, action, crypto, user_id):
                 return False, f"Insufficient BTC balance: {btc_balance} < {btc_amount_to_sell}"
                 
             # Execute sell
-            sell = client.sell(
-                account_id=btc_account.id,
-                amount=btc_amount_to_sell,
-                currency="BTC"
-            )
+            sell = client.market_sell(market.product_id, btc_amount_to_sell, client_order_id)
+
+            placed = order_id(sell)
+            if placed is None:
+                return False, f"Sell order rejected: {order_error(sell)}"
+
+            ACCOUNTS_CACHE.apply_trade(user_id, usd_delta=trade_amount, btc_delta=-btc_amount_to_sell)
             
-            return bool(sell.id), f"Sell order executed: {sell.id}"
+            return True, f"Sell order executed: {placed}"
         
         return False, "Invalid action"
         
     except Exception as e:
+        # Balances may be off after a failed call, read them again next time
+        ACCOUNTS_CACHE.invalidate(user_id)
         return False, f"Error executing Coinbase trade: {e}"
 
 def get_bot_id(argv):
@@ -0,0 +1,171 @@
+from app.utility.signal_codec import Signal
+from typing import Union
+import json
+import time
+
+
+"""Trade history of the CopyCatBot
+
+    Every trade lives in its own hash keyed by signal id, with the per user executions in a list
+    next to it, and a sorted set orders the signal ids by the time they were recorded:
+
+        copycat:{bot_id}:trades                             zset  signal_id -> timestamp
+        copycat:{bot_id}:trade:{signal_id}                  hash  signal, action, crypto, status, ...
+        copycat:{bot_id}:trade:{signal_id}:executions       list  json per user execution
+
+    Recording an execution is a single RPUSH and a status change a single HSET, so concurrent
+    executions never read or rewrite each other's records. Only the newest KEEP_TRADES trades
+    are kept."""
+
+
+KEEP_TRADES = 100
+
+
+# Adds the trade and evicts everything older than the newest ARGV[3] trades
+# KEYS[1] index, ARGV[1] trade key prefix, ARGV[2] signal id, ARGV[3] trades to keep, ARGV[4] timestamp, ARGV[5..] hash fields
+RECORD_TRADE = """
+local prefix = ARGV[1]
+redis.call('HSET', prefix .. ARGV[2], unpack(ARGV, 5))
+redis.call('ZADD', KEYS[1], ARGV[4], ARGV[2])
+
+local evicted = redis.call('ZRANGE', KEYS[1], 0, -(tonumber(ARGV[3]) + 1))
+for _, signal_id in ipairs(evicted) do
+    redis.call('DEL', prefix .. signal_id, prefix .. signal_id .. ':executions')
+end
+if #evicted > 0 then
+    redis.call('ZREMRANGEBYRANK', KEYS[1], 0, #evicted - 1)
+end
+return #evicted
+"""
+
+# Only touch trades that are still in the history, an evicted trade must not come back as a fragment
+# KEYS[1] trade hash, ARGV[1..] field value pairs
+UPDATE_TRADE = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+redis.call('HSET', KEYS[1], unpack(ARGV))
+return 1
+"""
+
+# KEYS[1] trade hash, KEYS[2] executions list, ARGV[1] execution json
+APPEND_EXECUTION = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+return redis.call('RPUSH', KEYS[2], ARGV[1])
+"""
+
+
+class TradeHistory:
+
+    def __init__(self, redis_client, bot_id: int):
+        self.redis = redis_client
+        self.bot_id = bot_id
+        self.index_key = f"copycat:{bot_id}:trades"
+        self.trade_prefix = f"copycat:{bot_id}:trade:"
+        self.__record_trade = redis_client.register_script(RECORD_TRADE)
+        self.__update_trade = redis_client.register_script(UPDATE_TRADE)
+        self.__append_execution = redis_client.register_script(APPEND_EXECUTION)
+
+    def record_trade(self, signal: Signal, status: str = "pending") -> dict:
+        """Add a new trade, evicting the oldest once there are more than KEEP_TRADES"""
+
+        timestamp = time.time()
+
+        trade = {
+            "signal": str(signal.signal_id),
+            "signal_id": signal.signal_id,
+            "action": signal.side,
+            "crypto": signal.base_currency,
+            "timestamp": timestamp,
+            "status": status
+        }
+
+        fields = [item for pair in trade.items() for item in pair]
+        self.__record_trade(keys=[self.index_key], args=[self.trade_prefix, signal.signal_id, KEEP_TRADES, timestamp, *fields])
+
+        return trade
+
+    def update_status(self, signal: Signal, status: str) -> bool:
+        """Set the overall status of a trade, False if the trade is no longer in the history"""
+
+        return bool(self.__update_trade(keys=[self.__trade_key(signal.signal_id)], args=["status", status, "updated_at", time.time()]))
+
+    def record_execution(self, signal: Signal, user_id: int, status: str, message: str = "") -> bool:
+        """Append the result of one user's execution, False if the trade is no longer in the history"""
+
+        execution = {
+            "user_id": user_id,
+            "status": status,
+            "message": message,
+            "timestamp": time.time()
+        }
+
+        trade_key = self.__trade_key(signal.signal_id)
+        return bool(self.__append_execution(keys=[trade_key, f"{trade_key}:executions"], args=[json.dumps(execution)]))
+
+    def recent(self, offset: int = 0, limit: int = 20, include_executions: bool = False) -> list[dict]:
+        """A page of trades, newest first"""
+
+        signal_ids = self.redis.zrevrange(self.index_key, offset, offset + limit - 1)
+        return self.__load(signal_ids, include_executions)
+
+    def get(self, signal_id: Union[int, str], include_executions: bool = True) -> Union[dict, None]:
+        trades = self.__load([signal_id], include_executions)
+        return trades[0] if trades else None
+
+    def count(self) -> int:
+        return self.redis.zcard(self.index_key)
+
+    def __load(self, signal_ids: list, include_executions: bool) -> list[dict]:
+
+        pipeline = self.redis.pipeline(transaction=False)
+
+        for signal_id in signal_ids:
+            trade_key = self.__trade_key(signal_id)
+            pipeline.hgetall(trade_key)
+            if include_executions:
+                pipeline.lrange(f"{trade_key}:executions", 0, -1)
+            else:
+                pipeline.llen(f"{trade_key}:executions")
+
+        results = pipeline.execute()
+        trades = []
+
+        for i in range(len(signal_ids)):
+            fields, executions = results[2 * i], results[2 * i + 1]
+
+            #evicted between the index read and the hash read
+            if not fields:
+                continue
+
+            trade = TradeHistory.__decode(fields)
+
+            if include_executions:
+                trade["executions"] = [json.loads(execution) for execution in executions]
+            else:
+                trade["execution_count"] = executions
+
+            trades.append(trade)
+
+        return trades
+
+    @staticmethod
+    def __decode(fields: dict) -> dict:
+        fields = {TradeHistory.__text(key): TradeHistory.__text(value) for key, value in fields.items()}
+
+        trade = dict(fields)
+        trade["signal_id"] = int(fields["signal_id"])
+        trade["timestamp"] = float(fields["timestamp"])
+        if "updated_at" in fields:
+            trade["updated_at"] = float(fields["updated_at"])
+
+        return trade
+
+    @staticmethod
+    def __text(value) -> str:
+        return value.decode() if isinstance(value, bytes) else value
+
+    def __trade_key(self, signal_id: Union[int, str]) -> str:
+        return f"{self.trade_prefix}{signal_id}"
@@ -0,0 +1,92 @@
+from concurrent.futures import ThreadPoolExecutor
+from collections.abc import Callable
+from importlib import import_module
+from app.utility.environment import environment
+import asyncio
+import logging
+import time
+
+
+"""Shared runtime that hosts many bots inside a single process.
+    Bots whose info.json sets "runtime": "asyncio" are not given their own generator and
+    processor processes. Instead every generator and processor becomes a task on one event
+    loop, so the bots share one copy of SQLAlchemy/redis/pandas and one set of DB and Redis
+    connection pools. A module can provide a main_async coroutine to run directly on the loop,
+    otherwise its blocking main runs on a dedicated worker thread driven by the loop. Bots that
+    are CPU heavy should stay on the default "process" runtime."""
+
+
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+
+RESTART_BACKOFF_BASE = 1.0
+RESTART_BACKOFF_MAX = 300.0
+
+
+async def _host(name: str, entry: Callable, bot_id: int, executor: ThreadPoolExecutor):
+    """Runs one generator or processor forever, restarting it with backoff if it returns or raises"""
+
+    loop = asyncio.get_running_loop()
+    failures = 0
+
+    while True:
+        started_at = time.monotonic()
+
+        try:
+            if asyncio.iscoroutinefunction(entry):
+                await entry(bot_id)
+            else:
+                await loop.run_in_executor(executor, entry, bot_id)
+            logger.warning(f"{name} returned")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"{name} crashed: {e}")
+
+        #a bot that ran long enough is considered healthy again, like the process supervisor does
+        if time.monotonic() - started_at >= environment.BOT_STABLE_UPTIME:
+            failures = 0
+
+        failures += 1
+        delay = min(RESTART_BACKOFF_MAX, RESTART_BACKOFF_BASE * 2 ** (failures - 1))
+        logger.info(f"Restarting {name} in {delay}s")
+        await asyncio.sleep(delay)
+
+
+async def run_hosted(entries: list[tuple[str, Callable, int]]):
+    """Hosts every (name, entry point, bot id) on the running event loop"""
+
+    blocking = [entry for _, entry, _ in entries if not asyncio.iscoroutinefunction(entry)]
+
+    #blocking entry points never return, each one needs its own thread
+    executor = ThreadPoolExecutor(max_workers=max(1, len(blocking)), thread_name_prefix="bot")
+
+    try:
+        await asyncio.gather(*[_host(name, entry, bot_id, executor) for name, entry, bot_id in entries])
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def load_entries(bots: list[tuple[str, int]]) -> list[tuple[str, Callable, int]]:
+    """Resolves the generator and processor entry points of every (bot folder, bot id)"""
+
+    entries = []
+
+    for bot_name, bot_id in bots:
+        for role, module_name in (("Generator", "signalGenerator"), ("Processor", "signalProcessor")):
+            module = import_module(f"app.bots.{bot_name}.{module_name}")
+            entry = getattr(module, "main_async", None) or module.main
+            entries.append((f"{bot_name}:{bot_id}:{role}", entry, bot_id))
+
+    return entries
+
+
+def main(bots: list[tuple[str, int]]):
+    """Process entry point, bots is a list of (bot folder, bot id)"""
+
+    entries = load_entries(bots)
+
+    logger.info(f"Shared runtime hosting {', '.join(name for name, _, _ in entries)}")
+
+    asyncio.run(run_hosted(entries))
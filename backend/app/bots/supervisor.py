@@ -0,0 +1,197 @@
+from multiprocessing import Process, Pipe
+from multiprocessing.connection import wait
+from collections.abc import Callable
+from typing import Union
+import threading
+import logging
+import random
+import time
+from app.utility.environment import environment
+
+
+"""Event driven supervisor for the bot processes.
+    Instead of polling is_alive() the supervisor blocks on the sentinels of every running
+    process, so an exit is noticed as soon as it happens. Crashed processes are restarted with
+    exponential backoff and a bot that keeps crashing trips a circuit breaker that holds off
+    restarts until a cooldown has passed."""
+
+
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+
+RUNNING = "running"
+BACKOFF = "backoff"
+CIRCUIT_OPEN = "circuit_open"
+STOPPED = "stopped"
+
+
+class SupervisedProcess:
+    """A process the supervisor keeps alive along with its restart bookkeeping"""
+
+    def __init__(self, name: str, target: Callable, args: tuple = ()):
+        self.name = name
+        self.target = target
+        self.args = args
+        self.process: Union[Process, None] = None
+        self.state = STOPPED
+        self.started_at: Union[float, None] = None
+        self.restarts = 0
+        self.consecutive_failures = 0
+        self.last_exit_code: Union[int, None] = None
+        self.last_exit_at: Union[float, None] = None
+        self.next_start_at: Union[float, None] = None
+
+    def start(self):
+        self.process = Process(target=self.target, args=self.args, name=self.name)
+        self.process.start()
+        self.state = RUNNING
+        self.started_at = time.time()
+        self.next_start_at = None
+
+    def uptime(self) -> float:
+        if self.state != RUNNING or self.started_at is None:
+            return 0.0
+        return time.time() - self.started_at
+
+    def status(self) -> dict:
+        return {
+            "name": self.name,
+            "pid": self.process.pid if self.process is not None and self.state == RUNNING else None,
+            "state": self.state,
+            "uptime": round(self.uptime(), 1),
+            "restarts": self.restarts,
+            "consecutive_failures": self.consecutive_failures,
+            "last_exit_code": self.last_exit_code,
+            "last_exit_at": self.last_exit_at,
+            "next_restart_in": round(max(0.0, self.next_start_at - time.time()), 1) if self.next_start_at is not None else None
+        }
+
+
+class BotSupervisor:
+    """Starts, watches and restarts the bot processes"""
+
+    def __init__(self):
+        self._entries: list[SupervisedProcess] = []
+        self._lock = threading.Lock()
+        self._wakeup_reader, self._wakeup_writer = Pipe(duplex=False)
+        self._running = False
+
+    def add(self, name: str, target: Callable, args: tuple = ()) -> SupervisedProcess:
+        """Start a new process and supervise it from now on"""
+
+        entry = SupervisedProcess(name=name, target=target, args=args)
+
+        with self._lock:
+            entry.start()
+            self._entries.append(entry)
+
+        self.__wakeup()
+        return entry
+
+    def status(self) -> list[dict]:
+        with self._lock:
+            return [entry.status() for entry in self._entries]
+
+    def run(self):
+        """Supervise until stop is called, meant to run on its own thread"""
+
+        self._running = True
+        logger.info("Bot supervisor started")
+
+        while self._running:
+
+            with self._lock:
+                sentinels = {entry.process.sentinel: entry for entry in self._entries if entry.state == RUNNING}
+                timeout = self.__time_until_next_start()
+
+            #block until a process exits, a restart is due or someone wakes us up
+            ready = wait(list(sentinels.keys()) + [self._wakeup_reader], timeout=timeout)
+
+            if self._wakeup_reader in ready:
+                while self._wakeup_reader.poll():
+                    self._wakeup_reader.recv()
+
+            if not self._running:
+                break
+
+            with self._lock:
+                for sentinel in ready:
+                    if sentinel in sentinels:
+                        self.__handle_exit(sentinels[sentinel])
+
+                self.__start_due()
+
+        logger.info("Bot supervisor stopped")
+
+    def stop(self):
+        """Stop supervising and terminate every process"""
+
+        self._running = False
+        self.__wakeup()
+
+        with self._lock:
+            for entry in self._entries:
+                if entry.process is not None and entry.process.is_alive():
+                    entry.process.terminate()
+                    entry.process.join()
+                    logger.info(f"{entry.name} has been shutdown")
+                entry.state = STOPPED
+                entry.next_start_at = None
+
+    def __wakeup(self):
+        self._wakeup_writer.send(None)
+
+    def __time_until_next_start(self) -> Union[float, None]:
+        pending = [entry.next_start_at for entry in self._entries if entry.next_start_at is not None]
+        if not pending:
+            return None
+        return max(0.0, min(pending) - time.time())
+
+    def __handle_exit(self, entry: SupervisedProcess):
+
+        if entry.state != RUNNING:
+            return
+
+        entry.process.join()
+        now = time.time()
+        uptime = now - entry.started_at
+
+        entry.last_exit_code = entry.process.exitcode
+        entry.last_exit_at = now
+
+        #a process that ran long enough is considered healthy again
+        if uptime >= environment.BOT_STABLE_UPTIME:
+            entry.consecutive_failures = 0
+        entry.consecutive_failures += 1
+
+        if entry.consecutive_failures >= environment.BOT_CIRCUIT_BREAKER_THRESHOLD:
+            #keeps crashing, leave it down for the cooldown and then try once more
+            entry.state = CIRCUIT_OPEN
+            entry.next_start_at = now + environment.BOT_CIRCUIT_BREAKER_COOLDOWN
+            logger.error(f"{entry.name} exited with {entry.last_exit_code} after {uptime:.1f}s, {entry.consecutive_failures} failures in a row, circuit open for {environment.BOT_CIRCUIT_BREAKER_COOLDOWN}s")
+            return
+
+        delay = min(environment.BOT_RESTART_BACKOFF_MAX, environment.BOT_RESTART_BACKOFF_BASE * 2 ** (entry.consecutive_failures - 1))
+        delay = delay * random.uniform(0.8, 1.2)  #jitter so crashed bots don't restart in lockstep
+
+        entry.state = BACKOFF
+        entry.next_start_at = now + delay
+        logger.warning(f"{entry.name} exited with {entry.last_exit_code} after {uptime:.1f}s, restarting in {delay:.1f}s")
+
+    def __start_due(self):
+
+        if not self._running:
+            return
+
+        now = time.time()
+
+        for entry in self._entries:
+            if entry.state in (BACKOFF, CIRCUIT_OPEN) and entry.next_start_at is not None and entry.next_start_at <= now:
+                try:
+                    entry.start()
+                    entry.restarts += 1
+                    logger.info(f"{entry.name} restarted (restart {entry.restarts})")
+                except Exception as e:
+                    logger.error(f"Unable to restart {entry.name}: {e}")
+                    entry.next_start_at = now + environment.BOT_RESTART_BACKOFF_MAX
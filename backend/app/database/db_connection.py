@@ -1,20 +1,211 @@
 from sqlalchemy.orm import declarative_base, sessionmaker, Session
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, Engine, make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncEngine, AsyncSession
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+from typing import AsyncIterator, Union
 from app.utility.environment import environment
-from contextlib import contextmanager
+from contextlib import contextmanager, asynccontextmanager
+import threading
+import time
+import os
 
 
 DATABASE_URL = environment.POSTGRESQL_CONNECTION_STRING
 
-engine = create_engine(DATABASE_URL, echo=False)
+#same database through asyncpg, used by the async api routes
+ASYNC_DATABASE_URL = make_url(DATABASE_URL).set(drivername="postgresql+asyncpg")
+
+#the api process and the bot processes it forks size their pools separately
+API_ROLE = "api"
+BOT_ROLE = "bot"
+
+
+class PoolStats:
+    """How long checkouts wait on the pool of this process"""
+
+    def __init__(self):
+        self.checkouts = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, wait: float, timed_out: bool = False):
+        with self._lock:
+            self.checkouts += 1
+            self.timeouts += timed_out
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            return {
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "avg_wait_ms": round(self.total_wait / self.checkouts * 1000, 3) if self.checkouts else 0.0,
+                "max_wait_ms": round(self.max_wait * 1000, 3)
+            }
+
+
+pool_stats = PoolStats()
+async_pool_stats = PoolStats()
+
+
+class TimedPool:
+    """Pool mixin that records how long every checkout waited, including opening a new connection"""
+
+    def stats(self) -> PoolStats:
+        return pool_stats
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            connection = super().connect()
+        except Exception:
+            self.stats().record(time.perf_counter() - start, timed_out=True)
+            raise
+        self.stats().record(time.perf_counter() - start)
+        return connection
+
+
+class TimedQueuePool(TimedPool, QueuePool):
+    pass
+
+
+class TimedAsyncQueuePool(TimedPool, AsyncAdaptedQueuePool):
+
+    def stats(self) -> PoolStats:
+        return async_pool_stats
+
+
+def pool_settings(role: str) -> dict:
+    if role == BOT_ROLE:
+        return {"pool_size": environment.DB_POOL_SIZE_BOT, "max_overflow": environment.DB_MAX_OVERFLOW_BOT}
+    return {"pool_size": environment.DB_POOL_SIZE_API, "max_overflow": environment.DB_MAX_OVERFLOW_API}
+
+
+def async_pool_settings(role: str) -> dict:
+    """The asyncpg pool sits next to the sync one, only the api process has it"""
+
+    if role == BOT_ROLE:
+        return {"pool_size": 0, "max_overflow": 0}
+    return pool_settings(API_ROLE)
+
+
+def create_role_engine(role: str) -> Engine:
+    return create_engine(
+        DATABASE_URL,
+        echo=False,
+        poolclass=TimedQueuePool,
+        pool_pre_ping=environment.DB_POOL_PRE_PING,
+        pool_recycle=environment.DB_POOL_RECYCLE,
+        pool_timeout=environment.DB_POOL_TIMEOUT,
+        **pool_settings(role)
+    )
+
+
+pool_role = API_ROLE
+engine = create_role_engine(pool_role)
 
 
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+#objects stay readable after a commit, lazy loads are not possible on an async session
+AsyncSessionLocal = async_sessionmaker(autoflush=False, expire_on_commit=False, class_=AsyncSession)
+
+#created on first use, only the api process serves async routes
+async_engine: Union[AsyncEngine, None] = None
+
 Base = declarative_base()
 
 
+def configure_engine(role: str):
+    """Replace this process's engine with one sized for the role"""
+    global engine, pool_role
+
+    old_engine = engine
+    pool_role = role
+    engine = create_role_engine(role)
+    SessionLocal.configure(bind=engine)
+
+    #connections inherited over a fork belong to the parent, drop them without closing them
+    old_engine.dispose(close=False)
+
+
+def get_async_engine() -> AsyncEngine:
+    global async_engine
+
+    if async_engine is None:
+        async_engine = create_async_engine(
+            ASYNC_DATABASE_URL,
+            echo=False,
+            poolclass=TimedAsyncQueuePool,
+            pool_pre_ping=environment.DB_POOL_PRE_PING,
+            pool_recycle=environment.DB_POOL_RECYCLE,
+            pool_timeout=environment.DB_POOL_TIMEOUT,
+            **async_pool_settings(API_ROLE)
+        )
+        AsyncSessionLocal.configure(bind=async_engine)
+
+    return async_engine
+
+
+async def dispose_async_engine():
+    global async_engine
+
+    if async_engine is not None:
+        await async_engine.dispose()
+        async_engine = None
+
+
+def _after_fork_in_child():
+    global pool_stats, async_pool_stats, async_engine
+    pool_stats = PoolStats()
+    async_pool_stats = PoolStats()
+    configure_engine(BOT_ROLE)
+
+    #asyncpg connections belong to the parent's event loop
+    if async_engine is not None:
+        async_engine.sync_engine.dispose(close=False)
+        async_engine = None
+
+
+#bot processes are forked from the api process
+os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+def get_pool_status() -> dict:
+    """Pool sizing and checkout stats of this process
+
+        max_connections counts the sync pool and the async pool, the async one even before its
+        first use since the api process opens it on the first async route"""
+
+    settings = pool_settings(pool_role)
+    async_settings = async_pool_settings(pool_role)
+    async_max = async_settings["pool_size"] + async_settings["max_overflow"]
+
+    return {
+        "pid": os.getpid(),
+        "role": pool_role,
+        "pool_size": engine.pool.size(),
+        "max_overflow": settings["max_overflow"],
+        "max_connections": settings["pool_size"] + settings["max_overflow"] + async_max,
+        "checked_out": engine.pool.checkedout(),
+        "checked_in": engine.pool.checkedin(),
+        **pool_stats.as_dict(),
+        "async": {
+            "created": async_engine is not None,
+            "pool_size": async_settings["pool_size"],
+            "max_overflow": async_settings["max_overflow"],
+            "max_connections": async_max,
+            "checked_out": async_engine.pool.checkedout() if async_engine is not None else 0,
+            "checked_in": async_engine.pool.checkedin() if async_engine is not None else 0,
+            **async_pool_stats.as_dict()
+        }
+    }
+
+
 def get_session() -> Session:
     """Used by Fast API routes for dependency injection"""
     db = SessionLocal()
@@ -23,6 +214,19 @@ def get_session() -> Session:
     finally:
         db.close()
 
+async def get_async_session() -> AsyncIterator[AsyncSession]:
+    """Used by async Fast API routes for dependency injection"""
+    get_async_engine()
+    async with AsyncSessionLocal() as db:
+        yield db
+
+@asynccontextmanager
+async def async_context_get_session() -> AsyncIterator[AsyncSession]:
+    """Used by async code outside route dependencies, like websockets"""
+    get_async_engine()
+    async with AsyncSessionLocal() as db:
+        yield db
+
 @contextmanager
 def context_get_session() -> Session:
     """Used by trade executors"""
@@ -31,4 +235,3 @@ def context_get_session() -> Session:
         yield db
     finally:
         db.close()
-    
@@ -58,10 +58,13 @@ class Exchange_Auth_Token(Base):
         UniqueConstraint("user_id", "exchange_name", name="_exchange_user_unique_constriant"),
     )
 
-    def is_expired(self):
+    #tokens are treated as expired this many seconds early
+    EXPIRY_BUFFER = 120
+
+    def is_expired(self, buffer_seconds: int = EXPIRY_BUFFER):
         #what is buffer seconds
         current_time = int(datetime.now(timezone.utc).timestamp())
-        return self.expires_at <= current_time + 120 #because UNIX timestamps count up, 2 min buffer
+        return self.expires_at <= current_time + buffer_seconds #because UNIX timestamps count up, 2 min buffer by default
     
 
     def get_lock_id(self) -> int:
@@ -1,13 +1,13 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.utility.environment import environment
-from app.database.db_connection import engine, Base
+from app.database.db_connection import engine, Base, dispose_async_engine
 import app.database.models #this ensures that the schema is loaded before initializing the db
 from app.routers import user_router, coinbase_router, bot_router
 import logging, coloredlogs
 from app.bots import botManager
+from app.utility.token_refresher import token_refresher
 import threading
-import os
 
 
 # Logging
@@ -34,6 +34,9 @@ def startup():
         Base.metadata.drop_all(bind=engine)  #Only for development purposes
     Base.metadata.create_all(bind=engine)
 
+    #refresh exchange tokens ahead of time so trades don't wait on oauth
+    token_refresher.start()
+
     botManager.startup_all_bots()
 
 
@@ -44,16 +47,16 @@ def startup():
 def shutdown():
     '''Tasks to be done on shutdown'''
 
-    #signal bot monitor thread to stop
-    os.environ["BOT_MONITOR"] = "False"
-
-
+    #stops the bot monitor thread and every bot process
     botManager.shutdown_all_bots()
 
+    token_refresher.stop()
+
     engine.dispose()
 
 app.add_event_handler("startup", startup)
 app.add_event_handler("shutdown", shutdown)
+app.add_event_handler("shutdown", dispose_async_engine)
 
 
 app.include_router(user_router.router)
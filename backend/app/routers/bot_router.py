@@ -1,7 +1,7 @@
 from fastapi import APIRouter, HTTPException, status, Request, Depends
 from app.utility import bot_helper, user_helper, coinbase_helper
-from sqlalchemy.orm import Session
-from app.database.db_connection import get_session
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database.db_connection import get_async_session
 from fastapi.responses import JSONResponse, HTMLResponse
 from app.utility.environment import environment
 from authlib.integrations.requests_client import OAuth2Session
@@ -9,6 +9,10 @@ from coinbase.wallet.client import OAuthClient
 from app.utility.TokenService import TokenService
 import logging
 from app.database.schemas import Subscription
+from app.bots import botManager
+from app.bots.copycat.tradeHistory import TradeHistory
+from app.utility.redis_helper import get_redis_client
+import asyncio
 
 
 
@@ -22,17 +26,53 @@ logger = logging.getLogger()
 
 
 @router.get("", summary="Get information on all the currently available bots")
-def bots(db: Session = Depends(get_session)):
-    return  bot_helper.get_all_bots(db=db)
+async def bots(db: AsyncSession = Depends(get_async_session)):
+    return  await bot_helper.get_all_bots_async(db=db)
+
+
+@router.get("/status", summary="Get restart counts and uptime of every bot process")
+def bots_status():
+    return botManager.get_bot_status()
+
+
+@router.get("/db-pool", summary="Get database pool usage and the connections every process may open")
+def bots_db_pool():
+    return botManager.get_db_pool_status()
+
+
+@router.get("/{bot_id}/trades", summary="Get a page of a bot's trade history, newest first")
+async def bot_trades(bot_id: int, offset: int = 0, limit: int = 20, executions: bool = False, db: AsyncSession = Depends(get_async_session)):
+
+    bot = await bot_helper.get_bot_by_id_async(id=bot_id, db=db)
+
+    #only the copycat bot keeps a trade history
+    if bot is None or bot.name != "copycat":
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"No trade history for bot {bot_id}"
+        )
+
+    limit = max(1, min(limit, 100))
+    history = TradeHistory(get_redis_client(), bot_id)
+
+    trades = await asyncio.to_thread(history.recent, max(0, offset), limit, executions)
+    total = await asyncio.to_thread(history.count)
+
+    return {"total": total, "offset": offset, "limit": limit, "trades": trades}
+
+
+@router.get("/{bot_id}/metrics", summary="Get the runtime metrics a bot reports, such as model latency")
+async def bot_metrics(bot_id: int):
+    return await asyncio.to_thread(get_redis_client().hgetall, f"bot{bot_id}:metrics")
 
 
 @router.post("/subscribe", summary="Subscribe to a bot")
-def bots(data: Subscription, request: Request, db: Session = Depends(get_session)):
+async def bots(data: Subscription, request: Request, db: AsyncSession = Depends(get_async_session)):
     
     token = request.cookies.get("access_token")
 
     #verify the current user
-    user_data = user_helper.get_current_user(token, db)
+    user_data = await user_helper.get_current_user_async(token, db)
 
     if user_data is None:
         raise HTTPException(
@@ -41,7 +81,7 @@ def bots(data: Subscription, request: Request, db: Session = Depends(get_session
         )
     
     #verify bot_id
-    bot = bot_helper.get_bot_by_id(id=data.bot_id, db=db)
+    bot = await bot_helper.get_bot_by_id_async(id=data.bot_id, db=db)
 
     if bot is None:
         logger.error(f"Bot {data.bot_id} not found")
@@ -51,7 +91,7 @@ def bots(data: Subscription, request: Request, db: Session = Depends(get_session
         )
     
     #verify portfolio_uuid and that the required types are present
-    portfolios = coinbase_helper.get_user_portfolios(user = user_data, db=db)
+    portfolios = await coinbase_helper.get_user_portfolios_async(user=user_data)
 
     if portfolios is None:
         logger.error(f"No portfolios for {user_data.id} found")
@@ -80,7 +120,7 @@ def bots(data: Subscription, request: Request, db: Session = Depends(get_session
                     detail=f"Missing assets {required_assets} in portfolio {portfolio['portfolio']['name']}. Unable to subscribe to Bot {bot.name}"
                 )
             else:
-                subscription = bot_helper.subscribe_user_to_bot(user=user_data, bot=bot, portfolio_uuid=data.portfolio_uuid, db=db)
+                subscription = await bot_helper.subscribe_user_to_bot_async(user=user_data, bot=bot, portfolio_uuid=data.portfolio_uuid, db=db)
 
                 if subscription is None:
                     logger.error(f"User {user_data.id} can't be subscribed to bot {bot.id}, either already subscribed or db error")
@@ -98,12 +138,12 @@ def bots(data: Subscription, request: Request, db: Session = Depends(get_session
 
 
 @router.post("/unsubscribe", summary="Unsubscribe from a bot")
-def bots(data: Subscription, request: Request, db: Session = Depends(get_session)):
+async def bots(data: Subscription, request: Request, db: AsyncSession = Depends(get_async_session)):
     
     token = request.cookies.get("access_token")
 
     #verify the current user
-    user_data = user_helper.get_current_user(token, db)
+    user_data = await user_helper.get_current_user_async(token, db)
 
     if user_data is None:
         raise HTTPException(
@@ -111,5 +151,5 @@ def bots(data: Subscription, request: Request, db: Session = Depends(get_session
             detail="Invalid or expired Token"
         )
 
-    return bot_helper.unsubscribe_user_from_bot(user=user_data, portfolio_uuid=data.portfolio_uuid, db=db)
+    return await bot_helper.unsubscribe_user_from_bot_async(user=user_data, portfolio_uuid=data.portfolio_uuid, db=db)
 
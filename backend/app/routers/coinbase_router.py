@@ -1,12 +1,13 @@
 from fastapi import APIRouter, HTTPException, status, Request, Depends, WebSocket, WebSocketDisconnect
 from app.utility import user_helper, coinbase_helper
-from sqlalchemy.orm import Session
-from app.database.db_connection import get_session
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database.db_connection import get_async_session, async_context_get_session
 from fastapi.responses import JSONResponse, HTMLResponse
 from app.utility.environment import environment
 from authlib.integrations.requests_client import OAuth2Session
 from coinbase.wallet.client import OAuthClient
 from app.utility.TokenService import TokenService
+from app.utility.CoinbaseClient import client_stats
 import asyncio
 import logging
 
@@ -30,15 +31,15 @@ logger = logging.getLogger()
 
 
 @router.get("/oauth-redirect-url", summary="Returns URL to Coinbase to initiate oauth")
-def login_coinbase(request: Request, db: Session = Depends(get_session)):
+async def login_coinbase(request: Request, db: AsyncSession = Depends(get_async_session)):
 
     token = request.cookies.get("access_token")
     
     #verify the current user
-    user_data = user_helper.get_current_user(token, db)
+    user_data = await user_helper.get_current_user_async(token, db)
 
     #clear previous state entries for this user from the db
-    clear_states = coinbase_helper.clear_all_states_for_user(user=user_data, db=db)
+    clear_states = await coinbase_helper.clear_all_states_for_user_async(user=user_data, db=db)
 
     if not clear_states:
         raise HTTPException(
@@ -48,9 +49,7 @@ def login_coinbase(request: Request, db: Session = Depends(get_session)):
     
 
     #don't allow user to link if they already have tokens here
-    token_service = TokenService(user_id=user_data.id, db=db)
-
-    coinbase_access_token = token_service.get_access_token(exchange_name="coinbase")
+    coinbase_access_token = await TokenService.get_access_token_async(user_id=user_data.id, exchange_name="coinbase")
 
     if coinbase_access_token is not None:
         raise HTTPException(
@@ -62,7 +61,7 @@ def login_coinbase(request: Request, db: Session = Depends(get_session)):
     coinbase_auth_url, state = oauth_session_coinbase.create_authorization_url(url=environment.COINBASE_OAUTH_URL)
 
     #store state in the db
-    stored_state = coinbase_helper.store_state_in_db(user=user_data, state=state, db=db)
+    stored_state = await coinbase_helper.store_state_in_db_async(user=user_data, state=state, db=db)
     if stored_state is None:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -78,7 +77,7 @@ def login_coinbase(request: Request, db: Session = Depends(get_session)):
     return response
 
 @router.get("/callback", summary="Coinbase redirect uri", include_in_schema=False)
-def coinbase_callback(request: Request, db: Session = Depends(get_session)):
+async def coinbase_callback(request: Request, db: AsyncSession = Depends(get_async_session)):
 
     state_exception = None
 
@@ -102,7 +101,7 @@ def coinbase_callback(request: Request, db: Session = Depends(get_session)):
 
     
     #retrieve state from db
-    stored_oauth = coinbase_helper.get_state_by_state(state=url_state, db=db)
+    stored_oauth = await coinbase_helper.get_state_by_state_async(state=url_state, db=db)
 
     if stored_oauth is None:
         state_exception = HTTPException(
@@ -124,7 +123,7 @@ def coinbase_callback(request: Request, db: Session = Depends(get_session)):
 
     #retieve the current user
     access_token = request.cookies.get("access_token")
-    user_data = user_helper.get_current_user(token=access_token, db=db)
+    user_data = await user_helper.get_current_user_async(token=access_token, db=db)
 
     #state must match current user
     if stored_oauth.user_id != user_data.id:
@@ -148,9 +147,7 @@ def coinbase_callback(request: Request, db: Session = Depends(get_session)):
         )
         return HTMLResponse(content=coinbase_helper.get_callback_status_page(state_exception), status_code=state_exception.status_code)
 
-    token_service = TokenService(user_id=user_data.id, db=db)
-
-    stored_token_status = token_service.exchange_oauth_code_for_tokens(code=code, exchange_name="coinbase")
+    stored_token_status = await TokenService.exchange_oauth_code_for_tokens_async(user_id=user_data.id, code=code, exchange_name="coinbase")
 
 
     if stored_token_status:
@@ -163,16 +160,14 @@ def coinbase_callback(request: Request, db: Session = Depends(get_session)):
         return HTMLResponse(content=coinbase_helper.get_callback_status_page(state_exception), status_code=state_exception.status_code)
 
 @router.get("/linked", summary="Is the current user linked to coinbase?")
-def login_coinbase(request: Request, db: Session = Depends(get_session)):
+async def login_coinbase(request: Request, db: AsyncSession = Depends(get_async_session)):
 
     token = request.cookies.get("access_token")
     
     #verify the current user
-    user_data = user_helper.get_current_user(token, db)
+    user_data = await user_helper.get_current_user_async(token, db)
     
-    token_service = TokenService(user_id=user_data.id, db=db)
-
-    coinbase_access_token = token_service.get_access_token(exchange_name="coinbase")
+    coinbase_access_token = await TokenService.get_access_token_async(user_id=user_data.id, exchange_name="coinbase")
 
     if coinbase_access_token is None:
         return {"linked" : False}
@@ -180,12 +175,12 @@ def login_coinbase(request: Request, db: Session = Depends(get_session)):
         return {"linked": True}
 
 @router.get("/info", summary="Get current user's coinbase account info")
-def coinbase_account(request: Request, db: Session = Depends(get_session)):
+async def coinbase_account(request: Request, db: AsyncSession = Depends(get_async_session)):
     
     token = request.cookies.get("access_token")
 
     #verify the current user
-    user_data = user_helper.get_current_user(token, db)
+    user_data = await user_helper.get_current_user_async(token, db)
 
     if user_data is None:
         raise HTTPException(
@@ -193,9 +188,7 @@ def coinbase_account(request: Request, db: Session = Depends(get_session)):
             detail="Invalid or expired Token"
         )
     
-    token_service = TokenService(user_id=user_data.id, db=db)
-
-    coinbase_access_token = token_service.get_access_token(exchange_name="coinbase")
+    coinbase_access_token = await TokenService.get_access_token_async(user_id=user_data.id, exchange_name="coinbase")
 
     print(coinbase_access_token)
 
@@ -209,15 +202,15 @@ def coinbase_account(request: Request, db: Session = Depends(get_session)):
     #establish client
     coinbase_client = OAuthClient(access_token=coinbase_access_token, refresh_token="Our App Handles Refreshing")
     
-    return coinbase_client.get_current_user()
+    return await asyncio.to_thread(coinbase_client.get_current_user)
 
 @router.get("/accounts", summary="Get current user's coinbase accounts")
-def coinbase_account(request: Request, db: Session = Depends(get_session)):
+async def coinbase_account(request: Request, db: AsyncSession = Depends(get_async_session)):
     
     token = request.cookies.get("access_token")
 
     #verify the current user
-    user_data = user_helper.get_current_user(token, db)
+    user_data = await user_helper.get_current_user_async(token, db)
 
     if user_data is None:
         raise HTTPException(
@@ -225,9 +218,7 @@ def coinbase_account(request: Request, db: Session = Depends(get_session)):
             detail="Invalid or expired Token"
         )
     
-    token_service = TokenService(user_id=user_data.id, db=db)
-
-    coinbase_access_token = token_service.get_access_token(exchange_name="coinbase")
+    coinbase_access_token = await TokenService.get_access_token_async(user_id=user_data.id, exchange_name="coinbase")
 
     if coinbase_access_token is None:
         raise HTTPException(
@@ -241,15 +232,15 @@ def coinbase_account(request: Request, db: Session = Depends(get_session)):
 
     
     
-    return coinbase_client.get_accounts()
+    return await asyncio.to_thread(coinbase_client.get_accounts)
 
 @router.get("/portfolios", summary="Get current user's coinbase portfolios")
-def coinbase_account(request: Request, db: Session = Depends(get_session)):
+async def coinbase_account(request: Request, db: AsyncSession = Depends(get_async_session)):
     
     token = request.cookies.get("access_token")
 
     #verify the current user
-    user_data = user_helper.get_current_user(token, db)
+    user_data = await user_helper.get_current_user_async(token, db)
 
     if user_data is None:
         raise HTTPException(
@@ -257,7 +248,7 @@ def coinbase_account(request: Request, db: Session = Depends(get_session)):
             detail="Invalid or expired Token"
         )
     
-    portfolios = coinbase_helper.get_user_portfolios(user=user_data, db=db)
+    portfolios = await coinbase_helper.get_user_portfolios_async(user=user_data)
 
     if portfolios is None:
         logger.error(f"Unable to get portfolios for {user_data.id}")
@@ -269,9 +260,14 @@ def coinbase_account(request: Request, db: Session = Depends(get_session)):
     return portfolios
 
 
+@router.get("/http-stats", summary="Get latency and retries of the api process's Coinbase calls per endpoint")
+def coinbase_http_stats():
+    return client_stats.snapshot()
+
+
 
 @router.websocket("/ws/balance")
-async def websocket_balance_endpoint(websocket: WebSocket, db: Session = Depends(get_session)):
+async def websocket_balance_endpoint(websocket: WebSocket):
     await websocket.accept()
     logger.info("WebSocket connected")
 
@@ -285,20 +281,19 @@ async def websocket_balance_endpoint(websocket: WebSocket, db: Session = Depends
             await websocket.close(code=1008)
             return
 
-        # Authenticate user using the token
-        user = user_helper.get_current_user(token, db)
+        # Authenticate user using the token, the session is only held for this lookup
+        async with async_context_get_session() as db:
+            user = await user_helper.get_current_user_async(token, db)
+
         if not user:
             await websocket.send_json({"error": "unauthorized: invalid token"})
             await websocket.close(code=1008)
             return
-        
-        token_service = TokenService(user_id=user.id, db=db)
 
         while True:
-            coinbase_access_token = token_service.get_access_token(exchange_name="coinbase")
+            coinbase_access_token = await TokenService.get_access_token_async(user_id=user.id, exchange_name="coinbase")
             # Get the user's balance
-            balance = coinbase_helper.get_coinbase_balance(coinbase_access_token, db)
-            print(balance)
+            balance = await coinbase_helper.get_coinbase_balance_async(coinbase_access_token)
             if isinstance(balance, dict) and 'error' in balance:
                 await websocket.send_json({"error": balance['error']})
             else:
@@ -310,7 +305,3 @@ async def websocket_balance_endpoint(websocket: WebSocket, db: Session = Depends
     except Exception as e:
         logger.exception("Unexpected error in WebSocket")
         await websocket.close(code=1011)
-    finally:
-        db.close()
-        return
-
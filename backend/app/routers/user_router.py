@@ -3,8 +3,8 @@ from fastapi.responses import JSONResponse
 from app.database.schemas import UserSchema
 from app.utility import user_helper, bot_helper
 from app.utility.utils import create_access_token
-from sqlalchemy.orm import Session
-from app.database.db_connection import get_session
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database.db_connection import get_async_session
 import logging
 
 
@@ -18,9 +18,9 @@ logger = logging.getLogger()
 
 
 @router.post('/create', summary="Create a new user")
-def user_create(data: UserSchema, db: Session = Depends(get_session)):
+async def user_create(data: UserSchema, db: AsyncSession = Depends(get_async_session)):
 
-    new_user = user_helper.add_user_to_db(data, db)
+    new_user = await user_helper.add_user_to_db_async(data, db)
 
     if new_user is None:
         raise HTTPException(
@@ -29,15 +29,15 @@ def user_create(data: UserSchema, db: Session = Depends(get_session)):
         )
     
     #login the new user
-    return user_login(username=data.username, password=data.password, db=db)
+    return await user_login(username=data.username, password=data.password, db=db)
 
 @router.post('/login', summary="Login a user")
-def user_login(username: str = Form(...), password: str = Form(...), db: Session = Depends(get_session)):
+async def user_login(username: str = Form(...), password: str = Form(...), db: AsyncSession = Depends(get_async_session)):
 
     #TODO username and password are sent in plaintext in the url
     #TODO what if an access token is sent and is still valid?
 
-    user = user_helper.authenticate_user(username, password, db)
+    user = await user_helper.authenticate_user_async(username, password, db)
 
     if user is None:
         raise HTTPException(
@@ -54,7 +54,7 @@ def user_login(username: str = Form(...), password: str = Form(...), db: Session
     return response
 
 @router.post('/logout', summary="Invalidate the current access token")
-def user_logout(request: Request, db: Session = Depends(get_session)):
+async def user_logout(request: Request, db: AsyncSession = Depends(get_async_session)):
     # Get token from the request cookie.
     access_token = request.cookies.get("access_token")
     
@@ -65,19 +65,19 @@ def user_logout(request: Request, db: Session = Depends(get_session)):
         return response
 
     # Validate token; even if invalid, we'll clear it.
-    user = user_helper.get_current_user(access_token, db)
+    user = await user_helper.get_current_user_async(access_token, db)
     # You may log or handle the case of an invalid token if needed.
     response = JSONResponse(content={"status": "success"})
     response.delete_cookie("access_token")
     return response
 
 @router.get('/info', summary="Get currently logged in user information")
-def user_info(request: Request, db: Session = Depends(get_session)):
+async def user_info(request: Request, db: AsyncSession = Depends(get_async_session)):
 
     #get token from request
     access_token = request.cookies.get("access_token")
 
-    user = user_helper.get_current_user(access_token, db)
+    user = await user_helper.get_current_user_async(access_token, db)
 
     if user is None:
         raise HTTPException(
@@ -90,12 +90,12 @@ def user_info(request: Request, db: Session = Depends(get_session)):
     return user
 
 @router.get('/refresh-token', summary="Refresh a current access token")
-def refresh_token(request: Request, db: Session = Depends(get_session)):
+async def refresh_token(request: Request, db: AsyncSession = Depends(get_async_session)):
 
 
     access_token = request.cookies.get("access_token")
 
-    user = user_helper.get_current_user(access_token, db)
+    user = await user_helper.get_current_user_async(access_token, db)
 
     if user is None:
         raise HTTPException(
@@ -113,12 +113,12 @@ def refresh_token(request: Request, db: Session = Depends(get_session)):
 
 
 @router.get("/subscriptions", summary="Get this user's subscriptions")
-def bots(request: Request, db: Session = Depends(get_session)):
+async def bots(request: Request, db: AsyncSession = Depends(get_async_session)):
 
     #get token from request
     access_token = request.cookies.get("access_token")
 
-    user = user_helper.get_current_user(access_token, db)
+    user = await user_helper.get_current_user_async(access_token, db)
 
     if user is None:
         raise HTTPException(
@@ -129,4 +129,4 @@ def bots(request: Request, db: Session = Depends(get_session)):
 
 
 
-    return  bot_helper.get_subscriptions_for_user(user=user, db=db)
\ No newline at end of file
+    return  await bot_helper.get_subscriptions_for_user_async(user=user, db=db)
\ No newline at end of file
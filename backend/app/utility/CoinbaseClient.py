@@ -0,0 +1,282 @@
+from requests.adapters import HTTPAdapter
+from collections import deque
+from typing import Union
+from app.utility.environment import environment
+import requests
+import threading
+import random
+import time
+import os
+import logging
+
+
+
+logger = logging.getLogger()
+
+
+#status codes worth another attempt, everything else is returned or raised right away
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+#latency samples kept per endpoint for the percentiles
+LATENCY_SAMPLES = 512
+
+
+class CoinbaseError(Exception):
+    """A Coinbase call that failed after every attempt"""
+
+    def __init__(self, endpoint: str, status: Union[int, None], message: str):
+        super().__init__(f"{status} on {endpoint}: {message}")
+        self.endpoint = endpoint
+        self.status = status
+
+
+class EndpointStats:
+    """Latency and outcome counters of one endpoint"""
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.samples: deque = deque(maxlen=LATENCY_SAMPLES)
+
+    def snapshot(self) -> dict:
+        samples = sorted(self.samples)
+
+        def percentile(p: float) -> Union[float, None]:
+            if not samples:
+                return None
+            return round(samples[min(len(samples) - 1, int(p * len(samples)))] * 1000, 2)
+
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "retries": self.retries,
+            "avg_ms": round(self.total_seconds / self.calls * 1000, 2) if self.calls else None,
+            "p50_ms": percentile(0.50),
+            "p95_ms": percentile(0.95),
+            "max_ms": round(self.max_seconds * 1000, 2)
+        }
+
+
+class ClientStats:
+    """Per endpoint stats of every Coinbase call made by this process"""
+
+    def __init__(self):
+        self._endpoints: dict[str, EndpointStats] = {}
+        self._lock = threading.Lock()
+
+    def record(self, endpoint: str, seconds: float, retries: int, failed: bool):
+        with self._lock:
+            stats = self._endpoints.get(endpoint)
+            if stats is None:
+                stats = self._endpoints[endpoint] = EndpointStats()
+
+            stats.calls += 1
+            stats.retries += retries
+            stats.errors += int(failed)
+            stats.total_seconds += seconds
+            stats.max_seconds = max(stats.max_seconds, seconds)
+            stats.samples.append(seconds)
+
+    def snapshot(self) -> dict[str, dict]:
+        with self._lock:
+            return {endpoint: stats.snapshot() for endpoint, stats in sorted(self._endpoints.items())}
+
+    def reset(self):
+        with self._lock:
+            self._endpoints.clear()
+
+
+client_stats = ClientStats()
+
+
+_session: Union[requests.Session, None] = None
+_session_pid: Union[int, None] = None
+_session_guard = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    """Returns the keep-alive session every Coinbase call in this process goes through"""
+    global _session, _session_pid
+
+    with _session_guard:
+        #sockets must not be shared with a forked child, it opens its own
+        if _session is None or _session_pid != os.getpid():
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=environment.COINBASE_HTTP_POOL_SIZE, pool_block=False)
+            _session.mount("https://", adapter)
+            _session.mount("http://", adapter)
+            _session_pid = os.getpid()
+            client_stats.reset()
+        return _session
+
+
+class CoinbaseClient:
+    """Coinbase api calls on behalf of one user, over the process wide connection pool
+
+        The client itself is cheap, make one per access token and call. Failed connections,
+        timeouts, 429 and 5xx answers are retried with jittered exponential backoff. Requests
+        that create something are only retried when they carry an idempotency key such as a
+        client order id, so a retry can never place an order twice."""
+
+    def __init__(self, access_token: Union[str, None]):
+        #None for the public market endpoints
+        self.token = access_token
+        self.session = get_session()
+
+    def request(self, method: str, path: str, endpoint: Union[str, None] = None, payload: Union[dict, None] = None,
+                params: Union[dict, None] = None, headers: Union[dict, None] = None, idempotent: Union[bool, None] = None) -> dict:
+        """Calls the api and returns the decoded json body, raises CoinbaseError once every attempt failed
+
+            endpoint names the call in the stats, pass it when the path contains ids"""
+
+        endpoint = endpoint or f"{method} {path}"
+        idempotent = method in ("GET", "HEAD", "DELETE") if idempotent is None else idempotent
+        attempts = 1 + (environment.COINBASE_HTTP_RETRIES if idempotent else 0)
+
+        request_headers = {"Content-Type": "application/json"}
+        if self.token is not None:
+            request_headers["Authorization"] = f"Bearer {self.token}"
+        if headers:
+            request_headers.update(headers)
+
+        start = time.monotonic()
+
+        for attempt in range(attempts):
+            last_attempt = attempt == attempts - 1
+            retry_after = None
+
+            try:
+                response = self.session.request(
+                    method, f"{environment.COINBASE_API_URL}{path}", json=payload, params=params,
+                    headers=request_headers, timeout=environment.COINBASE_HTTP_TIMEOUT
+                )
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if last_attempt:
+                    client_stats.record(endpoint, time.monotonic() - start, attempt, failed=True)
+                    raise CoinbaseError(endpoint, None, str(e))
+                logger.warning(f"Coinbase {endpoint} attempt {attempt + 1} failed: {e}")
+            else:
+                if response.status_code < 400:
+                    client_stats.record(endpoint, time.monotonic() - start, attempt, failed=False)
+                    return response.json() if response.content else {}
+
+                if response.status_code not in RETRY_STATUSES or last_attempt:
+                    client_stats.record(endpoint, time.monotonic() - start, attempt, failed=True)
+                    raise CoinbaseError(endpoint, response.status_code, response.text)
+
+                logger.warning(f"Coinbase {endpoint} attempt {attempt + 1} returned {response.status_code}")
+                retry_after = response.headers.get("Retry-After")
+
+            time.sleep(self.__backoff(attempt, retry_after))
+
+    @staticmethod
+    def __backoff(attempt: int, retry_after: Union[str, None]) -> float:
+        """Full jitter, so callers that failed together don't come back together"""
+
+        if retry_after is not None:
+            try:
+                return min(float(retry_after), environment.COINBASE_HTTP_BACKOFF_MAX)
+            except ValueError:
+                pass
+
+        cap = min(environment.COINBASE_HTTP_BACKOFF_MAX, environment.COINBASE_HTTP_BACKOFF_BASE * 2 ** attempt)
+        return random.uniform(0, cap)
+
+    # Advanced Trade (v3) endpoints
+
+    def get_products(self) -> list[dict]:
+        return self.request("GET", "/api/v3/brokerage/products").get("products", [])
+
+    def get_product(self, product_id: str) -> dict:
+        return self.request("GET", f"/api/v3/brokerage/products/{product_id}", endpoint="GET /api/v3/brokerage/products/{id}")
+
+    def spot_price(self, product_id: str) -> float:
+        return float(self.get_product(product_id)["price"])
+
+    def get_market_products(self, product_type: Union[str, None] = None) -> list[dict]:
+        """Every product with its ticker, from the public endpoint that needs no token"""
+
+        params = {"product_type": product_type} if product_type else None
+        return self.request("GET", "/api/v3/brokerage/market/products", params=params).get("products", [])
+
+    def get_market_candles(self, product_id: str, start: int, end: int, granularity: str = "ONE_HOUR") -> list[dict]:
+        """Candles between two unix times, oldest first, at most 350 per call, public like get_market_products"""
+
+        candles = self.request(
+            "GET", f"/api/v3/brokerage/market/products/{product_id}/candles", endpoint="GET /api/v3/brokerage/market/products/{id}/candles",
+            params={"start": str(start), "end": str(end), "granularity": granularity}
+        ).get("candles", [])
+        return sorted(candles, key=lambda candle: int(candle["start"]))
+
+    def list_accounts(self) -> list[dict]:
+        """Every account of the user, all pages"""
+
+        accounts = []
+        params = {"limit": 250}
+
+        while True:
+            page = self.request("GET", "/api/v3/brokerage/accounts", params=params)
+            accounts.extend(page.get("accounts", []))
+
+            if not page.get("has_next") or not page.get("cursor"):
+                return accounts
+
+            params = {"limit": 250, "cursor": page["cursor"]}
+
+    def list_open_orders(self, side: Union[str, None] = None) -> list[dict]:
+        params = {"order_status": "OPEN"}
+        if side is not None:
+            params["order_side"] = side
+        return self.request("GET", "/api/v3/brokerage/orders/historical/batch", params=params).get("orders", [])
+
+    def list_portfolios(self) -> list[dict]:
+        return self.request("GET", "/api/v3/brokerage/portfolios").get("portfolios", [])
+
+    def get_portfolio_breakdown(self, portfolio_uuid: str) -> dict:
+        return self.request("GET", f"/api/v3/brokerage/portfolios/{portfolio_uuid}", endpoint="GET /api/v3/brokerage/portfolios/{id}")["breakdown"]
+
+    def market_buy(self, product_id: str, quote_size: float, client_order_id: str) -> dict:
+        return self.create_order(client_order_id, product_id, "BUY", {"market_market_ioc": {"quote_size": f"{quote_size:.2f}"}})
+
+    def market_sell(self, product_id: str, base_size: float, client_order_id: str) -> dict:
+        return self.create_order(client_order_id, product_id, "SELL", {"market_market_ioc": {"base_size": f"{base_size:.8f}"}})
+
+    def limit_sell(self, product_id: str, base_size: float, limit_price: float, client_order_id: str) -> dict:
+        return self.create_order(client_order_id, product_id, "SELL", {
+            "limit_limit_gtc": {
+                "base_size":   f"{base_size:.4f}",
+                "limit_price": f"{limit_price:.4f}"
+            }
+        })
+
+    def create_order(self, client_order_id: str, product_id: str, side: str, order_configuration: dict) -> dict:
+        """Places an order, Coinbase deduplicates on client_order_id so the call is safe to retry"""
+
+        payload = {
+            "client_order_id":     client_order_id,
+            "product_id":          product_id,
+            "side":                side,
+            "order_configuration": order_configuration
+        }
+        return self.request("POST", "/api/v3/brokerage/orders", payload=payload, idempotent=True)
+
+    # Sign In With Coinbase (v2) endpoints
+
+    def list_wallet_accounts(self) -> list[dict]:
+        return self.request("GET", "/v2/accounts", headers={"CB-VERSION": "2021-10-01"}).get("data", [])
+
+
+def order_id(response: dict) -> Union[str, None]:
+    """Id of the order a create order response placed, None if Coinbase refused it"""
+
+    if response.get("success") is False:
+        return None
+    return (response.get("success_response") or {}).get("order_id") or response.get("order_id")
+
+
+def order_error(response: dict) -> str:
+    error = response.get("error_response") or {}
+    return error.get("message") or error.get("error") or response.get("failure_reason") or "order rejected"
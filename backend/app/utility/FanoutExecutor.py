@@ -0,0 +1,134 @@
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Callable, Iterable, Union
+from app.utility.environment import environment
+import threading
+import time
+import os
+import logging
+
+
+
+logger = logging.getLogger()
+
+
+class FanoutResult:
+    """Completion accounting for one signal fanned out to every subscriber"""
+
+    def __init__(self, signal_id: str, total: int):
+        self.signal_id = signal_id
+        self.total = total
+        self.succeeded = 0
+        self.failed = 0
+        self.outcomes: dict = {}  #subscription id -> (success, message)
+        self.started_at = time.monotonic()
+        self.finished_at = None
+
+    def record(self, subscription, success: bool, message: str):
+        self.outcomes[subscription.id] = (success, message)
+        if success:
+            self.succeeded += 1
+        else:
+            self.failed += 1
+
+    @property
+    def completed(self) -> int:
+        return self.succeeded + self.failed
+
+    @property
+    def duration(self) -> float:
+        end = self.finished_at if self.finished_at is not None else time.monotonic()
+        return end - self.started_at
+
+    @property
+    def status(self) -> str:
+        if self.total == 0:
+            return "skipped_no_subscribers"
+        if self.succeeded == 0:
+            return "failed"
+        if self.failed == 0:
+            return "completed"
+        return "partially_completed"
+
+    def __str__(self) -> str:
+        return f"signal {self.signal_id}: {self.succeeded} succeeded, {self.failed} failed of {self.total} in {self.duration:.3f}s"
+
+
+class FanoutExecutor:
+    """Executes a signal for every subscriber of a bot with bounded concurrency
+
+        Every subscriber is a separate job on a shared thread pool, so an order that
+        hangs on the exchange for one user does not hold up everyone queued behind it.
+        Jobs for the same user are serialized and an exception in one job only fails
+        that user."""
+
+    def __init__(self, max_workers: Union[int, None] = None, name: str = "fanout"):
+        self.max_workers = max_workers or environment.TRADE_FANOUT_WORKERS
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=name)
+        self._user_locks: dict[int, threading.Lock] = {}
+        self._user_locks_guard = threading.Lock()
+
+    def execute(self, signal_id: str, subscriptions: Iterable, task: Callable, timeout: Union[float, None] = None) -> FanoutResult:
+        """Runs task(subscription) for every subscription and waits until all of them finish
+
+            task returns (success, message) or None for success, raising counts as a failure"""
+
+        subscriptions = list(subscriptions)
+        result = FanoutResult(signal_id=signal_id, total=len(subscriptions))
+
+        futures = {self._pool.submit(self.__run, signal_id, subscription, task): subscription for subscription in subscriptions}
+
+        done, not_done = wait(futures, timeout=timeout)
+
+        for future in done:
+            success, message = future.result()
+            result.record(futures[future], success, message)
+
+        for future in not_done:
+            #still running on the exchange, the outcome is unknown so it is reported as a failure
+            subscription = futures[future]
+            logger.error(f"Signal {signal_id} for user {subscription.user_id} did not finish within {timeout}s")
+            result.record(subscription, False, "timed out")
+
+        result.finished_at = time.monotonic()
+        return result
+
+    def shutdown(self, wait: bool = True):
+        self._pool.shutdown(wait=wait)
+
+    def __run(self, signal_id: str, subscription, task: Callable) -> tuple[bool, str]:
+
+        with self.__lock_for(subscription.user_id):
+            try:
+                outcome = task(subscription)
+            except Exception as e:
+                logger.error(f"Unable to process {signal_id} for user {subscription.user_id}: {e}")
+                return False, str(e)
+
+        if outcome is None:
+            return True, ""
+        return outcome
+
+    def __lock_for(self, user_id: int) -> threading.Lock:
+        with self._user_locks_guard:
+            lock = self._user_locks.get(user_id)
+            if lock is None:
+                lock = threading.Lock()
+                self._user_locks[user_id] = lock
+            return lock
+
+
+_executor: Union[FanoutExecutor, None] = None
+_executor_pid: Union[int, None] = None
+_executor_guard = threading.Lock()
+
+
+def get_fanout_executor() -> FanoutExecutor:
+    """Returns the fanout executor shared by every signal processor in this process"""
+    global _executor, _executor_pid
+
+    with _executor_guard:
+        #threads do not survive a fork, so a child process builds its own pool
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = FanoutExecutor()
+            _executor_pid = os.getpid()
+        return _executor
@@ -0,0 +1,213 @@
+from app.utility.environment import environment
+from app.utility.redis_helper import get_redis_client
+from typing import Iterator, Union
+import json
+import math
+import time
+import logging
+
+
+
+logger = logging.getLogger()
+
+
+SNAPSHOT_KEY = "market:snapshot"
+DIFF_STREAM = "market:diffs"
+
+#numeric columns kept for every product, in addition to its id
+COLUMNS = ("price", "change_24h", "volume_24h")
+
+#product fields of the coinbase api each column is read from
+PRODUCT_FIELDS = {"price": "price", "change_24h": "price_percentage_change_24h", "volume_24h": "volume_24h"}
+
+
+# KEYS[1] snapshot hash, KEYS[2] diff stream
+# ARGV[1] diff, ARGV[2] snapshot, ARGV[3] stream max length
+# Appends the diff and replaces the snapshot together, every diff names the entry before it so
+# a reader can tell when it missed one
+PUBLISH = """
+local prev = redis.call('HGET', KEYS[1], 'id') or '0-0'
+local id = redis.call('XADD', KEYS[2], 'MAXLEN', '~', ARGV[3], '*', 'prev', prev, 'diff', ARGV[1])
+redis.call('HSET', KEYS[1], 'id', id, 'data', ARGV[2])
+return id
+"""
+
+
+def _number(value) -> float:
+    """The api sends numbers as strings and empty strings for unknown values"""
+
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return math.nan
+
+
+class MarketSnapshot:
+    """Ticker data of every product at one point in time, stored column by column
+
+        Rows are addressed by product id through index, every column is a list in the same
+        order as product_ids so screens can run over whole columns."""
+
+    def __init__(self, product_ids: list[str], columns: dict[str, list[float]], updated_at: float, id: str = "0-0"):
+        self.product_ids = product_ids
+        self.columns = columns
+        self.updated_at = updated_at
+        self.id = id
+        self.index = {product_id: row for row, product_id in enumerate(product_ids)}
+
+    @classmethod
+    def from_products(cls, products: list[dict], updated_at: Union[float, None] = None) -> "MarketSnapshot":
+        products = [product for product in products if product.get("product_id")]
+
+        return cls(
+            product_ids=[product["product_id"] for product in products],
+            columns={column: [_number(product.get(field)) for product in products] for column, field in PRODUCT_FIELDS.items()},
+            updated_at=updated_at if updated_at is not None else time.time()
+        )
+
+    @classmethod
+    def empty(cls) -> "MarketSnapshot":
+        return cls([], {column: [] for column in COLUMNS}, updated_at=0.0)
+
+    def __len__(self) -> int:
+        return len(self.product_ids)
+
+    def age(self) -> float:
+        return time.time() - self.updated_at
+
+    def row(self, product_id: str) -> Union[dict, None]:
+        row = self.index.get(product_id)
+        if row is None:
+            return None
+        return {"product_id": product_id, **{column: values[row] for column, values in self.columns.items()}}
+
+    def rows(self) -> Iterator[dict]:
+        for product_id in self.product_ids:
+            yield self.row(product_id)
+
+    def diff(self, newer: "MarketSnapshot") -> dict:
+        """Rows of newer that are new or changed and the products it no longer has"""
+
+        changed = []
+
+        for row, product_id in enumerate(newer.product_ids):
+            old_row = self.index.get(product_id)
+            if old_row is None or any(not _same(self.columns[column][old_row], newer.columns[column][row]) for column in COLUMNS):
+                changed.append(row)
+
+        return {
+            "updated_at": newer.updated_at,
+            "product_id": [newer.product_ids[row] for row in changed],
+            **{column: [_encode(newer.columns[column][row]) for row in changed] for column in COLUMNS},
+            "removed": [product_id for product_id in self.product_ids if product_id not in newer.index]
+        }
+
+    def apply(self, diff: dict, id: str):
+        """Moves the snapshot forward by one diff from the stream"""
+
+        for i, product_id in enumerate(diff["product_id"]):
+            row = self.index.get(product_id)
+
+            if row is None:
+                row = self.index[product_id] = len(self.product_ids)
+                self.product_ids.append(product_id)
+                for column in COLUMNS:
+                    self.columns[column].append(math.nan)
+
+            for column in COLUMNS:
+                self.columns[column][row] = _number(diff[column][i])
+
+        if diff["removed"]:
+            removed = set(diff["removed"])
+            keep = [row for row, product_id in enumerate(self.product_ids) if product_id not in removed]
+            self.product_ids = [self.product_ids[row] for row in keep]
+            self.columns = {column: [values[row] for row in keep] for column, values in self.columns.items()}
+            self.index = {product_id: row for row, product_id in enumerate(self.product_ids)}
+
+        self.updated_at = diff["updated_at"]
+        self.id = id
+
+    def encode(self) -> str:
+        return json.dumps({
+            "updated_at": self.updated_at,
+            "product_id": self.product_ids,
+            **{column: [_encode(value) for value in self.columns[column]] for column in COLUMNS}
+        }, separators=(",", ":"))
+
+    @classmethod
+    def decode(cls, data: str, id: str) -> "MarketSnapshot":
+        body = json.loads(data)
+        return cls(body["product_id"], {column: [_number(value) for value in body[column]] for column in COLUMNS}, body["updated_at"], id)
+
+
+def _same(a: float, b: float) -> bool:
+    return a == b or (math.isnan(a) and math.isnan(b))
+
+
+def _encode(value: float) -> Union[float, None]:
+    #json has no nan
+    return None if math.isnan(value) else value
+
+
+class MarketData:
+    """Market snapshots published by the market data service, shared by every generator
+
+        The service keeps the latest snapshot in market:snapshot and appends what changed to the
+        market:diffs stream. A reader loads the snapshot once and then only applies diffs, so
+        the number of exchange calls does not depend on how many bots read market data. A
+        reader that fell behind the trimmed stream loads the snapshot again."""
+
+    def __init__(self, redis_client=None):
+        self.redis = redis_client if redis_client is not None else get_redis_client()
+        self.snapshot: Union[MarketSnapshot, None] = None
+        self.reloads = 0
+        self.diffs = 0
+        self.__publish = self.redis.register_script(PUBLISH)
+
+    def load(self) -> MarketSnapshot:
+        """Reads the whole snapshot, empty if nothing was published yet"""
+
+        id, data = self.redis.hmget(SNAPSHOT_KEY, "id", "data")
+        self.snapshot = MarketSnapshot.decode(data, id) if data is not None else MarketSnapshot.empty()
+        self.reloads += 1
+        return self.snapshot
+
+    def current(self) -> MarketSnapshot:
+        return self.snapshot if self.snapshot is not None else self.load()
+
+    def wait_for_update(self, block_ms: int = 10000) -> Union[MarketSnapshot, None]:
+        """Blocks until the next diff and returns the updated snapshot, None if nothing changed in time"""
+
+        snapshot = self.current()
+
+        response = self.redis.xread({DIFF_STREAM: snapshot.id}, block=block_ms)
+        if not response:
+            return None
+
+        _, entries = response[0]
+
+        for id, fields in entries:
+            if fields["prev"] != snapshot.id:
+                #diffs were trimmed away before we read them, start over from the snapshot
+                logger.warning(f"Market data diff {id} follows {fields['prev']} not {snapshot.id}, reloading the snapshot")
+                return self.load()
+
+            snapshot.apply(json.loads(fields["diff"]), id)
+            self.diffs += 1
+
+        return snapshot
+
+    def publish(self, newer: MarketSnapshot) -> Union[str, None]:
+        """Publishes newer against the current snapshot, None when nothing changed"""
+
+        diff = self.current().diff(newer)
+
+        if not diff["product_id"] and not diff["removed"]:
+            return None
+
+        newer.id = self.__publish(
+            keys=[SNAPSHOT_KEY, DIFF_STREAM],
+            args=[json.dumps(diff, separators=(",", ":")), newer.encode(), environment.MARKET_DATA_DIFF_MAXLEN]
+        )
+        self.snapshot = newer
+        return newer.id
@@ -0,0 +1,74 @@
+from typing import Union
+import time
+import logging
+
+
+
+logger = logging.getLogger()
+
+
+# Refills the bucket for the time since the last call and takes one token if there is one
+# KEYS[1] bucket hash, ARGV[1] tokens per second, ARGV[2] bucket size
+# Returns 0 when a token was taken, otherwise the milliseconds until the next one is available
+TAKE_TOKEN = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at')
+local tokens = tonumber(state[1]) or burst
+local updated_at = tonumber(state[2]) or now
+
+tokens = math.min(burst, tokens + math.max(0, now - updated_at) * rate)
+
+local wait_ms = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait_ms = math.ceil((1 - tokens) / rate * 1000)
+end
+
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated_at', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000) + 1000)
+return wait_ms
+"""
+
+
+class RateLimiter:
+    """Token bucket kept in Redis, shared by every process and thread that uses the same name
+
+        Allows rate calls per second on average with bursts of up to burst calls. The bucket is
+        refilled inside a Lua script against the Redis clock, so processes on different machines
+        agree on it."""
+
+    def __init__(self, redis_client, name: str, rate: float, burst: int):
+        self.key = f"ratelimit:{name}"
+        self.rate = rate
+        self.burst = burst
+        self.__take_token = redis_client.register_script(TAKE_TOKEN)
+
+    def try_acquire(self) -> float:
+        """Takes a token if one is available, returns 0 or the seconds until the next one"""
+
+        return int(self.__take_token(keys=[self.key], args=[self.rate, self.burst])) / 1000
+
+    def acquire(self, timeout: Union[float, None] = None) -> bool:
+        """Waits for a token, False if none became available within timeout seconds"""
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        while True:
+            wait = self.try_acquire()
+
+            if wait == 0:
+                return True
+
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                wait = min(wait, remaining)
+
+            time.sleep(wait)
@@ -0,0 +1,208 @@
+from app.utility.environment import environment
+from app.utility.redis_helper import get_redis_client
+from app.utility.signal_codec import Signal, SignalDecodeError, encode, decode
+from typing import Iterable, Union
+from contextlib import contextmanager
+from redis.exceptions import ResponseError
+import threading
+import socket
+import os
+import logging
+
+
+
+logger = logging.getLogger()
+
+
+class SignalBus:
+    """Redis stream carrying the trade signals of one bot
+
+        Generators append signals to the stream and processors read them through a consumer
+        group, so several processor replicas can share the work. An entry stays pending until
+        the processor acks it, so a processor that dies mid signal does not lose it: once the
+        entry has been idle for SIGNAL_CLAIM_IDLE_MS another consumer claims and finishes it.
+        Subscribers that were already handled are remembered per entry and skipped on the
+        second delivery so nobody gets the same trade twice. While a consumer works on an entry
+        it keeps claiming it again, so a fan-out longer than SIGNAL_CLAIM_IDLE_MS is not taken
+        over by another replica while its orders are still in flight.
+
+        Signals travel in the binary encoding from signal_codec, so the bus uses a client that
+        does not decode responses."""
+
+    GROUP = "processors"
+
+    def __init__(self, bot_id: int, redis_client=None):
+        self.bot_id = bot_id
+        self.stream = f"bot{bot_id}_signals"
+        self.dead_letter_stream = f"{self.stream}:dead"
+        self.redis = redis_client if redis_client is not None else get_redis_client(decode_responses=False)
+
+    @staticmethod
+    def consumer_name() -> str:
+        """Unique name for this processor within the group"""
+        return f"{socket.gethostname()}:{os.getpid()}"
+
+    def ensure_group(self):
+        """Create the stream and consumer group if they don't exist yet"""
+
+        try:
+            self.redis.xgroup_create(self.stream, SignalBus.GROUP, id="0", mkstream=True)
+            logger.info(f"Created consumer group {SignalBus.GROUP} on {self.stream}")
+        except ResponseError as e:
+            #group already exists
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    def publish(self, signal: Signal) -> str:
+        """Append a signal, returns its entry id"""
+
+        return self.__publish_encoded(encode(signal))
+
+    def read(self, consumer: str, count: int = 1, block_ms: int = 10000) -> list[tuple[str, Signal]]:
+        """Next (entry id, signal) pairs for this consumer, abandoned entries are served before new ones"""
+
+        entries = self.reclaim(consumer, count)
+        if entries:
+            return entries
+
+        response = self.redis.xreadgroup(SignalBus.GROUP, consumer, {self.stream: ">"}, count=count, block=block_ms)
+
+        if not response:
+            return []
+
+        _, messages = response[0]
+        return self.__decode_entries(messages)
+
+    def reclaim(self, consumer: str, count: int = 1) -> list[tuple[str, Signal]]:
+        """Claim entries other consumers left pending for too long"""
+
+        _, messages, _ = self.redis.xautoclaim(self.stream, SignalBus.GROUP, consumer, min_idle_time=environment.SIGNAL_CLAIM_IDLE_MS, start_id="0-0", count=count)
+
+        live = []
+
+        for entry_id, fields in messages:
+            entry_id = entry_id.decode()
+
+            if fields is None:
+                #trimmed from the stream while pending
+                self.ack(entry_id)
+                continue
+
+            pending = self.redis.xpending_range(self.stream, SignalBus.GROUP, min=entry_id, max=entry_id, count=1)
+            deliveries = pending[0]["times_delivered"] if pending else 1
+
+            if deliveries > environment.SIGNAL_MAX_DELIVERIES:
+                #keeps failing, park it instead of retrying forever
+                logger.error(f"Signal {entry_id} on {self.stream} failed {deliveries - 1} times, moving it to {self.dead_letter_stream}")
+                self.__dead_letter(entry_id, fields[b"signal"])
+                continue
+
+            logger.warning(f"Reclaimed signal {entry_id} on {self.stream} (delivery {deliveries})")
+            live.append((entry_id, fields))
+
+        return self.__decode_entries(live)
+
+    @contextmanager
+    def holding(self, entry_id: str, consumer: str):
+        """Keeps entry_id owned by consumer for as long as the block runs
+
+            A background thread re-claims the entry every third of SIGNAL_CLAIM_IDLE_MS, which
+            resets its idle time without counting as another delivery."""
+
+        stop = threading.Event()
+        interval = environment.SIGNAL_CLAIM_IDLE_MS / 3000
+
+        def heartbeat():
+            while not stop.wait(interval):
+                try:
+                    self.redis.xclaim(self.stream, SignalBus.GROUP, consumer, min_idle_time=0, message_ids=[entry_id], justid=True)
+                except Exception as e:
+                    logger.error(f"Unable to refresh the claim on signal {entry_id} on {self.stream}: {e}")
+
+        thread = threading.Thread(target=heartbeat, name=f"{self.stream}:hold:{entry_id}", daemon=True)
+        thread.start()
+
+        try:
+            yield
+        finally:
+            stop.set()
+            thread.join()
+
+    def ack(self, entry_id: str):
+        """The signal is fully processed, drop it from the pending list"""
+
+        pipeline = self.redis.pipeline()
+        pipeline.xack(self.stream, SignalBus.GROUP, entry_id)
+        pipeline.delete(self.__done_key(entry_id))
+        pipeline.execute()
+
+    def remaining(self, entry_id: str, subscriptions: Iterable) -> list:
+        """Subscriptions that have not been handled for this entry yet"""
+
+        done = self.redis.smembers(self.__done_key(entry_id))
+        return [subscription for subscription in subscriptions if str(subscription.id).encode() not in done]
+
+    def started(self, entry_id: str) -> bool:
+        """True if an earlier delivery of this entry already handled some subscribers"""
+
+        return self.redis.exists(self.__done_key(entry_id)) > 0
+
+    def mark_done(self, entry_id: str, subscription):
+        """Remember that this subscription was handled, so a redelivery skips it"""
+
+        pipeline = self.redis.pipeline()
+        pipeline.sadd(self.__done_key(entry_id), subscription.id)
+        pipeline.expire(self.__done_key(entry_id), environment.SIGNAL_DONE_TTL)
+        pipeline.execute()
+
+    def history(self, start: str = "-", end: str = "+", count: Union[int, None] = 100) -> list[tuple[str, Signal]]:
+        """Signals still retained on the stream, oldest first"""
+
+        entries = []
+
+        for entry_id, fields in self.redis.xrange(self.stream, min=start, max=end, count=count):
+            try:
+                entries.append((entry_id.decode(), decode(fields[b"signal"])))
+            except SignalDecodeError as e:
+                logger.error(f"Skipping undecodable signal {entry_id.decode()} on {self.stream}: {e}")
+
+        return entries
+
+    def replay(self, entry_id: str, dead_letter: bool = False) -> Union[str, None]:
+        """Publish a retained signal again as a new entry, returns the new entry id
+
+            With dead_letter the entry id refers to the dead letter stream"""
+
+        stream = self.dead_letter_stream if dead_letter else self.stream
+        messages = self.redis.xrange(stream, min=entry_id, max=entry_id, count=1)
+
+        if not messages:
+            logger.error(f"Signal {entry_id} not found on {stream}")
+            return None
+
+        return self.__publish_encoded(messages[0][1][b"signal"])
+
+    def __publish_encoded(self, data: bytes) -> str:
+        return self.redis.xadd(self.stream, {"signal": data}, maxlen=environment.SIGNAL_STREAM_MAXLEN, approximate=True).decode()
+
+    def __decode_entries(self, messages: list) -> list[tuple[str, Signal]]:
+        """Decode stream messages, anything that isn't a valid signal is dead lettered"""
+
+        entries = []
+
+        for entry_id, fields in messages:
+            entry_id = entry_id.decode() if isinstance(entry_id, bytes) else entry_id
+            try:
+                entries.append((entry_id, decode(fields[b"signal"])))
+            except (SignalDecodeError, KeyError) as e:
+                logger.error(f"Signal {entry_id} on {self.stream} can't be decoded: {e}")
+                self.__dead_letter(entry_id, fields.get(b"signal", b""))
+
+        return entries
+
+    def __dead_letter(self, entry_id: str, data: bytes):
+        self.redis.xadd(self.dead_letter_stream, {"signal": data, "entry_id": entry_id}, maxlen=environment.SIGNAL_STREAM_MAXLEN, approximate=True)
+        self.ack(entry_id)
+
+    def __done_key(self, entry_id: str) -> str:
+        return f"{self.stream}:done:{entry_id}"
@@ -0,0 +1,202 @@
+from app.database.db_connection import context_get_session
+from app.database.models import Subscription
+from app.utility.redis_helper import get_redis_client
+from app.utility.environment import environment
+from sqlalchemy.future import select
+from typing import Union
+import threading
+import json
+import time
+import os
+import logging
+
+
+
+logger = logging.getLogger()
+
+
+def subscription_channel(bot_id: int) -> str:
+    return f"bot{bot_id}_subscriptions"
+
+
+class CachedSubscription:
+    """Plain copy of a Subscription row that can be shared between threads"""
+
+    __slots__ = ("id", "user_id", "bot_id", "portfolio_uuid")
+
+    def __init__(self, id: int, user_id: int, bot_id: int, portfolio_uuid: str):
+        self.id = id
+        self.user_id = user_id
+        self.bot_id = bot_id
+        self.portfolio_uuid = portfolio_uuid
+
+    @staticmethod
+    def from_row(subscription: Subscription) -> "CachedSubscription":
+        return CachedSubscription(id=subscription.id, user_id=subscription.user_id, bot_id=subscription.bot_id, portfolio_uuid=subscription.portfolio_uuid)
+
+
+class SubscriptionCache:
+    """In memory set of the subscribers of one bot
+
+        Loaded from the db once and then patched by the subscribe/unsubscribe events that
+        bot_helper publishes on the bot's subscription channel. If the channel drops the cache
+        is invalidated and the next read goes back to the db. As a safety net against a lost
+        event the set is also reloaded every SUBSCRIPTION_CACHE_TTL seconds."""
+
+    def __init__(self, bot_id: int):
+        self.bot_id = bot_id
+        self.channel = subscription_channel(bot_id)
+        self.hits = 0
+        self.misses = 0
+        self._subscriptions: Union[dict[int, CachedSubscription], None] = None
+        self._loaded_at = 0.0
+        self._pending_events: Union[list[dict], None] = None
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._subscribed = threading.Event()
+
+    def start(self):
+        """Start listening for changes and warm the cache"""
+
+        listener = threading.Thread(target=self.__listen, name=f"{self.channel}-listener", daemon=True)
+        listener.start()
+
+        #wait for the subscription so no change is missed between the load and the first event
+        if not self._subscribed.wait(timeout=10):
+            logger.error(f"Unable to subscribe to {self.channel}, subscribers will be read from the db")
+
+        self.get()
+
+    def get(self) -> list[CachedSubscription]:
+        """Every subscription of this bot"""
+
+        with self._lock:
+            if self._subscriptions is not None and time.monotonic() - self._loaded_at > environment.SUBSCRIPTION_CACHE_TTL:
+                self._subscriptions = None
+
+            if self._subscriptions is not None:
+                self.hits += 1
+                return list(self._subscriptions.values())
+
+        with self._load_lock:
+            return self.__load()
+
+    def invalidate(self):
+        with self._lock:
+            self._subscriptions = None
+
+    def __load(self) -> list[CachedSubscription]:
+
+        with self._lock:
+            #another thread loaded while we waited
+            if self._subscriptions is not None:
+                self.hits += 1
+                return list(self._subscriptions.values())
+
+            self.misses += 1
+            #events that arrive while we read the db are replayed on top of the result
+            self._pending_events = []
+
+        try:
+            with context_get_session() as db:
+                rows = db.scalars(select(Subscription).where(Subscription.bot_id == self.bot_id)).all()
+                subscriptions = {row.id: CachedSubscription.from_row(row) for row in rows}
+        except Exception:
+            with self._lock:
+                self._pending_events = None
+            raise
+
+        with self._lock:
+            for event in self._pending_events:
+                SubscriptionCache.__patch(subscriptions, event)
+            self._pending_events = None
+
+            #only keep the result if we are actually receiving changes
+            if self._subscribed.is_set():
+                self._subscriptions = subscriptions
+                self._loaded_at = time.monotonic()
+
+        logger.info(f"Loaded {len(subscriptions)} subscribers for bot {self.bot_id} (hits {self.hits}, misses {self.misses})")
+        return list(subscriptions.values())
+
+    def __apply(self, event: dict):
+        with self._lock:
+            if self._pending_events is not None:
+                self._pending_events.append(event)
+            if self._subscriptions is not None:
+                SubscriptionCache.__patch(self._subscriptions, event)
+
+    @staticmethod
+    def __patch(subscriptions: dict[int, CachedSubscription], event: dict):
+        match event.get("op"):
+            case "add":
+                subscriptions[event["id"]] = CachedSubscription(id=event["id"], user_id=event["user_id"], bot_id=event["bot_id"], portfolio_uuid=event["portfolio_uuid"])
+            case "remove":
+                subscriptions.pop(event["id"], None)
+
+    def __listen(self):
+
+        redis_client = get_redis_client()
+
+        while True:
+            pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+            try:
+                pubsub.subscribe(self.channel)
+                self._subscribed.set()
+
+                #changes may have been missed while we were not subscribed
+                self.invalidate()
+
+                for message in pubsub.listen():
+                    if message["type"] == "message":
+                        self.__apply(json.loads(message["data"]))
+
+            except Exception as e:
+                logger.error(f"Lost {self.channel}, invalidating subscriber cache: {e}")
+                self._subscribed.clear()
+                self.invalidate()
+                time.sleep(1)
+            finally:
+                pubsub.close()
+
+
+def publish_subscription_change(op: str, subscription: Union[Subscription, CachedSubscription]):
+    """Tell the bot's processors that a subscription was added or removed"""
+
+    event = {
+        "op": op,
+        "id": subscription.id,
+        "user_id": subscription.user_id,
+        "bot_id": subscription.bot_id,
+        "portfolio_uuid": subscription.portfolio_uuid
+    }
+
+    try:
+        get_redis_client().publish(subscription_channel(subscription.bot_id), json.dumps(event))
+    except Exception as e:
+        #processors fall back to the db once their channel reconnects
+        logger.error(f"Unable to publish subscription change for bot {subscription.bot_id}: {e}")
+
+
+_caches: dict[int, SubscriptionCache] = {}
+_caches_pid: Union[int, None] = None
+_caches_guard = threading.Lock()
+
+
+def get_subscription_cache(bot_id: int) -> SubscriptionCache:
+    """Returns the started subscription cache for this bot in this process"""
+    global _caches_pid
+
+    with _caches_guard:
+        #listener threads don't survive a fork
+        if _caches_pid != os.getpid():
+            _caches.clear()
+            _caches_pid = os.getpid()
+
+        cache = _caches.get(bot_id)
+        if cache is None:
+            cache = SubscriptionCache(bot_id)
+            _caches[bot_id] = cache
+            cache.start()
+
+        return cache
@@ -1,12 +1,16 @@
 from app.database.models import User, Exchange_Auth_Token
-from typing import Union
+from typing import Iterable, Union
 from sqlalchemy.orm import Session
 from sqlalchemy.sql import text
 from sqlalchemy.future import select
 from app.utility.environment import environment
+from app.database.db_connection import context_get_session
 from cryptography.fernet import Fernet
 from authlib.integrations.requests_client import OAuth2Session
+import threading
+import asyncio
 import random
+import time
 from datetime import datetime, timezone
 import logging
 
@@ -15,6 +19,57 @@ import logging
 logger = logging.getLogger()
 
 
+class DecryptedTokenCache:
+    """Process local cache of decrypted access tokens, keyed by (user id, exchange)
+
+        An entry remembers the ciphertext it was decrypted from and is only served while the row
+        still holds that same ciphertext, so a token refreshed by another process is never served
+        stale. Entries live for at most TOKEN_CACHE_TTL seconds and never past the point where
+        the token itself counts as expired."""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._entries: dict[tuple[int, str], tuple[bytes, str, float]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, token: Exchange_Auth_Token) -> Union[str, None]:
+        key = (token.user_id, token.exchange_name)
+
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is not None:
+                ciphertext, access_token, valid_until = entry
+                if ciphertext == token.access_token and time.time() < valid_until:
+                    self.hits += 1
+                    return access_token
+                del self._entries[key]
+
+            self.misses += 1
+            return None
+
+    def put(self, token: Exchange_Auth_Token, access_token: str):
+        valid_until = min(time.time() + environment.TOKEN_CACHE_TTL, token.expires_at - Exchange_Auth_Token.EXPIRY_BUFFER)
+
+        with self._lock:
+            self._entries[(token.user_id, token.exchange_name)] = (bytes(token.access_token), access_token, valid_until)
+
+    def invalidate(self, user_id: int, exchange_name: str):
+        with self._lock:
+            self._entries.pop((user_id, exchange_name), None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+token_cache = DecryptedTokenCache()
+
+#Fernet objects are immutable and safe to share between threads
+_cipher_suite: Union[Fernet, None] = None
+
+
 class TokenService:
     """Centralized Exchange Token Management Service"""
 
@@ -40,25 +95,118 @@ class TokenService:
             return self.__refresh_tokens(old_token=token)
         
         #if it is still valid then return the access token
-        return TokenService.__decrypt(token.access_token)
+        return TokenService.__decrypt_token(token)
+
+    @staticmethod
+    async def get_access_token_async(user_id: int, exchange_name: str) -> Union[str, None]:
+        """get_access_token for async code
+
+            Runs in a worker thread on its own session, a refresh waits on the advisory lock and
+            calls the exchange, neither of which may block the event loop"""
+
+        def get_access_token() -> Union[str, None]:
+            with context_get_session() as db:
+                return TokenService(user_id=user_id, db=db).get_access_token(exchange_name=exchange_name)
+
+        return await asyncio.to_thread(get_access_token)
+
+    @staticmethod
+    async def exchange_oauth_code_for_tokens_async(user_id: int, code: str, exchange_name: str) -> bool:
+        """exchange_oauth_code_for_tokens for async code, runs in a worker thread on its own session"""
+
+        def exchange_oauth_code_for_tokens() -> bool:
+            with context_get_session() as db:
+                return TokenService(user_id=user_id, db=db).exchange_oauth_code_for_tokens(code=code, exchange_name=exchange_name)
+
+        return await asyncio.to_thread(exchange_oauth_code_for_tokens)
+
+    @staticmethod
+    def get_access_tokens(user_ids: Iterable[int], exchange_name: str, db: Session) -> dict[int, Union[str, None]]:
+        """Gets the access tokens of many users on one exchange with a single query
+
+            Returns user id -> access token, None for users without a usable token. Only expired
+            tokens go through the locked refresh, one user at a time."""
+
+        user_ids = set(user_ids)
+        access_tokens: dict[int, Union[str, None]] = dict.fromkeys(user_ids)
+
+        if not user_ids:
+            return access_tokens
+
+        tokens = (db.execute(select(Exchange_Auth_Token).where((Exchange_Auth_Token.user_id.in_(user_ids)) & (Exchange_Auth_Token.exchange_name == exchange_name)))).scalars().all()
+
+        expired_tokens = []
+
+        for token in tokens:
+            if token.is_expired():
+                expired_tokens.append(token)
+                continue
+
+            try:
+                access_tokens[token.user_id] = TokenService.__decrypt_token(token)
+            except Exception as e:
+                logger.error(f"Unable to decrypt token {token.id} for user {token.user_id}: {e}")
+
+        #refreshing commits, which expires the other rows, so the valid ones are read first
+        for token in expired_tokens:
+            logger.info(f"User {token.user_id} has an expired token {token.id} for exchange {exchange_name}")
+            access_tokens[token.user_id] = TokenService(user_id=token.user_id, db=db).__refresh_tokens(old_token=token)
+
+        logger.debug(f"Loaded {len(tokens)} {exchange_name} tokens for {len(user_ids)} users, {len(expired_tokens)} refreshed, token cache {token_cache.stats()}")
+        return access_tokens
+
+    @staticmethod
+    def __cipher_suite() -> Fernet:
+        global _cipher_suite
+        if _cipher_suite is None:
+            _cipher_suite = Fernet(environment.COINBASE_TOKEN_ENCRYPTION_KEY)
+        return _cipher_suite
 
     @staticmethod
     def __encrypt(data: str) -> bytes:
-        cipher_suite = Fernet(environment.COINBASE_TOKEN_ENCRYPTION_KEY)
-        return cipher_suite.encrypt(data.encode('utf-8'))
+        return TokenService.__cipher_suite().encrypt(data.encode('utf-8'))
 
     @staticmethod
     def __decrypt(data: bytes) -> str:
-        cipher_suite = Fernet(environment.COINBASE_TOKEN_ENCRYPTION_KEY)
-        return cipher_suite.decrypt(data).decode('utf-8')
+        return TokenService.__cipher_suite().decrypt(data).decode('utf-8')
+
+    @staticmethod
+    def __decrypt_token(token: Exchange_Auth_Token) -> str:
+        """Decrypts the access token of a valid token row, served from the cache when possible"""
+
+        access_token = token_cache.get(token)
+
+        if access_token is None:
+            access_token = TokenService.__decrypt(token.access_token)
+            token_cache.put(token, access_token)
 
+        return access_token
 
-    def __refresh_tokens(self, old_token: Exchange_Auth_Token) -> Union[str, None]:
+
+    def refresh_token(self, exchange_name: str, buffer_seconds: int) -> Union[str, None]:
+        """Refreshes this user's token if it expires within buffer_seconds, returns the current access token
+
+            Used by the background refresher so the trade path finds tokens that are already valid"""
+
+        token = (self.db.execute(select(Exchange_Auth_Token).where((Exchange_Auth_Token.user_id == self.user_id) & (Exchange_Auth_Token.exchange_name == exchange_name)))).scalars().first()
+
+        if token is None:
+            return None
+
+        if not token.is_expired(buffer_seconds=buffer_seconds):
+            return TokenService.__decrypt_token(token)
+
+        return self.__refresh_tokens(old_token=token, buffer_seconds=buffer_seconds)
+
+    def __refresh_tokens(self, old_token: Exchange_Auth_Token, buffer_seconds: int = Exchange_Auth_Token.EXPIRY_BUFFER) -> Union[str, None]:
 
         #get the lock id for this user on the provided exchange
         lock_id = old_token.get_lock_id()
 
 
+        #whatever happens the cached token is no longer the current one
+        token_cache.invalidate(self.user_id, old_token.exchange_name)
+
         #aquire the transaction level advisory lock, wait otherwise
         self.db.execute(text("SELECT pg_advisory_xact_lock(:lock_id)"), {"lock_id": lock_id})
         logger.debug(f"{self.id} aquired lock {lock_id}")
@@ -74,19 +222,24 @@ class TokenService:
                 return None
 
             #does this token still need to be refreshed?
-            if check_token.is_expired():
+            if check_token.is_expired(buffer_seconds=buffer_seconds):
                 logger.info(f"User {self.user_id} still has an expired token {check_token.id} for exchange {old_token.exchange_name}")
 
+                #refreshes before the token really expires are free, only attempts on an expired token count
+                expired = check_token.is_expired(buffer_seconds=0)
+
                 #if this is the third attempt at a refresh, delete the token and require the user to re authenticate
-                if check_token.refresh_attempts >= 3:
+                if expired and check_token.refresh_attempts >= 3:
                     logger.error(f"Token {check_token.id} is being deleted, attempted refreshes is now {check_token.refresh_attempts}")
                     self.db.delete(check_token)
+                    self.db.commit()
                     return None
 
 
                 #update the refresh attempts for this token
-                check_token.refresh_attempts += 1
-                logger.info(f"Token {check_token.id} attempted refreshes is now {check_token.refresh_attempts}")
+                if expired:
+                    check_token.refresh_attempts += 1
+                    logger.info(f"Token {check_token.id} attempted refreshes is now {check_token.refresh_attempts}")
                 self.db.commit()
 
                 
@@ -113,6 +266,7 @@ class TokenService:
                         check_token.refresh_attempts = 0
 
                         self.db.commit()
+                        token_cache.put(check_token, new_access_token)
                         logger.debug(f"{self.id} refreshed token {check_token.id}")
                         return new_access_token
                     
@@ -121,7 +275,7 @@ class TokenService:
                 #commit to release the lock
                 self.db.commit()
                 logger.debug(f"{self.id} released lock {lock_id}")
-                return TokenService.__decrypt(check_token.access_token)
+                return TokenService.__decrypt_token(check_token)
 
 
         except Exception as e:
@@ -169,6 +323,7 @@ class TokenService:
                 
                     self.db.add(new_exchange_token)
                     self.db.commit()
+                    token_cache.invalidate(self.user_id, exchange_name)
                     return True
                     
 
@@ -5,7 +5,10 @@ from sqlalchemy.orm import Session
 from sqlalchemy.future import select
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.utility.environment import environment
+from app.utility.SubscriptionCache import CachedSubscription, publish_subscription_change
+import asyncio
 import logging
 
 
@@ -54,6 +57,9 @@ def subscribe_user_to_bot(user: User, bot: Bot, portfolio_uuid: str, db: Session
         db.add(new_subscription)
         db.commit()
         db.refresh(new_subscription)
+
+        #patch the subscriber cache of the bot's processors
+        publish_subscription_change("add", new_subscription)
         return new_subscription
     
     except SQLAlchemyError as e:
@@ -71,13 +77,19 @@ def unsubscribe_user_from_bot(user: User, portfolio_uuid: str, db: Session) -> U
     if active_subscription is None:
         return {"status": "not found" , "msg": f"User is not subscribed to that bot"}
     
+    #the row can't be read once it is deleted
+    removed_subscription = CachedSubscription.from_row(active_subscription)
+
     try:
         db.delete(active_subscription)
         db.commit()
+
+        #patch the subscriber cache of the bot's processors
+        publish_subscription_change("remove", removed_subscription)
         return {"status": "success"}
     
     except SQLAlchemyError as e:
-        logger.error(f"DB error trying to subscribe {user.id} portfolio {portfolio_uuid} to bot {bot.id}")
+        logger.error(f"DB error trying to unsubscribe {user.id} portfolio {portfolio_uuid} from bot {removed_subscription.bot_id}")
         db.rollback()
         return None
     
@@ -86,3 +98,79 @@ def get_subscriptions_for_user(user: User, db: Session):
     subscriptions = db.scalars(select(Subscription).where(Subscription.user_id == user.id)).all()
     return subscriptions
     
+
+
+# Async variants for the async routes
+
+async def get_all_bots_async(db: AsyncSession) -> List[Bot]:
+
+    bots = (await db.scalars(select(Bot))).all()
+    return bots
+
+async def get_bot_by_id_async(id: int, db: AsyncSession) -> Union[Bot, None]:
+    bot = (await db.scalars(select(Bot).where(Bot.id == id))).first()
+    return bot
+
+async def get_bot_by_name_async(name: str, db: AsyncSession) -> Union[Bot, None]:
+    bot = (await db.scalars(select(Bot).where(Bot.name == name))).first()
+    return bot
+
+async def get_subscription_by_portfolio_uuid_async(portfolio_uuid: str, db: AsyncSession) -> Union[Subscription, None]:
+    subscription = (await db.scalars(select(Subscription).where(Subscription.portfolio_uuid == portfolio_uuid))).first()
+    return subscription
+
+async def subscribe_user_to_bot_async(user: User, bot: Bot, portfolio_uuid: str, db: AsyncSession) -> Union[Subscription, None]:
+
+    #check if this portfolio is already subscribed to a bot
+    active_subscription = await get_subscription_by_portfolio_uuid_async(portfolio_uuid=portfolio_uuid, db=db)
+
+    if active_subscription is not None:
+        return None
+
+    new_subscription = Subscription(
+        bot_id=bot.id,
+        user_id=user.id,
+        portfolio_uuid=portfolio_uuid
+    )
+
+    try:
+        db.add(new_subscription)
+        await db.commit()
+        await db.refresh(new_subscription)
+
+        #patch the subscriber cache of the bot's processors
+        await asyncio.to_thread(publish_subscription_change, "add", new_subscription)
+        return new_subscription
+
+    except SQLAlchemyError as e:
+        logger.error(f"DB error trying to subscribe {user.id} portfolio {portfolio_uuid} to bot {bot.id}")
+        await db.rollback()
+        return None
+
+async def unsubscribe_user_from_bot_async(user: User, portfolio_uuid: str, db: AsyncSession) -> Union[Subscription, None]:
+
+    #check that the user is subscribed to this bot
+    active_subscription = await get_subscription_by_portfolio_uuid_async(portfolio_uuid=portfolio_uuid, db=db)
+
+    if active_subscription is None:
+        return {"status": "not found" , "msg": f"User is not subscribed to that bot"}
+
+    #the row can't be read once it is deleted
+    removed_subscription = CachedSubscription.from_row(active_subscription)
+
+    try:
+        await db.delete(active_subscription)
+        await db.commit()
+
+        #patch the subscriber cache of the bot's processors
+        await asyncio.to_thread(publish_subscription_change, "remove", removed_subscription)
+        return {"status": "success"}
+
+    except SQLAlchemyError as e:
+        logger.error(f"DB error trying to unsubscribe {user.id} portfolio {portfolio_uuid} from bot {removed_subscription.bot_id}")
+        await db.rollback()
+        return None
+
+async def get_subscriptions_for_user_async(user: User, db: AsyncSession):
+    subscriptions = (await db.scalars(select(Subscription).where(Subscription.user_id == user.id))).all()
+    return subscriptions
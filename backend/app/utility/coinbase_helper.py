@@ -2,14 +2,15 @@ from fastapi import HTTPException
 from app.database.models import OAuth_State, User
 from typing import Union
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
+from sqlalchemy import delete
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import Session
 from app.utility.environment import environment
 from app.utility.TokenService import TokenService
-import requests
-import http.client
-import json
+from app.utility.CoinbaseClient import CoinbaseClient, CoinbaseError
+import asyncio
 import logging
 
 
@@ -113,32 +114,21 @@ def get_user_portfolios(user: User, db: Session) -> Union[dict, None]:
     if coinbase_access_token is None:
         return None
 
+    return get_portfolios(access_token=coinbase_access_token)
+
+def get_portfolios(access_token: str) -> Union[dict, None]:
+    """Every active portfolio of the token's owner with its balances"""
 
     try:
-        #get all portfolios
-        conn = http.client.HTTPSConnection("api.coinbase.com")
-        payload = ''
-        headers = {
-            "Authorization": f"Bearer {coinbase_access_token}",
-            "Content-Type": "application/json"
-        }
-        conn.request("GET", "/api/v3/brokerage/portfolios", payload, headers)
-        res = conn.getresponse().read().decode("utf-8")
-        data = json.loads(res)
-
-
-        #get the balances for each active portfolio
+        client = CoinbaseClient(access_token)
+
+        #get the balances for each active portfolio, over the same pooled connection
         all_portfolio_data = dict()
         all_portfolio_data.update({"portfolios": []})
 
-
-        for portfolio in data["portfolios"]:
+        for portfolio in client.list_portfolios():
             if portfolio["deleted"] == False:
-                portfolio_uuid = portfolio["uuid"]
-                conn.request("GET", f"/api/v3/brokerage/portfolios/{portfolio_uuid}", payload, headers)
-                res = conn.getresponse().read().decode("utf-8")
-                data = json.loads(res)
-                all_portfolio_data["portfolios"].append(data["breakdown"])
+                all_portfolio_data["portfolios"].append(client.get_portfolio_breakdown(portfolio["uuid"]))
 
         return all_portfolio_data
 
@@ -147,20 +137,14 @@ def get_user_portfolios(user: User, db: Session) -> Union[dict, None]:
         return None
     
 def get_coinbase_balance(access_token: str, db: Session):
-    
-    
-    headers = {
-        "Authorization": f"Bearer {access_token}",
-        "CB-VERSION": "2021-10-01"
-    }
-
-    response = requests.get("https://api.coinbase.com/v2/accounts", headers=headers)
 
-    if response.status_code != 200:
-        return {"error": f"Coinbase API failed: {response.status_code}"}
+    try:
+        accounts = CoinbaseClient(access_token).list_wallet_accounts()
+    except CoinbaseError as e:
+        return {"error": f"Coinbase API failed: {e.status}"}
 
     balances = {}
-    for account in response.json().get("data", []):
+    for account in accounts:
         portfolio_id = account["portfolio_id"]
 
         if portfolio_id not in balances.keys():
@@ -170,4 +154,66 @@ def get_coinbase_balance(access_token: str, db: Session):
 
     return balances
 
-    
\ No newline at end of file
+    
+
+
+# Async variants for the async routes, calls to coinbase run in a thread so they don't block the event loop
+
+async def get_state_by_state_async(state: str, db: AsyncSession) -> Union[OAuth_State, None]:
+    result = await db.execute(select(OAuth_State).where(OAuth_State.state == state))
+    return result.scalars().first()
+
+async def get_state_by_user_id_async(user_id: str, db: AsyncSession) -> Union[OAuth_State, None]:
+    result = await db.execute(select(OAuth_State).where(OAuth_State.user_id == user_id))
+    return result.scalars().first()
+
+async def store_state_in_db_async(user: User, state: str, db: AsyncSession) -> Union[OAuth_State, None]:
+
+    #link the state to the current user in the database
+    new_oauth_state = OAuth_State(state=state, user_id=user.id)
+
+    try:
+        db.add(new_oauth_state)
+        await db.commit()
+        return new_oauth_state
+
+    except SQLAlchemyError as e:
+        await db.rollback()
+        return None
+
+async def remove_state_async(state: OAuth_State, db: AsyncSession) -> Union[OAuth_State, None]:
+    try:
+        await db.delete(state)
+        await db.commit()
+        return state
+
+    except SQLAlchemyError as e:
+        logger.error(f"Error deleting state for {state.user_id}")
+        await db.rollback()
+        return None
+
+async def clear_all_states_for_user_async(user: User, db: AsyncSession) -> bool:
+    try:
+        await db.execute(delete(OAuth_State).where(OAuth_State.user_id == user.id))
+        await db.commit()
+        return True
+
+    except SQLAlchemyError as e:
+        logger.error(f"Error deleting state for {user.username}")
+        await db.rollback()
+        return False
+
+async def get_user_portfolios_async(user: User) -> Union[dict, None]:
+
+    if user is None:
+        return None
+
+    coinbase_access_token = await TokenService.get_access_token_async(user_id=user.id, exchange_name="coinbase")
+
+    if coinbase_access_token is None:
+        return None
+
+    return await asyncio.to_thread(get_portfolios, coinbase_access_token)
+
+async def get_coinbase_balance_async(access_token: str):
+    return await asyncio.to_thread(get_coinbase_balance, access_token, None)
@@ -8,6 +8,15 @@ class Environment(BaseSettings):
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
     POSTGRESQL_CONNECTION_STRING: str = config("POSTGRESQL_CONNECTION_STRING", cast=str)
 
+    # Database connection pools, the api process and every bot process each have their own
+    DB_POOL_SIZE_API: int = config("DB_POOL_SIZE_API", cast=int, default=10)
+    DB_MAX_OVERFLOW_API: int = config("DB_MAX_OVERFLOW_API", cast=int, default=10)
+    DB_POOL_SIZE_BOT: int = config("DB_POOL_SIZE_BOT", cast=int, default=2)
+    DB_MAX_OVERFLOW_BOT: int = config("DB_MAX_OVERFLOW_BOT", cast=int, default=3)
+    DB_POOL_TIMEOUT: float = config("DB_POOL_TIMEOUT", cast=float, default=30.0)
+    DB_POOL_RECYCLE: int = config("DB_POOL_RECYCLE", cast=int, default=1800)
+    DB_POOL_PRE_PING: bool = config("DB_POOL_PRE_PING", cast=bool, default=True)
+
     # Coinbase vars
     COINBASE_CLIENT_ID: str = config("COINBASE_CLIENT_ID", cast=str)
     COINBASE_CLIENT_SECRET: str = config("COINBASE_CLIENT_SECRET", cast=str)
@@ -17,12 +26,80 @@ class Environment(BaseSettings):
     COINBASE_CLIENT_TOKEN_SCOPE: str = config("COINBASE_CLIENT_TOKEN_SCOPE", cast = str)
     COINBASE_TOKEN_ENCRYPTION_KEY: str = config("COINBASE_TOKEN_ENCRYPTION_KEY", cast = str)
 
+    # Coinbase http client, one keep-alive pool per process shared by the api and every bot
+    COINBASE_API_URL: str = config("COINBASE_API_URL", cast=str, default="https://api.coinbase.com")
+    COINBASE_HTTP_POOL_SIZE: int = config("COINBASE_HTTP_POOL_SIZE", cast=int, default=20)
+    COINBASE_HTTP_TIMEOUT: float = config("COINBASE_HTTP_TIMEOUT", cast=float, default=10.0)
+    COINBASE_HTTP_RETRIES: int = config("COINBASE_HTTP_RETRIES", cast=int, default=3)
+    COINBASE_HTTP_BACKOFF_BASE: float = config("COINBASE_HTTP_BACKOFF_BASE", cast=float, default=0.25)
+    COINBASE_HTTP_BACKOFF_MAX: float = config("COINBASE_HTTP_BACKOFF_MAX", cast=float, default=4.0)
+
     # Redis vars
     REDIS_HOST: str = config("REDIS_HOST", cast=str, default="localhost")
     REDIS_PORT: int = config("REDIS_PORT", cast=int, default=6379)
 
     # Bot Monitoring
     BOT_MONITOR: bool = config("BOT_MONITOR", cast=bool, default=True)
+    BOT_RESTART_BACKOFF_BASE: float = config("BOT_RESTART_BACKOFF_BASE", cast=float, default=1.0)
+    BOT_RESTART_BACKOFF_MAX: float = config("BOT_RESTART_BACKOFF_MAX", cast=float, default=300.0)
+    BOT_STABLE_UPTIME: float = config("BOT_STABLE_UPTIME", cast=float, default=60.0)
+    BOT_CIRCUIT_BREAKER_THRESHOLD: int = config("BOT_CIRCUIT_BREAKER_THRESHOLD", cast=int, default=5)
+    BOT_CIRCUIT_BREAKER_COOLDOWN: float = config("BOT_CIRCUIT_BREAKER_COOLDOWN", cast=float, default=900.0)
+
+    # Signal streams
+    SIGNAL_STREAM_MAXLEN: int = config("SIGNAL_STREAM_MAXLEN", cast=int, default=10000)
+    SIGNAL_CLAIM_IDLE_MS: int = config("SIGNAL_CLAIM_IDLE_MS", cast=int, default=60000)
+    SIGNAL_MAX_DELIVERIES: int = config("SIGNAL_MAX_DELIVERIES", cast=int, default=5)
+    SIGNAL_DONE_TTL: int = config("SIGNAL_DONE_TTL", cast=int, default=86400)
+
+    # Subscriber cache in the signal processors
+    SUBSCRIPTION_CACHE_TTL: int = config("SUBSCRIPTION_CACHE_TTL", cast=int, default=300)
+
+    # Decrypted exchange tokens kept in memory, never past the token's own expiry
+    TOKEN_CACHE_TTL: int = config("TOKEN_CACHE_TTL", cast=int, default=3600)
+
+    # Background refresh of exchange tokens before they expire
+    TOKEN_REFRESH_INTERVAL: float = config("TOKEN_REFRESH_INTERVAL", cast=float, default=60.0)
+    TOKEN_REFRESH_AHEAD: int = config("TOKEN_REFRESH_AHEAD", cast=int, default=600)
+    TOKEN_REFRESH_BATCH: int = config("TOKEN_REFRESH_BATCH", cast=int, default=500)
+    TOKEN_REFRESH_WORKERS: int = config("TOKEN_REFRESH_WORKERS", cast=int, default=4)
+
+    # Copycat whale watch list, addresses separated by commas or whitespace and/or a file with one per line
+    COPYCAT_WATCH_ADDRESSES: str = config("COPYCAT_WATCH_ADDRESSES", cast=str, default="")
+    COPYCAT_WATCH_FILE: str = config("COPYCAT_WATCH_FILE", cast=str, default="")
+    COPYCAT_BLOCKCHAIN_API_URL: str = config("COPYCAT_BLOCKCHAIN_API_URL", cast=str, default="https://api.blockcypher.com/v1/btc/main")
+    COPYCAT_POLL_INTERVAL: float = config("COPYCAT_POLL_INTERVAL", cast=float, default=60.0)
+    COPYCAT_FETCH_WORKERS: int = config("COPYCAT_FETCH_WORKERS", cast=int, default=16)
+    COPYCAT_FETCH_TIMEOUT: float = config("COPYCAT_FETCH_TIMEOUT", cast=float, default=10.0)
+    # Shared by every copycat generator, BlockCypher allows 3 requests per second without a token
+    COPYCAT_API_RATE: float = config("COPYCAT_API_RATE", cast=float, default=3.0)
+    COPYCAT_API_BURST: int = config("COPYCAT_API_BURST", cast=int, default=3)
+
+    # Copycat transactions that were already turned into signals
+    COPYCAT_SEEN_TX_MAX: int = config("COPYCAT_SEEN_TX_MAX", cast=int, default=10000)
+    COPYCAT_SEEN_TX_WINDOW: float = config("COPYCAT_SEEN_TX_WINDOW", cast=float, default=7 * 24 * 3600.0)
+    COPYCAT_SEEN_TX_LOCAL: int = config("COPYCAT_SEEN_TX_LOCAL", cast=int, default=1024)
+
+    # Seconds a copycat subscriber's accounts and balances are reused between signals
+    COPYCAT_ACCOUNTS_CACHE_TTL: float = config("COPYCAT_ACCOUNTS_CACHE_TTL", cast=float, default=15.0)
+
+    # Market data service, one process polls the product tickers for every generator
+    MARKET_DATA_PUBLISHER: bool = config("MARKET_DATA_PUBLISHER", cast=bool, default=True)
+    MARKET_DATA_INTERVAL: float = config("MARKET_DATA_INTERVAL", cast=float, default=5.0)
+    MARKET_DATA_PRODUCT_TYPE: str = config("MARKET_DATA_PRODUCT_TYPE", cast=str, default="SPOT")
+    MARKET_DATA_DIFF_MAXLEN: int = config("MARKET_DATA_DIFF_MAXLEN", cast=int, default=1000)
+
+    # SolModel bot, the model and scaler default to the ones in dan_model
+    SOL_MODEL_PATH: str = config("SOL_MODEL_PATH", cast=str, default="")
+    SOL_SCALER_PATH: str = config("SOL_SCALER_PATH", cast=str, default="")
+    SOL_MODEL_SYMBOLS: str = config("SOL_MODEL_SYMBOLS", cast=str, default="SOL-USD")
+    SOL_MODEL_THRESHOLD: float = config("SOL_MODEL_THRESHOLD", cast=float, default=0.05)
+    SOL_MODEL_ALLOCATION: float = config("SOL_MODEL_ALLOCATION", cast=float, default=100.0)
+    # Seconds after the hour before the closed candle is fetched, so the exchange has finalized it
+    SOL_MODEL_CANDLE_DELAY: float = config("SOL_MODEL_CANDLE_DELAY", cast=float, default=5.0)
+
+    # Trade execution
+    TRADE_FANOUT_WORKERS: int = config("TRADE_FANOUT_WORKERS", cast=int, default=10)
 
     PRODUCTION: bool = config("PRODUCTION", cast=bool, default=False)
     
@@ -0,0 +1,291 @@
+from typing import Iterable, Union
+import argparse
+import math
+
+
+"""Streaming technical indicators, updated in O(1) per candle
+
+    Every indicator keeps only the state it needs, a ring buffer or a running average, and
+    returns None until it has seen enough candles, where talib returns NaN. The values match
+    talib's, including how it seeds its averages, so features computed live line up with the
+    ones dan_model/train_model.py trained on. compare_with_talib checks that on any close series:
+
+    python -m app.utility.indicators --csv candles.csv"""
+
+
+#feature order of dan_model/train_model.py, the scaler and model expect exactly this
+FEATURES = ("sma_50", "rsi", "macd", "macd_signal", "return_1h")
+
+
+class RingBuffer:
+    """The last size values, the oldest is overwritten first"""
+
+    __slots__ = ("values", "size", "count", "_next")
+
+    def __init__(self, size: int):
+        self.values = [0.0] * size
+        self.size = size
+        self.count = 0
+        self._next = 0
+
+    def push(self, value: float) -> Union[float, None]:
+        """Stores value, returns the one it replaced once the buffer is full"""
+
+        dropped = self.values[self._next] if self.count == self.size else None
+        self.values[self._next] = value
+        self._next = (self._next + 1) % self.size
+        self.count = min(self.count + 1, self.size)
+        return dropped
+
+    def full(self) -> bool:
+        return self.count == self.size
+
+    def mean(self) -> float:
+        return sum(self.values[:self.count]) / self.count
+
+
+class SMA:
+
+    __slots__ = ("period", "window", "total")
+
+    def __init__(self, period: int):
+        self.period = period
+        self.window = RingBuffer(period)
+        self.total = 0.0
+
+    def update(self, value: float) -> Union[float, None]:
+        dropped = self.window.push(value)
+        self.total += value - (dropped or 0.0)
+        return self.total / self.period if self.window.full() else None
+
+
+class EMA:
+    """Seeded with the average of its first period values, like talib"""
+
+    __slots__ = ("period", "alpha", "value", "seed")
+
+    def __init__(self, period: int):
+        self.period = period
+        self.alpha = 2.0 / (period + 1)
+        self.value: Union[float, None] = None
+        self.seed = RingBuffer(period)
+
+    def start(self, seed: float):
+        """Starts from a given seed, for callers that align several averages"""
+        self.value = seed
+
+    def update(self, value: float) -> Union[float, None]:
+        if self.value is None:
+            self.seed.push(value)
+            if self.seed.full():
+                self.value = self.seed.mean()
+            return self.value
+
+        self.value += self.alpha * (value - self.value)
+        return self.value
+
+
+class RSI:
+    """Wilder's RSI, seeded with the simple average gain and loss of the first period changes"""
+
+    __slots__ = ("period", "previous", "changes", "gain", "loss")
+
+    def __init__(self, period: int = 14):
+        self.period = period
+        self.previous: Union[float, None] = None
+        self.changes = 0
+        self.gain = 0.0
+        self.loss = 0.0
+
+    def update(self, value: float) -> Union[float, None]:
+        if self.previous is None:
+            self.previous = value
+            return None
+
+        change = value - self.previous
+        self.previous = value
+        gain, loss = max(change, 0.0), max(-change, 0.0)
+
+        if self.changes < self.period:
+            #simple sums until the first period changes are in
+            self.changes += 1
+            self.gain += gain
+            self.loss += loss
+
+            if self.changes < self.period:
+                return None
+
+            self.gain /= self.period
+            self.loss /= self.period
+        else:
+            self.gain = (self.gain * (self.period - 1) + gain) / self.period
+            self.loss = (self.loss * (self.period - 1) + loss) / self.period
+
+        total = self.gain + self.loss
+        return 100.0 * self.gain / total if total > 1e-14 else 0.0
+
+
+class MACD:
+    """MACD line and signal line
+
+        talib starts the fast and slow EMAs on the same candle, the slow period-th one, each
+        seeded with the average of its own last period closes, and only reports the line once
+        the signal EMA is seeded as well. Both are reproduced here."""
+
+    __slots__ = ("fast", "slow", "signal", "closes", "macd")
+
+    def __init__(self, fast: int = 12, slow: int = 26, signal: int = 9):
+        self.fast = EMA(fast)
+        self.slow = EMA(slow)
+        self.signal = EMA(signal)
+        self.closes = RingBuffer(slow)
+        self.macd: Union[float, None] = None
+
+    def update(self, value: float) -> tuple[Union[float, None], Union[float, None]]:
+        if self.slow.value is None:
+            self.closes.push(value)
+            if not self.closes.full():
+                return None, None
+
+            #seed both averages from the closes seen so far, in order oldest to newest
+            start = self.closes._next
+            ordered = self.closes.values[start:] + self.closes.values[:start]
+            self.slow.start(sum(ordered) / len(ordered))
+            self.fast.start(sum(ordered[-self.fast.period:]) / self.fast.period)
+        else:
+            self.fast.update(value)
+            self.slow.update(value)
+
+        self.macd = self.fast.value - self.slow.value
+        signal = self.signal.update(self.macd)
+
+        if signal is None:
+            return None, None
+        return self.macd, signal
+
+
+class Return:
+    """Change since the previous candle, like pandas pct_change"""
+
+    __slots__ = ("previous",)
+
+    def __init__(self):
+        self.previous: Union[float, None] = None
+
+    def update(self, value: float) -> Union[float, None]:
+        previous, self.previous = self.previous, value
+        if previous is None or previous == 0:
+            return None
+        return value / previous - 1.0
+
+
+class FeatureEngine:
+    """The SOL model's features for one symbol, updated with every closed candle"""
+
+    __slots__ = ("sma", "rsi", "macd", "ret", "candles")
+
+    def __init__(self):
+        self.sma = SMA(50)
+        self.rsi = RSI(14)
+        self.macd = MACD(12, 26, 9)
+        self.ret = Return()
+        self.candles = 0
+
+    def update(self, close: float) -> Union[tuple[float, ...], None]:
+        """Features in FEATURES order for this close, None while any indicator is still warming up"""
+
+        self.candles += 1
+        sma = self.sma.update(close)
+        rsi = self.rsi.update(close)
+        macd, signal = self.macd.update(close)
+        ret = self.ret.update(close)
+
+        if sma is None or rsi is None or macd is None or ret is None:
+            return None
+        return sma, rsi, macd, signal, ret
+
+    def warm_up(self, closes: Iterable[float]) -> Union[tuple[float, ...], None]:
+        """Feeds history in order and returns the features of the last close"""
+
+        features = None
+        for close in closes:
+            features = self.update(float(close))
+        return features
+
+
+def compare_with_talib(closes: list[float], skip: int = 0) -> dict[str, float]:
+    """Largest absolute difference per feature between FeatureEngine and talib on the same closes
+
+        skip leaves out the first candles, where both are still converging"""
+
+    import numpy as np
+    import talib
+
+    close = np.asarray(closes, dtype=np.float64)
+    macd, macd_signal, _ = talib.MACD(close)
+    reference = {
+        "sma_50": talib.SMA(close, timeperiod=50),
+        "rsi": talib.RSI(close, timeperiod=14),
+        "macd": macd,
+        "macd_signal": macd_signal,
+        "return_1h": np.concatenate(([np.nan], close[1:] / close[:-1] - 1))
+    }
+
+    engine = FeatureEngine()
+    differences = {name: 0.0 for name in FEATURES}
+
+    for i, value in enumerate(close.tolist()):
+        features = engine.update(value)
+
+        if i < skip:
+            continue
+
+        for position, name in enumerate(FEATURES):
+            expected = reference[name][i]
+            ready = features is not None
+
+            if math.isnan(expected):
+                #talib has no value yet, the engine may only be missing this one or all of them
+                if ready:
+                    differences[name] = math.inf
+                continue
+
+            if not ready:
+                #only an issue if talib has every feature for this candle
+                if all(not math.isnan(reference[other][i]) for other in FEATURES):
+                    differences[name] = math.inf
+                continue
+
+            differences[name] = max(differences[name], abs(features[position] - expected))
+
+    return differences
+
+
+def main():
+    import time
+    import numpy as np
+
+    parser = argparse.ArgumentParser(description="Checks the streaming indicators against talib and times them")
+    parser.add_argument("--csv", help="candles with a close column, a random walk is used without one")
+    parser.add_argument("--candles", type=int, default=1000)
+    args = parser.parse_args()
+
+    if args.csv:
+        import pandas as pd
+        closes = pd.read_csv(args.csv)["close"].astype(float).tolist()
+    else:
+        rng = np.random.default_rng(7)
+        closes = (150 * np.exp(np.cumsum(rng.normal(0, 0.01, args.candles)))).tolist()
+
+    for name, difference in compare_with_talib(closes).items():
+        print(f"{name:12} max abs difference {difference:.3e}")
+
+    engine = FeatureEngine()
+    start = time.perf_counter()
+    engine.warm_up(closes)
+    per_candle = (time.perf_counter() - start) / len(closes)
+    print(f"{per_candle * 1e6:.2f}us per candle over {len(closes)} candles")
+
+
+if __name__ == "__main__":
+    main()
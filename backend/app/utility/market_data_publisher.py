@@ -0,0 +1,64 @@
+from app.utility.MarketData import MarketData, MarketSnapshot
+from app.utility.CoinbaseClient import CoinbaseClient, client_stats
+from app.utility.environment import environment
+import logging
+import time
+
+
+
+logger = logging.getLogger()
+
+
+class MarketDataPublisher:
+    """Polls the tickers of every product once and publishes them for every generator
+
+        Runs as its own supervised process. Every MARKET_DATA_INTERVAL seconds the public product
+        list is fetched with a single call and what changed since the last snapshot goes out
+        through MarketData, so adding market driven bots adds readers, not exchange calls."""
+
+    def __init__(self, market_data: MarketData = None, client: CoinbaseClient = None):
+        self.market_data = market_data if market_data is not None else MarketData()
+        #public market endpoints need no user token
+        self.client = client if client is not None else CoinbaseClient(None)
+        self.published = 0
+
+    def poll_once(self) -> bool:
+        """Fetches the products and publishes the changes, True if there were any"""
+
+        products = self.client.get_market_products(product_type=environment.MARKET_DATA_PRODUCT_TYPE)
+        snapshot = MarketSnapshot.from_products(products)
+
+        if self.market_data.publish(snapshot) is None:
+            return False
+
+        self.published += 1
+        return True
+
+    def run(self):
+        #continue from the snapshot an earlier publisher left behind instead of sending everything again
+        previous = self.market_data.load()
+        logger.info(f"Market data publisher starting from {len(previous)} products, polling every {environment.MARKET_DATA_INTERVAL}s")
+
+        while True:
+            started = time.monotonic()
+
+            try:
+                changed = self.poll_once()
+                logger.debug(f"Market data {'published' if changed else 'unchanged'} for {len(self.market_data.snapshot)} products in {time.monotonic() - started:.2f}s")
+
+                if self.published and self.published % 100 == 0:
+                    logger.info(f"Market data published {self.published} snapshots, coinbase latency {client_stats.snapshot()}")
+
+            except Exception as e:
+                logger.error(f"Market data poll failed: {e}")
+
+            time.sleep(max(0.0, environment.MARKET_DATA_INTERVAL - (time.monotonic() - started)))
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    MarketDataPublisher().run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,23 @@
+from app.utility.environment import environment
+import redis
+import threading
+
+
+
+_pools: dict[bool, redis.ConnectionPool] = {}
+_pools_guard = threading.Lock()
+
+
+def get_redis_client(decode_responses: bool = True) -> redis.StrictRedis:
+    """Returns a client backed by the connection pool shared by everything in this process
+
+        redis-py resets a pool that was inherited through a fork, so bot processes started
+        by the bot manager get their own connections"""
+
+    with _pools_guard:
+        pool = _pools.get(decode_responses)
+        if pool is None:
+            pool = redis.ConnectionPool(host=environment.REDIS_HOST, port=environment.REDIS_PORT, decode_responses=decode_responses)
+            _pools[decode_responses] = pool
+
+    return redis.StrictRedis(connection_pool=pool)
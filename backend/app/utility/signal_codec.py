@@ -0,0 +1,138 @@
+from dataclasses import dataclass, field
+from typing import Union
+import random
+import struct
+import time
+
+
+
+"""Trade signal shared by every bot and its compact binary encoding
+
+    Version 1 layout, network byte order:
+
+        version     u8
+        side        u8      1 = BUY, 2 = SELL
+        flags       u8      which of the optional sizing fields follow
+        signal_id   u64
+        created_at  f64     unix seconds
+        product     u8 length + utf-8 product id, e.g. BTC-USD
+        quote_size  f64     if flags & QUOTE_SIZE
+        base_size   f64     if flags & BASE_SIZE
+        limit_price f64     if flags & LIMIT_PRICE
+
+    A $50 BTC-USD market buy is 35 bytes, the JSON signals Profit_Model used to send were ~110."""
+
+
+VERSION = 1
+
+BUY = "BUY"
+SELL = "SELL"
+
+_SIDES = {BUY: 1, SELL: 2}
+_SIDE_NAMES = {code: name for name, code in _SIDES.items()}
+
+QUOTE_SIZE = 0x01
+BASE_SIZE = 0x02
+LIMIT_PRICE = 0x04
+
+_HEADER = struct.Struct("!BBBQdB")
+_DOUBLE = struct.Struct("!d")
+
+
+class SignalDecodeError(ValueError):
+    pass
+
+
+def new_signal_id() -> int:
+    """64 bit id that sorts by creation time, milliseconds with 20 random bits below them"""
+    return (time.time_ns() // 1_000_000) << 20 | random.getrandbits(20)
+
+
+@dataclass(slots=True)
+class Signal:
+    """A trade every subscriber of a bot should make"""
+
+    product_id: str
+    side: str
+    quote_size: Union[float, None] = None     #amount of the quote currency to spend, e.g. USD
+    base_size: Union[float, None] = None      #amount of the base currency to trade, e.g. BTC
+    limit_price: Union[float, None] = None    #None for market orders
+    signal_id: int = field(default_factory=new_signal_id)
+    created_at: float = field(default_factory=time.time)
+
+    @property
+    def base_currency(self) -> str:
+        return self.product_id.split("-")[0]
+
+    @property
+    def quote_currency(self) -> str:
+        return self.product_id.split("-")[-1]
+
+    def __str__(self) -> str:
+        description = f"{self.signal_id}:{self.side}:{self.product_id}"
+        if self.quote_size is not None:
+            description += f":{self.quote_size} {self.quote_currency}"
+        if self.base_size is not None:
+            description += f":{self.base_size} {self.base_currency}"
+        if self.limit_price is not None:
+            description += f"@{self.limit_price}"
+        return description
+
+
+def encode(signal: Signal) -> bytes:
+
+    if signal.side not in _SIDES:
+        raise ValueError(f"Unknown side {signal.side}")
+
+    product = signal.product_id.encode("utf-8")
+
+    if len(product) > 255:
+        raise ValueError(f"Product id {signal.product_id} is too long")
+
+    flags = 0
+    optional = b""
+
+    for flag, value in ((QUOTE_SIZE, signal.quote_size), (BASE_SIZE, signal.base_size), (LIMIT_PRICE, signal.limit_price)):
+        if value is not None:
+            flags |= flag
+            optional += _DOUBLE.pack(value)
+
+    return _HEADER.pack(VERSION, _SIDES[signal.side], flags, signal.signal_id, signal.created_at, len(product)) + product + optional
+
+
+def decode(data: bytes) -> Signal:
+
+    try:
+        version, side, flags, signal_id, created_at, product_length = _HEADER.unpack_from(data, 0)
+    except struct.error as e:
+        raise SignalDecodeError(f"Truncated signal: {e}")
+
+    if version != VERSION:
+        raise SignalDecodeError(f"Unsupported signal version {version}")
+
+    if side not in _SIDE_NAMES:
+        raise SignalDecodeError(f"Unknown side {side}")
+
+    offset = _HEADER.size
+
+    if offset + product_length > len(data):
+        raise SignalDecodeError(f"Truncated signal: product id needs {product_length} bytes, {len(data) - offset} left")
+
+    try:
+        product_id = data[offset:offset + product_length].decode("utf-8")
+    except UnicodeDecodeError as e:
+        raise SignalDecodeError(f"Product id is not valid UTF-8: {e}")
+
+    offset += product_length
+
+    values = {}
+
+    try:
+        for name, flag in (("quote_size", QUOTE_SIZE), ("base_size", BASE_SIZE), ("limit_price", LIMIT_PRICE)):
+            if flags & flag:
+                values[name] = _DOUBLE.unpack_from(data, offset)[0]
+                offset += _DOUBLE.size
+    except struct.error as e:
+        raise SignalDecodeError(f"Truncated signal: {e}")
+
+    return Signal(product_id=product_id, side=_SIDE_NAMES[side], signal_id=signal_id, created_at=created_at, **values)
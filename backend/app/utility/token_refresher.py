@@ -0,0 +1,100 @@
+from app.database.db_connection import context_get_session
+from app.database.models import Exchange_Auth_Token
+from app.utility.TokenService import TokenService
+from app.utility.environment import environment
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy.future import select
+from datetime import datetime, timezone
+from typing import Union
+import threading
+import logging
+
+
+
+logger = logging.getLogger()
+
+
+class TokenRefresher:
+    """Refreshes exchange tokens shortly before they expire, away from the trade path
+
+        Every TOKEN_REFRESH_INTERVAL seconds the tokens that expire within TOKEN_REFRESH_AHEAD
+        seconds are refreshed, soonest first, by at most TOKEN_REFRESH_WORKERS threads. Each
+        refresh goes through TokenService, so it takes the same advisory lock as a lazy refresh.
+        Only attempts on a token that already expired count towards its three refresh attempts, so
+        early refreshes that fail leave the lazy path all of its attempts. Tokens that used them up
+        are skipped so they can't fill a batch. Several API workers can run a refresher at once, the
+        lock makes the second one find the token already refreshed."""
+
+    def __init__(self):
+        self.refreshed = 0
+        self.failed = 0
+        self._stop = threading.Event()
+        self._thread: Union[threading.Thread, None] = None
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.__run, name="token-refresher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+
+    def refresh_expiring(self) -> int:
+        """Refreshes the tokens due in the next TOKEN_REFRESH_AHEAD seconds, returns how many were refreshed"""
+
+        due_before = int(datetime.now(timezone.utc).timestamp()) + environment.TOKEN_REFRESH_AHEAD
+
+        with context_get_session() as db:
+            due = db.execute(
+                select(Exchange_Auth_Token.user_id, Exchange_Auth_Token.exchange_name)
+                .where(Exchange_Auth_Token.expires_at <= due_before)
+                #expired tokens out of refresh attempts are left to the lazy refresh, which deletes them
+                .where(Exchange_Auth_Token.refresh_attempts < 3)
+                .order_by(Exchange_Auth_Token.expires_at)
+                .limit(environment.TOKEN_REFRESH_BATCH)
+            ).all()
+
+        if not due:
+            return 0
+
+        with ThreadPoolExecutor(max_workers=environment.TOKEN_REFRESH_WORKERS, thread_name_prefix="token-refresh") as executor:
+            results = list(executor.map(lambda token: self.__refresh(token.user_id, token.exchange_name), due))
+
+        refreshed = sum(results)
+        self.refreshed += refreshed
+        self.failed += len(results) - refreshed
+
+        logger.info(f"Refreshed {refreshed} of {len(due)} expiring exchange tokens")
+        return refreshed
+
+    def __refresh(self, user_id: int, exchange_name: str) -> bool:
+
+        #sessions can't be shared between threads
+        with context_get_session() as db:
+            try:
+                return TokenService(user_id=user_id, db=db).refresh_token(exchange_name=exchange_name, buffer_seconds=environment.TOKEN_REFRESH_AHEAD) is not None
+            except Exception as e:
+                logger.error(f"Error while refreshing the {exchange_name} token of user {user_id}: {e}")
+                return False
+
+    def __run(self):
+
+        while not self._stop.is_set():
+            try:
+                refreshed = self.refresh_expiring()
+            except Exception as e:
+                logger.error(f"Token refresher failed: {e}")
+                refreshed = 0
+
+            #a fully refreshed batch means more tokens may be waiting, go again straight away
+            if refreshed < environment.TOKEN_REFRESH_BATCH:
+                self._stop.wait(environment.TOKEN_REFRESH_INTERVAL)
+
+
+token_refresher = TokenRefresher()
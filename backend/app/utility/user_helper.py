@@ -3,10 +3,12 @@ from app.database.schemas import UserSchema
 from app.utility.utils import get_password_hash, verify_password, decrypt_access_token
 from app.database.models import User
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import SQLAlchemyError
 from typing import Union
 from sqlalchemy.future import select
 from fastapi import HTTPException, status
+import asyncio
 import logging
 
 logger = logging.getLogger()
@@ -97,3 +99,83 @@ def get_current_user(token: str, db: Session) -> User:
     return user
     
 
+
+# Async variants for the async routes, bcrypt runs in a thread so it doesn't block the event loop
+
+async def add_user_to_db_async(user: UserSchema, db: AsyncSession) -> Union[User, None]:
+    '''Add the user to the database'''
+
+    # check is this user is already in the db
+    existing_username = await get_user_by_username_async(user.username, db)
+    if existing_username is not None:
+        logger.error(f"A user with username {user.username} already exists")
+        return None
+
+    existing_email = await get_user_by_email_async(user.email, db)
+    if existing_email is not None:
+        logger.error(f"A user with email {user.email} already exists")
+        return None
+
+    new_user = User(
+        first_name=user.first_name,
+        last_name=user.last_name,
+        email=user.email,
+        username=user.username,
+        hashed_password=await asyncio.to_thread(get_password_hash, user.password)
+    )
+
+    try:
+        db.add(new_user)
+        await db.commit()
+        await db.refresh(new_user)
+        return new_user
+
+    except SQLAlchemyError as e:
+        logger.error(f"DB error trying to add {user.username}")
+        await db.rollback()
+        return None
+
+async def get_user_by_username_async(username: str, db: AsyncSession) -> Union[User, None]:
+    '''Gets the user from the database based on the provided username'''
+
+    result = await db.execute(select(User).where(User.username == username))
+    return result.scalars().first()
+
+async def get_user_by_email_async(email: str, db: AsyncSession) -> Union[User, None]:
+    '''Gets the user from the database based on the provided email'''
+
+    result = await db.execute(select(User).where(User.email == email))
+    return result.scalars().first()
+
+async def get_user_by_id_async(user_id: str, db: AsyncSession) -> Union[User, None]:
+    '''Gets the user from the database based on the provided id'''
+
+    result = await db.execute(select(User).where(User.id == user_id))
+    return result.scalars().first()
+
+async def authenticate_user_async(username: str, password: str, db: AsyncSession) -> Union[User, None]:
+    user = await get_user_by_username_async(username=username, db=db)
+    if user is None:
+        return None
+    if not await asyncio.to_thread(verify_password, password, user.hashed_password):
+        return None
+    return user
+
+async def get_current_user_async(token: str, db: AsyncSession) -> User:
+
+    credentials_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Could not validate credentials"
+    )
+
+    username = decrypt_access_token(token)
+
+    if username is None:
+        raise credentials_exception
+
+    user = await get_user_by_username_async(username=username, db=db)
+
+    if user is None:
+        raise credentials_exception
+
+    return user
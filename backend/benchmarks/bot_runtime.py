@@ -0,0 +1,172 @@
+import multiprocessing
+import argparse
+import asyncio
+import logging
+import time
+import os
+from sqlalchemy.sql import text
+from app.bots.runtime import run_hosted
+
+
+"""Compares the memory use and connection counts of the two bot runtimes
+
+    python -m benchmarks.bot_runtime --bots 20
+
+Starts the same number of placeholder bots twice, once as a generator and a processor process
+per bot (the "process" runtime) and once as tasks inside a single shared runtime process (the
+"asyncio" runtime). Every placeholder loads the same libraries as the real bots and opens its
+Redis and Postgres connections through the shared helpers. Once they settle, the benchmark
+reports the total proportional set size (PSS) and the established TCP connections to Redis and
+Postgres for each mode. Redis and Postgres should be running (docker-compose up) for the
+connection counts to mean anything, memory is measured either way."""
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("bot_runtime_benchmark")
+
+
+def placeholder_bot(bot_id: int):
+    """Stands in for a generator or processor, loads the bot stack and holds its connections open"""
+
+    import pandas, coinbase.wallet.client  # noqa: F401, loaded by real bots as well
+    from app.utility.redis_helper import get_redis_client
+    from app.database.db_connection import context_get_session
+
+    try:
+        get_redis_client().ping()
+    except Exception as e:
+        logger.warning(f"Bot {bot_id} could not reach redis: {e}")
+
+    try:
+        with context_get_session() as db:
+            db.execute(text("SELECT 1"))
+    except Exception as e:
+        logger.warning(f"Bot {bot_id} could not reach postgres: {e}")
+
+    while True:
+        time.sleep(1)
+
+
+def shared_runtime(entry_count: int):
+    asyncio.run(run_hosted([(f"placeholder:{i}", placeholder_bot, i) for i in range(entry_count)]))
+
+
+def start_process_mode(context, bots: int) -> list:
+    processes = [context.Process(target=placeholder_bot, args=(i,), name=f"placeholder:{i}") for i in range(bots * 2)]
+    for process in processes:
+        process.start()
+    return processes
+
+
+def start_shared_mode(context, bots: int) -> list:
+    process = context.Process(target=shared_runtime, args=(bots * 2,), name="placeholder:shared")
+    process.start()
+    return [process]
+
+
+def process_pss_kb(pid: int) -> int:
+    """PSS splits pages shared between processes fairly, RSS would count them once per process"""
+
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as file:
+            for line in file:
+                if line.startswith("Pss:"):
+                    return int(line.split()[1])
+    except FileNotFoundError:
+        pass
+
+    with open(f"/proc/{pid}/status") as file:
+        for line in file:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    return 0
+
+
+def established_remote_ports() -> dict[str, int]:
+    """Maps socket inode -> remote port of every established TCP connection on this machine"""
+
+    ports = {}
+    for table in ("/proc/net/tcp", "/proc/net/tcp6"):
+        if not os.path.exists(table):
+            continue
+        with open(table) as file:
+            next(file)
+            for line in file:
+                fields = line.split()
+                if fields[3] != "01":  #ESTABLISHED
+                    continue
+                ports[fields[9]] = int(fields[2].split(":")[1], 16)
+    return ports
+
+
+def connection_counts(pids: list[int], redis_port: int, postgres_port: int) -> tuple[int, int]:
+
+    ports = established_remote_ports()
+    redis_connections = 0
+    postgres_connections = 0
+
+    for pid in pids:
+        for fd in os.listdir(f"/proc/{pid}/fd"):
+            try:
+                link = os.readlink(f"/proc/{pid}/fd/{fd}")
+            except OSError:
+                continue
+            if not link.startswith("socket:["):
+                continue
+            port = ports.get(link[8:-1])
+            if port == redis_port:
+                redis_connections += 1
+            elif port == postgres_port:
+                postgres_connections += 1
+
+    return redis_connections, postgres_connections
+
+
+def measure(mode: str, start, context, bots: int, settle: float, redis_port: int, postgres_port: int) -> dict:
+
+    processes = start(context, bots)
+
+    try:
+        time.sleep(settle)
+        pids = [process.pid for process in processes if process.is_alive()]
+        pss_kb = sum(process_pss_kb(pid) for pid in pids)
+        redis_connections, postgres_connections = connection_counts(pids, redis_port, postgres_port)
+    finally:
+        for process in processes:
+            process.terminate()
+            process.join()
+
+    return {
+        "mode": mode,
+        "processes": len(pids),
+        "pss_mb": round(pss_kb / 1024, 1),
+        "redis_connections": redis_connections,
+        "postgres_connections": postgres_connections
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the process and asyncio bot runtimes")
+    parser.add_argument("--bots", type=int, default=10, help="number of bots to start in each mode")
+    parser.add_argument("--settle", type=float, default=10.0, help="seconds to wait before measuring")
+    parser.add_argument("--start-method", default="spawn", choices=multiprocessing.get_all_start_methods(), help="how bot processes are started")
+    parser.add_argument("--postgres-port", type=int, default=5432)
+    args = parser.parse_args()
+
+    from app.utility.environment import environment
+
+    context = multiprocessing.get_context(args.start_method)
+
+    results = [
+        measure("process", start_process_mode, context, args.bots, args.settle, environment.REDIS_PORT, args.postgres_port),
+        measure("asyncio", start_shared_mode, context, args.bots, args.settle, environment.REDIS_PORT, args.postgres_port)
+    ]
+
+    print(f"\n{args.bots} bots, {args.start_method} start method")
+    print(f"{'mode':<10}{'processes':>10}{'PSS MB':>10}{'redis conns':>14}{'postgres conns':>16}")
+    for result in results:
+        print(f"{result['mode']:<10}{result['processes']:>10}{result['pss_mb']:>10}{result['redis_connections']:>14}{result['postgres_connections']:>16}")
+
+
+if __name__ == "__main__":
+    main()
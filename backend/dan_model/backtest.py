@@ -0,0 +1,353 @@
+import argparse
+import itertools
+import time
+from dataclasses import dataclass, field
+from typing import Callable
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from candle_store import CandleStore, CcxtFetcher, FixtureFetcher, last_closed, timeframe_ms
+
+
+"""Vectorized walk-forward backtests over the candle store
+
+    python backtest.py --offline --strategy momentum --limit 5000
+    python backtest.py --offline --strategy model --model models/<version>/SOL_USDT/h168
+
+A strategy is an entry rule and an exit rule. The entry rule turns the candles and one set of
+parameters into a boolean array, True where the strategy would buy at that candle's close. The exit
+rule gives, for every candle, where a position opened there is closed and at what price. Both are
+whole-array NumPy operations, so the only Python loop is the one that steps from one trade's exit
+to the next entry.
+
+Positions are long only, one at a time, and buy at market at the entry close plus slippage. A
+take profit is a resting limit sell that fills at its price once a later high reaches it, like the
+Profit_Model processor's orders. Anything else leaves at market at a close, minus slippage. Fees
+are charged on both sides.
+
+Walk-forward: the history is cut into consecutive folds. For every fold the parameters that did
+best on the train window before it are run on its test window, and only the test windows count
+towards the reported result. The model strategy scores with an already trained model, so test
+windows inside the history it was trained on are in sample for the model itself."""
+
+
+@dataclass(frozen=True, slots=True)
+class Candles:
+    timestamp: np.ndarray
+    open: np.ndarray
+    high: np.ndarray
+    low: np.ndarray
+    close: np.ndarray
+    volume: np.ndarray
+
+    @classmethod
+    def from_rows(cls, rows: np.ndarray) -> "Candles":
+        return cls(*(np.ascontiguousarray(rows[:, column]) for column in range(6)))
+
+    def __len__(self) -> int:
+        return len(self.close)
+
+    def slice(self, start: int, end: int) -> "Candles":
+        return Candles(*(values[start:end] for values in (self.timestamp, self.open, self.high, self.low, self.close, self.volume)))
+
+
+@dataclass(frozen=True, slots=True)
+class Costs:
+    fee: float = 0.006          # per side, Coinbase Advanced taker fee at the lowest tier
+    maker_fee: float = 0.004    # limit orders resting on the book
+    slippage: float = 0.0005    # market orders fill this much worse than the close
+
+
+@dataclass(slots=True)
+class Result:
+    params: dict
+    trades: int = 0
+    total_return: float = 0.0
+    max_drawdown: float = 0.0   # on the equity after every closed trade
+    win_rate: float = 0.0
+    average_trade: float = 0.0
+    turnover: float = 0.0       # notional traded, in multiples of the starting equity
+    exposure: float = 0.0       # share of candles a position was open
+    returns: np.ndarray = field(default_factory=lambda: np.empty(0))
+
+    def summary(self) -> str:
+        return (f"{self.trades} trades, return {self.total_return:+.2%}, max drawdown {self.max_drawdown:.2%}, "
+                f"win rate {self.win_rate:.1%}, avg trade {self.average_trade:+.2%}, turnover {self.turnover:.1f}x, exposure {self.exposure:.1%}")
+
+
+# Entry rules: (candles, params) -> bool array
+
+def momentum_entry(candles: Candles, params: dict) -> np.ndarray:
+    """Buys after the price rose more than min_change over lookback candles, the Model_Test / Profit_Model rule"""
+
+    lookback = params.get("lookback", 24)
+    change = np.full(len(candles), np.nan)
+    change[lookback:] = candles.close[lookback:] / candles.close[:-lookback] - 1
+    return change > params["min_change"]
+
+
+def prediction_entry(predictions: np.ndarray, timestamps: np.ndarray) -> Callable[[Candles, dict], np.ndarray]:
+    """Buys when a model's predicted return for a candle is above threshold
+
+        predictions are for the candles at timestamps, the entry rule is given slices of them"""
+
+    def entry(candles: Candles, params: dict) -> np.ndarray:
+        #walk-forward windows start anywhere in the history, line them up by time
+        first = int(np.searchsorted(timestamps, candles.timestamp[0])) if len(candles) else 0
+        last = first + len(candles)
+
+        if last > len(timestamps) or (len(candles) and (timestamps[first] != candles.timestamp[0] or timestamps[last - 1] != candles.timestamp[-1])):
+            raise ValueError("candles are not a slice of the candles the predictions were made for")
+
+        return predictions[first:last] > params["threshold"]
+
+    return entry
+
+
+# Exit rules: (candles, params) -> (exit index, exit price, exit was a limit fill) for a position opened at every candle
+
+def take_profit_exit(candles: Candles, params: dict) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Limit sell at take_profit above the entry, a market sell after max_hold candles if it never fills"""
+
+    n = len(candles)
+    hold = min(params.get("max_hold", 168), max(n - 1, 1))
+    target = candles.close * (1 + params["take_profit"])
+
+    #high of every candle after the entry, padded so every entry has a full window
+    highs = sliding_window_view(np.concatenate((candles.high[1:], np.full(hold, -np.inf))), hold)[:n]
+    hit = highs >= target[:, None]
+    filled = hit.any(axis=1)
+    first = hit.argmax(axis=1)
+
+    exit_index = np.minimum(np.arange(n) + np.where(filled, first + 1, hold), n - 1)
+    exit_price = np.where(filled, target, candles.close[exit_index])
+    return exit_index, exit_price, filled
+
+
+def _select_trades(entries: np.ndarray, exit_index: np.ndarray) -> np.ndarray:
+    """Entry candles actually taken when only one position can be open, each one after the previous exit"""
+
+    candidates = np.flatnonzero(entries)
+    taken = []
+    position = 0
+
+    while position < len(candidates):
+        entry = candidates[position]
+        taken.append(entry)
+        #jump straight to the first candidate after this trade's exit
+        position = np.searchsorted(candidates, exit_index[entry], side="right")
+
+    return np.asarray(taken, dtype=np.int64)
+
+
+def run(candles: Candles, entry_rule, exit_rule, params: dict, costs: Costs = Costs(), exits=None) -> Result:
+    """Backtests one parameter set, exits can be passed in when several entry settings share them"""
+
+    n = len(candles)
+    entries = entry_rule(candles, params)
+    exit_index, exit_price, limit_fill = exits if exits is not None else exit_rule(candles, params)
+
+    #a position needs a later candle to leave on
+    entries[-1:] = False
+    trades = _select_trades(entries, exit_index)
+
+    result = Result(params=params)
+    if not len(trades):
+        return result
+
+    bought = candles.close[trades] * (1 + costs.slippage)
+    sold = np.where(limit_fill[trades], exit_price[trades], exit_price[trades] * (1 - costs.slippage))
+    sell_fee = np.where(limit_fill[trades], costs.maker_fee, costs.fee)
+
+    returns = sold * (1 - sell_fee) / (bought * (1 + costs.fee)) - 1
+    equity = np.cumprod(1 + returns)
+    peaks = np.maximum.accumulate(np.concatenate(([1.0], equity)))[1:]
+
+    result.trades = len(trades)
+    result.returns = returns
+    result.total_return = float(equity[-1] - 1)
+    result.max_drawdown = float(np.max(1 - equity / peaks))
+    result.win_rate = float(np.mean(returns > 0))
+    result.average_trade = float(np.mean(returns))
+    #the whole equity is bought and sold on every trade
+    result.turnover = float(np.sum(np.concatenate(([1.0], equity[:-1])) * (2 + returns)))
+    result.exposure = float(np.sum(exit_index[trades] - trades) / n)
+    return result
+
+
+def grid(**values) -> list[dict]:
+    """Every combination of the given parameter values"""
+
+    names = list(values)
+    return [dict(zip(names, combination)) for combination in itertools.product(*values.values())]
+
+
+def search(candles: Candles, entry_rule, exit_rule, combinations: list[dict], costs: Costs, exit_keys: tuple = ("take_profit", "max_hold")) -> list[Result]:
+    """Runs every combination, exits are computed once per distinct exit setting"""
+
+    exit_cache = {}
+    results = []
+
+    for params in combinations:
+        key = tuple(params.get(name) for name in exit_keys)
+        if key not in exit_cache:
+            exit_cache[key] = exit_rule(candles, params)
+        results.append(run(candles, entry_rule, exit_rule, params, costs, exits=exit_cache[key]))
+
+    return results
+
+
+def score(result: Result, min_trades: int = 3) -> float:
+    """What the walk-forward picks parameters by, return per unit of drawdown"""
+
+    if result.trades < min_trades:
+        return -np.inf
+    return result.total_return / max(result.max_drawdown, 0.01)
+
+
+def fold_windows(n: int, folds: int, train_share: float = 0.6) -> list[tuple[int, int, int]]:
+    """(train start, test start, test end) of every walk-forward fold over n candles"""
+
+    train = int(n * train_share)
+    test = (n - train) // folds
+
+    if test < 2:
+        raise ValueError(f"{n} candles are not enough for {folds} folds")
+
+    return [(train + fold * test - train, train + fold * test, train + (fold + 1) * test) for fold in range(folds)]
+
+
+def check_slicing(candles: Candles, entry_rule, exit_rule, params: dict, costs: Costs, start: int, end: int, warm_up: int = 0) -> bool:
+    """True if a run on candles.slice(start, end) trades like the whole history's entries over those candles
+
+        Entry rules are only ever given windows of the history and have to line them up themselves, this
+        catches one that doesn't. warm_up skips the first candles of the window a rule can't judge yet."""
+
+    window = candles.slice(start, end)
+    sliced = entry_rule(window, params)
+    expected = entry_rule(candles, params)[start:end].copy()
+    expected[:warm_up] = sliced[:warm_up]
+
+    actual = run(window, entry_rule, exit_rule, params, costs)
+    reference = run(window, lambda candles, params: expected.copy(), exit_rule, params, costs)
+    return actual.trades == reference.trades and np.allclose(actual.returns, reference.returns)
+
+
+def walk_forward(candles: Candles, entry_rule, exit_rule, combinations: list[dict], costs: Costs, folds: int = 5, train_share: float = 0.6) -> tuple[list[tuple[dict, Result]], Result]:
+    """Picks parameters on each train window and tests them on the window after it
+
+        Returns the per fold (chosen params, test result) and the result of all test windows together"""
+
+    chosen = []
+    returns = []
+    turnover = exposure = 0.0
+    windows = fold_windows(len(candles), folds, train_share)
+
+    for train_start, test_start, test_end in windows:
+        train_candles = candles.slice(train_start, test_start)
+        test_candles = candles.slice(test_start, test_end)
+
+        best = max(search(train_candles, entry_rule, exit_rule, combinations, costs), key=score)
+        tested = run(test_candles, entry_rule, exit_rule, best.params, costs)
+
+        chosen.append((best.params, tested))
+        returns.append(tested.returns)
+        turnover += tested.turnover
+        exposure += tested.exposure * len(test_candles)
+
+    combined = Result(params={"walk_forward": folds})
+    all_returns = np.concatenate(returns)
+
+    if len(all_returns):
+        equity = np.cumprod(1 + all_returns)
+        peaks = np.maximum.accumulate(np.concatenate(([1.0], equity)))[1:]
+        combined.trades = len(all_returns)
+        combined.returns = all_returns
+        combined.total_return = float(equity[-1] - 1)
+        combined.max_drawdown = float(np.max(1 - equity / peaks))
+        combined.win_rate = float(np.mean(all_returns > 0))
+        combined.average_trade = float(np.mean(all_returns))
+        combined.turnover = turnover
+        combined.exposure = exposure / sum(test_end - test_start for _, test_start, test_end in windows)
+
+    return chosen, combined
+
+
+def model_predictions(candles: Candles, model_directory: str) -> np.ndarray:
+    """Predicted return for every candle from a train_pipeline artifact, NaN while the features warm up"""
+
+    import os
+    import joblib
+    import pandas as pd
+    from train_pipeline import FEATURES, build_features
+
+    model = joblib.load(os.path.join(model_directory, "model.pkl"))
+    scaler = joblib.load(os.path.join(model_directory, "scaler.pkl"))
+
+    features = build_features(pd.DataFrame({"close": candles.close}))[FEATURES]
+
+    ready = features.notna().all(axis=1).to_numpy()
+    predictions = np.full(len(candles), np.nan)
+    #one predict call for the whole history
+    predictions[ready] = model.predict(scaler.transform(features[ready]))
+    return predictions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Walk-forward backtest of a strategy over the candle store")
+    parser.add_argument("--symbol", default="SOL/USDT")
+    parser.add_argument("--timeframe", default="1h")
+    parser.add_argument("--limit", type=int, default=5000)
+    parser.add_argument("--exchange", default="kraken")
+    parser.add_argument("--offline", action="store_true", help="use the fixture candles instead of the exchange")
+    parser.add_argument("--fixture", help="csv of candles for --offline, synthetic candles without one")
+    parser.add_argument("--strategy", choices=["momentum", "model"], default="momentum")
+    parser.add_argument("--model", help="train_pipeline artifact directory for --strategy model")
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--fee", type=float, default=Costs().fee)
+    parser.add_argument("--maker-fee", type=float, default=Costs().maker_fee)
+    parser.add_argument("--slippage", type=float, default=Costs().slippage)
+    args = parser.parse_args()
+
+    store = CandleStore(exchange="fixture" if args.offline else args.exchange)
+    fetcher = FixtureFetcher(args.fixture) if args.offline else CcxtFetcher(args.exchange)
+
+    end = last_closed(args.timeframe)
+    start = end - (args.limit - 1) * timeframe_ms(args.timeframe)
+    store.ensure(args.symbol, args.timeframe, start, end, fetcher)
+    candles = Candles.from_rows(store.read(args.symbol, args.timeframe, start, end))
+
+    costs = Costs(fee=args.fee, maker_fee=args.maker_fee, slippage=args.slippage)
+    exits = dict(take_profit=[0.02, 0.04, 0.06, 0.10, 0.15, 0.25], max_hold=[24, 72, 168])
+
+    if args.strategy == "momentum":
+        entry_rule = momentum_entry
+        combinations = grid(min_change=np.round(np.arange(0.0, 0.21, 0.01), 2).tolist(), lookback=[12, 24, 48], **exits)
+    else:
+        if not args.model:
+            parser.error("--strategy model needs --model")
+        entry_rule = prediction_entry(model_predictions(candles, args.model), candles.timestamp)
+        combinations = grid(threshold=np.round(np.arange(0.0, 0.105, 0.005), 3).tolist(), **exits)
+
+    started = time.perf_counter()
+    results = search(candles, entry_rule, take_profit_exit, combinations, costs)
+    elapsed = time.perf_counter() - started
+
+    print(f"{len(combinations)} combinations over {len(candles)} candles in {elapsed:.2f}s, {len(combinations) / elapsed * 60:,.0f} per minute")
+    for result in sorted(results, key=score, reverse=True)[:5]:
+        print(f"  in sample {result.params}: {result.summary()}")
+
+    #the walk-forward only ever shows the rules windows of the history, they have to trade there like on all of it
+    warm_up = max(params.get("lookback", 0) for params in combinations)
+    best = max(results, key=score).params
+    for _, test_start, test_end in fold_windows(len(candles), args.folds):
+        if not check_slicing(candles, entry_rule, take_profit_exit, best, costs, test_start, test_end, warm_up):
+            raise SystemExit(f"{args.strategy} entries on candles {test_start}-{test_end} differ from the full history's, the backtest would be wrong")
+
+    chosen, combined = walk_forward(candles, entry_rule, take_profit_exit, combinations, costs, folds=args.folds)
+    for fold, (params, result) in enumerate(chosen):
+        print(f"  fold {fold + 1} {params}: {result.summary()}")
+    print(f"Walk-forward out of sample: {combined.summary()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+import json
+import logging
+import os
+import time
+import numpy as np
+import pandas as pd
+
+
+"""On-disk OHLCV store for training and backtests
+
+Candles are kept per exchange, symbol and timeframe as a flat file of float64 rows
+(timestamp ms, open, high, low, close, volume), sorted by time:
+
+    candles/kraken/SOL_USDT/1h.bin
+    candles/kraken/SOL_USDT/1h.json     the time range already fetched
+
+Reads memory-map the file and slice it, so asking for a range copies nothing. ensure() only
+asks the exchange for the part of a range that was never fetched, new candles are appended to
+the file. Only the candles the exchange actually returned count as fetched, so a short answer
+(an exchange that keeps little history, an empty page) is asked for again next time. FixtureFetcher stands in for the exchange so everything runs without a network.
+"""
+
+
+logger = logging.getLogger("candle_store")
+
+COLUMNS = ["timestamp", "open", "high", "low", "close", "volume"]
+
+TIMEFRAME_SECONDS = {"m": 60, "h": 3600, "d": 86400, "w": 604800}
+
+
+def timeframe_ms(timeframe: str) -> int:
+    """'1h' -> 3600000"""
+    return int(timeframe[:-1]) * TIMEFRAME_SECONDS[timeframe[-1]] * 1000
+
+
+def last_closed(timeframe: str, now_ms: int = None) -> int:
+    """Open time of the newest candle that has closed"""
+
+    step = timeframe_ms(timeframe)
+    now_ms = now_ms if now_ms is not None else int(time.time() * 1000)
+    return now_ms // step * step - step
+
+
+class CandleStore:
+
+    def __init__(self, root: str = None, exchange: str = "kraken"):
+        self.root = root or os.path.join(os.path.dirname(os.path.abspath(__file__)), "candles")
+        self.exchange = exchange
+
+    def __paths(self, symbol: str, timeframe: str) -> tuple[str, str]:
+        directory = os.path.join(self.root, self.exchange, symbol.replace("/", "_"))
+        os.makedirs(directory, exist_ok=True)
+        return os.path.join(directory, f"{timeframe}.bin"), os.path.join(directory, f"{timeframe}.json")
+
+    def coverage(self, symbol: str, timeframe: str):
+        """(start, end) open times already fetched, None if nothing was"""
+
+        _, meta_path = self.__paths(symbol, timeframe)
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path, "r") as file:
+            meta = json.load(file)
+        return meta["start"], meta["end"]
+
+    def read(self, symbol: str, timeframe: str, start: int = None, end: int = None) -> np.ndarray:
+        """Rows with start <= timestamp <= end, a read only view on the memory mapped file"""
+
+        data_path, _ = self.__paths(symbol, timeframe)
+        if not os.path.exists(data_path) or os.path.getsize(data_path) == 0:
+            return np.empty((0, len(COLUMNS)))
+
+        rows = np.memmap(data_path, dtype=np.float64, mode="r").reshape(-1, len(COLUMNS))
+        timestamps = rows[:, 0]
+
+        first = 0 if start is None else int(np.searchsorted(timestamps, start, side="left"))
+        last = len(rows) if end is None else int(np.searchsorted(timestamps, end, side="right"))
+        return rows[first:last]
+
+    def frame(self, symbol: str, timeframe: str, start: int = None, end: int = None) -> pd.DataFrame:
+        """read() as a DataFrame indexed by time, like the one train_model.py used to build from ccxt"""
+
+        rows = self.read(symbol, timeframe, start, end)
+        df = pd.DataFrame(rows[:, 1:], columns=COLUMNS[1:], index=pd.to_datetime(rows[:, 0].astype(np.int64), unit="ms"), copy=False)
+        df.index.name = "timestamp"
+        return df
+
+    def ensure(self, symbol: str, timeframe: str, start: int, end: int, fetcher) -> int:
+        """Fetches whatever part of [start, end] was never fetched, returns how many candles were added"""
+
+        covered = self.coverage(symbol, timeframe)
+        step = timeframe_ms(timeframe)
+
+        if covered is None:
+            missing = [(start, end)]
+        else:
+            missing = []
+            if start < covered[0]:
+                missing.append((start, covered[0] - step))
+            if end > covered[1]:
+                missing.append((covered[1] + step, end))
+
+        added = 0
+        new_start, new_end = covered if covered is not None else (None, None)
+
+        for missing_start, missing_end in missing:
+            if missing_start > missing_end:
+                continue
+
+            rows = np.asarray(fetcher.fetch(symbol, timeframe, missing_start, missing_end), dtype=np.float64).reshape(-1, len(COLUMNS))
+            added += self.__write(symbol, timeframe, rows)
+
+            if not len(rows):
+                logger.warning(f"No {symbol} {timeframe} candles came back for {missing_start}-{missing_end}, they will be asked for again")
+                continue
+
+            first, last = int(rows[:, 0].min()), int(rows[:, 0].max())
+
+            if first - missing_start >= step or missing_end - last >= step:
+                logger.warning(f"Fetch of {symbol} {timeframe} came back short, {first}-{last} of {missing_start}-{missing_end}, the rest will be asked for again")
+
+            #coverage only grows by what came back, and only where it joins what was fetched before
+            if new_start is None:
+                new_start, new_end = first, last
+            elif missing_end < new_start:
+                if last >= new_start - step:
+                    new_start = min(new_start, first)
+            elif first <= new_end + step:
+                new_end = max(new_end, last)
+
+        if new_start is not None and (covered is None or (new_start, new_end) != tuple(covered)):
+            self.__write_coverage(symbol, timeframe, new_start, new_end)
+
+        return added
+
+    def __write(self, symbol: str, timeframe: str, rows: np.ndarray) -> int:
+        data_path, _ = self.__paths(symbol, timeframe)
+
+        rows = np.asarray(rows, dtype=np.float64).reshape(-1, len(COLUMNS))
+        if not len(rows):
+            return 0
+
+        rows = rows[np.argsort(rows[:, 0], kind="stable")]
+        rows = rows[np.concatenate(([True], np.diff(rows[:, 0]) > 0))]
+
+        stored = self.read(symbol, timeframe)
+
+        if not len(stored):
+            rows.tofile(data_path)
+            return len(rows)
+
+        #candles already in the file are kept as they are
+        rows = rows[~np.isin(rows[:, 0], stored[:, 0])]
+        if not len(rows):
+            return 0
+
+        if rows[0, 0] > stored[-1, 0]:
+            with open(data_path, "ab") as file:
+                rows.tofile(file)
+        else:
+            #older history or a gap being filled, the only cases the file is rewritten
+            merged = np.concatenate((np.asarray(stored), rows))
+            merged = merged[np.argsort(merged[:, 0], kind="stable")]
+            temporary = f"{data_path}.tmp"
+            merged.tofile(temporary)
+            del stored
+            os.replace(temporary, data_path)
+
+        return len(rows)
+
+    def __write_coverage(self, symbol: str, timeframe: str, start: int, end: int):
+        _, meta_path = self.__paths(symbol, timeframe)
+        temporary = f"{meta_path}.tmp"
+        with open(temporary, "w") as file:
+            json.dump({"start": int(start), "end": int(end)}, file)
+        os.replace(temporary, meta_path)
+
+
+class CcxtFetcher:
+    """Pages through an exchange's OHLCV history with ccxt"""
+
+    def __init__(self, exchange: str = "kraken", page: int = 720):
+        import ccxt
+        self.exchange = getattr(ccxt, exchange)()
+        self.page = page
+
+    def fetch(self, symbol: str, timeframe: str, start: int, end: int) -> np.ndarray:
+        step = timeframe_ms(timeframe)
+        pages = []
+        cursor = start
+
+        while cursor <= end:
+            candles = self.exchange.fetch_ohlcv(symbol, timeframe, since=cursor, limit=self.page)
+            candles = [candle for candle in candles if cursor <= candle[0] <= end]
+            if not candles:
+                break
+
+            pages.append(np.asarray(candles, dtype=np.float64))
+            cursor = int(candles[-1][0]) + step
+
+        return np.concatenate(pages) if pages else np.empty((0, len(COLUMNS)))
+
+
+class FixtureFetcher:
+    """Candles without a network, from a csv with the COLUMNS header or a seeded synthetic series"""
+
+    def __init__(self, csv_path: str = None, seed: int = 42, start_price: float = 150.0):
+        self.csv_path = csv_path
+        self.seed = seed
+        self.start_price = start_price
+
+    def fetch(self, symbol: str, timeframe: str, start: int, end: int) -> np.ndarray:
+        if self.csv_path:
+            rows = pd.read_csv(self.csv_path)[COLUMNS].to_numpy(dtype=np.float64)
+            return rows[(rows[:, 0] >= start) & (rows[:, 0] <= end)]
+
+        step = timeframe_ms(timeframe)
+        timestamps = np.arange(start // step * step, end + 1, step, dtype=np.int64)
+
+        #every candle only depends on its own time, not on the range asked for, so split fetches agree
+        closes = np.array([self.__close(symbol, timestamp, step) for timestamp in timestamps])
+        opens = closes / (1 + np.array([self.__noise(symbol, timestamp, 1) for timestamp in timestamps]) * 0.002)
+        highs = np.maximum(opens, closes) * 1.002
+        lows = np.minimum(opens, closes) * 0.998
+        volumes = 1000 + 500 * np.abs(np.array([self.__noise(symbol, timestamp, 2) for timestamp in timestamps]))
+
+        return np.column_stack((timestamps.astype(np.float64), opens, highs, lows, closes, volumes))
+
+    def __noise(self, symbol: str, timestamp: int, stream: int) -> float:
+        return np.random.default_rng([self.seed, stream, timestamp, *symbol.encode()]).standard_normal()
+
+    def __close(self, symbol: str, timestamp: int, step: int) -> float:
+        #a slow sine trend plus hourly noise, deterministic for every timestamp
+        hours = timestamp / 3_600_000
+        return self.start_price * (1 + 0.2 * np.sin(hours / 240)) * (1 + 0.01 * self.__noise(symbol, timestamp, 0))
@@ -0,0 +1,261 @@
+import argparse
+import json
+import os
+import resource
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timezone
+import joblib
+import numpy as np
+import pandas as pd
+import talib
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
+from sklearn.model_selection import train_test_split
+from sklearn.preprocessing import StandardScaler
+from candle_store import CandleStore, CcxtFetcher, FixtureFetcher, last_closed, timeframe_ms
+
+
+"""Trains one model per symbol and horizon, in parallel across cores
+
+    python train_pipeline.py --symbols SOL/USDT ETH/USDT BTC/USDT --horizons 24 168 --workers 4
+
+Candles are brought up to date in the candle store first, by this process only. Every
+(symbol, horizon) pair is then a job on a process pool, and each worker's address space is capped
+at --memory-mb so one oversized job fails instead of taking the machine down. A worker that dies
+breaks the pool for every job still running on it, so those jobs run again in a pool each and
+only the one whose worker dies again is reported as failed. Each
+job writes its model, scaler and report under models/<version>/<symbol>/h<horizon>/, and the
+version gets a summary report with the timing of every job."""
+
+
+FEATURES = ['sma_50', 'rsi', 'macd', 'macd_signal', 'return_1h']
+
+MODELS_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "models")
+
+
+def build_features(df: pd.DataFrame) -> pd.DataFrame:
+    """Close and the model's features for every candle, NaN while the indicators warm up"""
+
+    df = df[['close']].copy()
+    df['sma_50'] = talib.SMA(df['close'], timeperiod=50)  # 50-period Simple Moving Average
+    df['rsi'] = talib.RSI(df['close'], timeperiod=14)     # Relative Strength Index
+    df['macd'], df['macd_signal'], _ = talib.MACD(df['close'])  # MACD
+    df['return_1h'] = df['close'].pct_change()           # 1-hour return
+    return df
+
+
+def build_dataset(df: pd.DataFrame, horizon: int) -> tuple[pd.DataFrame, pd.Series]:
+    """Features and future return over horizon candles, the same ones train_model.py uses"""
+
+    df = build_features(df).dropna()  # Remove rows with NaN values
+
+    df['future_return'] = df['close'].shift(-horizon) / df['close'] - 1
+    df = df.dropna()
+
+    return df[FEATURES], df['future_return']
+
+
+def fit_model(X_train: pd.DataFrame, y_train: pd.Series, n_estimators: int = 100, n_jobs: int = None):
+    """Scaler and Random Forest fit on the training split (Random Forest Regression seems the best for the task)"""
+
+    scaler = StandardScaler()
+    X_train_scaled = scaler.fit_transform(X_train)
+
+    model = RandomForestRegressor(n_estimators=n_estimators, random_state=42, n_jobs=n_jobs)
+    model.fit(X_train_scaled, y_train)
+
+    return model, scaler
+
+
+def evaluate(model, scaler, X_test: pd.DataFrame, y_test: pd.Series) -> dict:
+    predicted = model.predict(scaler.transform(X_test))
+
+    return {
+        "mae": float(mean_absolute_error(y_test, predicted)),
+        "rmse": float(np.sqrt(mean_squared_error(y_test, predicted))),
+        "r2": float(r2_score(y_test, predicted)),
+        #how often the model gets the sign of the move right, what the bots act on
+        "direction_accuracy": float(np.mean(np.sign(predicted) == np.sign(y_test.to_numpy()))),
+        "test_rows": int(len(y_test))
+    }
+
+
+def limit_worker(memory_mb: int):
+    """Process pool initializer, caps the worker's address space and keeps native libraries to one thread"""
+
+    if memory_mb > 0:
+        limit = memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+    #the pool already uses every core, a thread pool per worker would only oversubscribe them
+    from threadpoolctl import threadpool_limits
+    threadpool_limits(1)
+
+
+def train_job(store_root: str, exchange: str, symbol: str, timeframe: str, start: int, end: int, horizon: int, n_estimators: int, output: str) -> dict:
+    """Trains and saves one model, returns its report"""
+
+    report = {"symbol": symbol, "timeframe": timeframe, "horizon": horizon, "pid": os.getpid()}
+    started = time.perf_counter()
+
+    try:
+        df = CandleStore(store_root, exchange).frame(symbol, timeframe, start, end)
+        X, y = build_dataset(df, horizon)
+        report["rows"] = int(len(X))
+        report["features_s"] = round(time.perf_counter() - started, 3)
+
+        if len(X) < 100:
+            raise ValueError(f"only {len(X)} rows after features and a {horizon} candle horizon")
+
+        X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, shuffle=False)
+
+        fit_started = time.perf_counter()
+        model, scaler = fit_model(X_train, y_train, n_estimators=n_estimators, n_jobs=1)
+        report["fit_s"] = round(time.perf_counter() - fit_started, 3)
+
+        report["metrics"] = evaluate(model, scaler, X_test, y_test)
+
+        directory = os.path.join(output, symbol.replace("/", "_"), f"h{horizon}")
+        os.makedirs(directory, exist_ok=True)
+        joblib.dump(model, os.path.join(directory, "model.pkl"))
+        joblib.dump(scaler, os.path.join(directory, "scaler.pkl"))
+
+        report["status"] = "trained"
+        report["artifacts"] = directory
+
+    except MemoryError:
+        report["status"] = "failed"
+        report["error"] = "worker memory limit reached, raise --memory-mb"
+
+    except Exception as e:
+        report["status"] = "failed"
+        report["error"] = str(e)
+
+    report["total_s"] = round(time.perf_counter() - started, 3)
+    report["peak_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+    if report["status"] == "trained":
+        with open(os.path.join(report["artifacts"], "report.json"), "w") as file:
+            json.dump(report, file, indent=2)
+
+    return report
+
+
+def isolated_job(memory_mb: int, *job_args) -> dict:
+    """train_job in a single worker pool of its own, a BrokenProcessPool can only mean this job's worker died"""
+
+    with ProcessPoolExecutor(max_workers=1, initializer=limit_worker, initargs=(memory_mb,)) as pool:
+        return pool.submit(train_job, *job_args).result()
+
+
+def failed_report(symbol: str, horizon: int, timeframe: str, error: str) -> dict:
+    return {"symbol": symbol, "timeframe": timeframe, "horizon": horizon, "status": "failed", "total_s": 0.0, "error": error}
+
+
+def print_report(report: dict):
+    if report["status"] == "trained":
+        metrics = report["metrics"]
+        print(f"{report['symbol']} h{report['horizon']}: trained in {report['total_s']}s, mae {metrics['mae']:.4f}, direction {metrics['direction_accuracy']:.1%}")
+    else:
+        print(f"{report['symbol']} h{report['horizon']}: failed, {report['error']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Trains a model per symbol and horizon on a process pool")
+    parser.add_argument("--symbols", nargs="+", default=["SOL/USDT"])
+    parser.add_argument("--horizons", nargs="+", type=int, default=[7 * 24], help="candles ahead the model predicts the return of")
+    parser.add_argument("--timeframe", default="1h")
+    parser.add_argument("--limit", type=int, default=1000)
+    parser.add_argument("--exchange", default="kraken")
+    parser.add_argument("--offline", action="store_true", help="use the fixture candles instead of the exchange")
+    parser.add_argument("--fixture", help="csv of candles for --offline, synthetic candles without one")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--memory-mb", type=int, default=2048, help="address space cap per worker, 0 for none")
+    parser.add_argument("--n-estimators", type=int, default=100)
+    parser.add_argument("--version", default=datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ"))
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    exchange = "fixture" if args.offline else args.exchange
+    store = CandleStore(exchange=exchange)
+    fetcher = FixtureFetcher(args.fixture) if args.offline else CcxtFetcher(args.exchange)
+
+    end = last_closed(args.timeframe)
+    start = end - (args.limit - 1) * timeframe_ms(args.timeframe)
+
+    # 1) Bring every symbol up to date, only this process writes to the store
+    for symbol in args.symbols:
+        added = store.ensure(symbol, args.timeframe, start, end, fetcher)
+        print(f"{symbol}: {added} new candles")
+    download_s = time.perf_counter() - started
+
+    output = os.path.join(MODELS_DIRECTORY, args.version)
+    os.makedirs(output, exist_ok=True)
+
+    # 2) Train every symbol and horizon in parallel
+    jobs = [(symbol, horizon) for symbol in args.symbols for horizon in args.horizons]
+    workers = min(args.workers, len(jobs))
+    job_args = lambda symbol, horizon: (store.root, exchange, symbol, args.timeframe, start, end, horizon, args.n_estimators, output)
+    reports = []
+    broken = []
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=limit_worker, initargs=(args.memory_mb,)) as pool:
+        futures = {pool.submit(train_job, *job_args(symbol, horizon)): (symbol, horizon) for symbol, horizon in jobs}
+
+        for future in as_completed(futures):
+            try:
+                report = future.result()
+            except BrokenProcessPool:
+                #a dead worker breaks the whole pool and fails every unfinished job, not only its own
+                broken.append(futures[future])
+                continue
+            except Exception as e:
+                report = failed_report(*futures[future], args.timeframe, f"{type(e).__name__}: {e}")
+
+            reports.append(report)
+            print_report(report)
+
+    # 3) Jobs caught in a broken pool run again in a pool of their own, so a worker that dies now only fails its own job
+    if broken:
+        print(f"A worker died, retrying {len(broken)} unfinished jobs one pool each")
+
+        with ThreadPoolExecutor(max_workers=workers) as isolated:
+            futures = {isolated.submit(isolated_job, args.memory_mb, *job_args(symbol, horizon)): (symbol, horizon) for symbol, horizon in broken}
+
+            for future in as_completed(futures):
+                try:
+                    report = future.result()
+                except BrokenProcessPool:
+                    #native code that runs out of address space kills the worker instead of raising MemoryError
+                    report = failed_report(*futures[future], args.timeframe, "worker died, likely the --memory-mb limit")
+                except Exception as e:
+                    report = failed_report(*futures[future], args.timeframe, f"{type(e).__name__}: {e}")
+
+                reports.append(report)
+                print_report(report)
+
+    # 4) Summary of the version, the sum of job times against the wall time shows what the pool saved
+    summary = {
+        "version": args.version,
+        "timeframe": args.timeframe,
+        "candles": args.limit,
+        "workers": workers,
+        "memory_mb": args.memory_mb,
+        "download_s": round(download_s, 3),
+        "jobs_s": round(sum(report["total_s"] for report in reports), 3),
+        "wall_s": round(time.perf_counter() - started, 3),
+        "trained": sum(report["status"] == "trained" for report in reports),
+        "failed": sum(report["status"] != "trained" for report in reports),
+        "jobs": sorted(reports, key=lambda report: (report["symbol"], report["horizon"]))
+    }
+
+    with open(os.path.join(output, "report.json"), "w") as file:
+        json.dump(summary, file, indent=2)
+
+    print(f"Version {args.version}: {summary['trained']} trained, {summary['failed']} failed, {summary['jobs_s']}s of training in {summary['wall_s']}s, report in {output}")
+
+
+if __name__ == "__main__":
+    main()